@@ -1,12 +1,12 @@
 import lcd_bus
 from micropython import const
 import machine
-from time import sleep
 import st7796
 import lvgl as lv
 import utime as time
-from fs_driver import fs_register
 from machine import Pin, I2C
+import frame_loop
+import images
 
 # display settings for Waveshare ESP32-S3-Touch-LCD-3.5
 # Resolution
@@ -103,15 +103,10 @@ scrn = lv.screen_active()
 scrn.set_style_bg_color(lv.color_hex(0x003366), 0)
 print("Screen created with dark blue background")
 
-# Register filesystem driver
-print("Registering filesystem...")
-fs_drv = lv.fs_drv_t()
-fs_register(fs_drv, "S")
-
 # Create image object
 print("Creating cat image...")
 cat_img = lv.image(scrn)
-cat_img.set_src("S:cat_small.png")
+cat_img.set_src(images.load('cat_small'))
 # Position at center of screen (480x320 display, 224x224 image)
 start_x = (480 - 224) // 2
 start_y = (320 - 224) // 2
@@ -129,6 +124,9 @@ cat_speed_x = 5
 cat_speed_y = 4
 frame_count = 0
 
+# Renders only when the cat moved, at most 20 times a second
+loop = frame_loop.FrameLoop(fps=20, report_s=10)
+
 print("Entering main loop...")
 while True:
     # Animate cat position
@@ -145,7 +143,4 @@ while True:
     
     cat_img.set_pos(int(cat_x), int(cat_y))
     
-    # Force redraw
-    lv.task_handler()
-    lv.refr_now(None)
-    sleep(0.05)  # 20 FPS for stability
+    loop.step()
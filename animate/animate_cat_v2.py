@@ -1,75 +1,22 @@
-import lcd_bus
-import machine
-from time import sleep
-import st7796
 import lvgl as lv
-from fs_driver import fs_register
 from machine import Pin, I2C
-
-# display settings for Waveshare ESP32-S3-Touch-LCD-3.5
-_WIDTH = 320
-_HEIGHT = 480
-_MOSI = 1 
-_MISO = 2
-_SCK = 5
-_HOST = 1
-_DC = 3
-_LCD_CS = 0
-_BL = 6
-_LCD_FREQ = 20000000
-_OFFSET_X = 0
-_OFFSET_Y = 0
-_I2C_SDA = 8
-_I2C_SCL = 7
+import board
+import frame_loop
+import images
 
 print("Initializing I2C for TCA9554...")
-i2c = I2C(0, scl=Pin(_I2C_SCL), sda=Pin(_I2C_SDA), freq=400000)
+i2c = I2C(0, scl=Pin(board.I2C_SCL), sda=Pin(board.I2C_SDA), freq=400000)
 print("I2C devices found:", [hex(addr) for addr in i2c.scan()])
 
-print("Initializing SPI bus...")
-spi_bus = machine.SPI.Bus(host=_HOST, mosi=_MOSI, miso=_MISO, sck=_SCK)
-
-print("Initializing display bus...")
-display_bus = lcd_bus.SPIBus(spi_bus=spi_bus, freq=_LCD_FREQ, dc=_DC, cs=_LCD_CS)
-
-# buf1 = display_bus.allocate_framebuffer(46080, lcd_bus.MEMORY_INTERNAL | lcd_bus.MEMORY_DMA)
-# buf2 = display_bus.allocate_framebuffer(46080, lcd_bus.MEMORY_INTERNAL | lcd_bus.MEMORY_DMA)
-
-
-buf1 = display_bus.allocate_framebuffer(100*320*2, lcd_bus.MEMORY_SPIRAM)
-buf2 = display_bus.allocate_framebuffer(100*320*2, lcd_bus.MEMORY_SPIRAM)
-
-print("Initializing ST7796 display...")
-display = st7796.ST7796(
-    data_bus=display_bus,
-    display_width=_WIDTH,
-    display_height=_HEIGHT,
-    frame_buffer1=buf1,
-    frame_buffer2=buf2,
-    backlight_pin=_BL,
-    reset_pin=None,
-    backlight_on_state=st7796.STATE_HIGH,
-    color_space=lv.COLOR_FORMAT.RGB565,
-    color_byte_order=st7796.BYTE_ORDER_BGR,
-    rgb565_byte_swap=True,
-    offset_x=_OFFSET_X,
-    offset_y=_OFFSET_Y,
-)
-
-display.init()
-display.set_rotation(lv.DISPLAY_ROTATION._90)
-display.set_color_inversion(True)
-display.set_backlight(100)
+# Display only: the frame loop below drives LVGL itself.
+# board.start('dma') puts the frame buffers in internal DMA memory instead of SPIRAM.
+hw = board.start(touch=False, timer=False)
+display = hw.display
 
 # Create screen
 scrn = lv.screen_active()
 scrn.set_style_bg_color(lv.color_hex(0x003366), 0)
 
-# Register filesystem
-print("Registering filesystem...")
-fs_drv = lv.fs_drv_t()
-fs_register(fs_drv, "S")
-
 # Create title
 title = lv.label(scrn)
 title.set_text("Animated Cat with lv.animimg")
@@ -85,7 +32,7 @@ print("Creating animated image object...")
 # Create image descriptor array for animimg
 # We'll use the same cat image but you can add more frames
 img_dsc = [
-    "S:cat_small.png",
+    images.load('cat_small'),
 ]
 
 # Create animimg widget
@@ -110,9 +57,8 @@ cat_dir_y = 1
 cat_speed_x = 1
 cat_speed_y = 1
 
-# Initial refresh
-lv.task_handler()
-lv.refr_now(None)
+# Renders only when the cat moved, at most 30 times a second
+loop = frame_loop.FrameLoop(fps=30, report_s=10)
 
 print("Entering main loop...")
 while True:
@@ -130,6 +76,4 @@ while True:
     
     animimg.set_pos(int(cat_x), int(cat_y))
     
-    lv.task_handler()
-    lv.refr_now(None)
-    # sleep(0.03)  # ~33 FPS
+    loop.step()
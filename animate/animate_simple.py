@@ -1,10 +1,10 @@
 import lcd_bus
 from micropython import const
 import machine
-from time import sleep
 import st7796
 import lvgl as lv
 from machine import Pin, I2C
+import frame_loop
 
 # display settings for Waveshare ESP32-S3-Touch-LCD-3.5
 _WIDTH = 320
@@ -104,6 +104,9 @@ triangle_dir_x = 1
 triangle_dir_y = 1
 triangle_speed = 2
 
+# Renders only what moved, at most 50 times a second
+loop = frame_loop.FrameLoop(fps=50, report_s=10)
+
 print("Entering main loop...")
 while True:
     # Animate circle horizontally
@@ -128,6 +131,4 @@ while True:
     triangle.set_x(int(triangle_x))
     triangle.set_y(int(triangle_y))
     
-    lv.refr_now(lv.screen_active().get_display())
-    lv.task_handler()
-    sleep(0.02)  # 50 FPS
+    loop.step()
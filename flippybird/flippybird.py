@@ -1,35 +1,7 @@
-import lcd_bus
-import machine
 from time import sleep
-import st7796
 import lvgl as lv
 import random
-import i2c
-import ft6x36
-import pointer_framework
-import task_handler
-from fs_driver import fs_register
-
-# Display settings for Waveshare ESP32-S3-Touch-LCD-3.5
-_WIDTH = 320
-_HEIGHT = 480
-_MOSI = 1 
-_MISO = 2
-_SCK = 5
-_HOST = 1
-_DC = 3
-_LCD_CS = 0
-_BL = 6
-_LCD_FREQ = 20000000
-_OFFSET_X = 0
-_OFFSET_Y = 0
-_I2C_SDA = 8
-_I2C_SCL = 7
-
-# Touch settings
-_TOUCH_I2C_ADDR = 0x38
-_TOUCH_INT = 4
-_TOUCH_RST = None
+import board
 
 # Game constants (display is rotated to 480x320)
 SCREEN_WIDTH = 480
@@ -41,50 +13,9 @@ GRAVITY = 0.7
 JUMP_STRENGTH = -4
 PIPE_SPEED = 3
 
-print("Initializing SPI bus...")
-spi_bus = machine.SPI.Bus(host=_HOST, mosi=_MOSI, miso=_MISO, sck=_SCK)
-
-print("Initializing display bus...")
-display_bus = lcd_bus.SPIBus(spi_bus=spi_bus, freq=_LCD_FREQ, dc=_DC, cs=_LCD_CS)
-
-buf1 = display_bus.allocate_framebuffer(100*320*2, lcd_bus.MEMORY_SPIRAM)
-buf2 = display_bus.allocate_framebuffer(100*320*2, lcd_bus.MEMORY_SPIRAM)
-
-print("Initializing ST7796 display...")
-display = st7796.ST7796(
-    data_bus=display_bus,
-    display_width=_WIDTH,
-    display_height=_HEIGHT,
-    backlight_pin=_BL,
-    reset_pin=None,
-    backlight_on_state=st7796.STATE_HIGH,
-    color_space=lv.COLOR_FORMAT.RGB565,
-    color_byte_order=st7796.BYTE_ORDER_BGR,
-    rgb565_byte_swap=True,
-    offset_x=_OFFSET_X,
-    offset_y=_OFFSET_Y,
-    frame_buffer1=buf1,
-    frame_buffer2=buf2,
-)
-
-display.init()
-
-# Initialize touch BEFORE setting rotation
-print("Initializing FT6336 touch...")
-i2c_bus = i2c.I2C.Bus(host=0, scl=_I2C_SCL, sda=_I2C_SDA, freq=400000, use_locks=False)
-touch_dev = i2c.I2C.Device(bus=i2c_bus, dev_id=_TOUCH_I2C_ADDR, reg_bits=ft6x36.BITS)
-indev = ft6x36.FT6x36(touch_dev, startup_rotation=pointer_framework.lv.DISPLAY_ROTATION._90)
-print("Touch driver initialized")
-
-# Set rotation AFTER touch initialization
-display.set_rotation(lv.DISPLAY_ROTATION._90)
-display.set_color_inversion(True)
-display.set_backlight(100)
-
-print("Display ready")
-
-# Initialize task handler for LVGL
-th = task_handler.TaskHandler()
+# Display, touch and LVGL task handler, or the ones semiblockFirmwareV2 hands over
+hw = board.start(fs=True)
+display, indev, th = hw.display, hw.indev, hw.task_handler
 
 # Create screen
 scrn = lv.screen_active()
@@ -122,11 +53,6 @@ msg_label.align(lv.ALIGN.CENTER, 0, 120)
 msg_label.set_style_text_color(lv.color_hex(0xFFFFFF), 0)
 msg_label.set_style_text_font(lv.font_montserrat_16, 0)
 
-# Register filesystem driver
-print("Registering filesystem...")
-fs_drv = lv.fs_drv_t()
-fs_register(fs_drv, "S")
-
 # Create start image
 # start_img = lv.image(scrn)
 # start_img.set_src("S:semiblockGames100.jpg")
@@ -0,0 +1,242 @@
+"""Compiled user app cache.
+
+Downloaded apps live in APP_DIR as app_<digest>.mpy (compiled on the host)
+or app_<digest>.py, where digest is the asset_cache digest of the source.
+They are started with import instead of read() + exec(): the module is
+compiled straight from flash (or not compiled at all for .mpy), so the
+source text never sits in RAM next to the code object.
+
+An app that came with a .mpy keeps its source as app_<digest>.src, a name
+import does not look at. If this firmware cannot load the .mpy (compiled
+by an mpy-cross of another MicroPython version), launch() runs the source
+instead.
+
+PENDING holds the digest and file size of the app to run on the next boot.
+The boot check only compares that size with stat(), it never re-hashes the
+app. PENDING is removed when the app starts, so the boot after that shows
+the firmware UI again.
+"""
+import gc
+import sys
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    from time import monotonic
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+import asset_cache
+import heap
+
+APP_DIR = 'apps'
+PENDING = 'user_app.id'
+LEGACY = 'user_app.py'
+
+# How many compiled apps to keep around for quick re-installs
+KEEP = 3
+
+# Seconds between heap reports (heap.watch()) while an app runs, 0 for none
+HEAP_REPORT_S = 10
+
+# Filled in by launch(): import start, first frame and heap numbers
+stats = {}
+
+
+def module_name(digest):
+    return 'app_' + digest
+
+
+def _path(digest, ext):
+    return '%s/%s%s' % (APP_DIR, module_name(digest), ext)
+
+
+def _exists(path):
+    return asset_cache.file_size(path) >= 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _mkdir():
+    try:
+        os.mkdir(APP_DIR)
+    except OSError:
+        pass
+
+
+def _keep_source(src_path, src):
+    if _exists(src):
+        _remove(src_path)
+    elif _exists(src_path):
+        os.rename(src_path, src)
+
+
+def install(src_path, mpy_path=None, digest=None):
+    """Move a downloaded app into the cache and mark it to run next boot.
+
+    src_path is the source, mpy_path its compiled form if the server sent one.
+    Pass digest if the source was already hashed. Returns the digest.
+    Re-installing an app that is already cached only writes the PENDING marker.
+    """
+    _mkdir()
+    digest = digest or asset_cache.file_digest(src_path)
+    mpy = _path(digest, '.mpy')
+    py = _path(digest, '.py')
+    if mpy_path:
+        if _exists(mpy):
+            _remove(mpy_path)
+        else:
+            os.rename(mpy_path, mpy)
+        # import looks for .py first, so never keep both
+        _remove(py)
+        _keep_source(src_path, _path(digest, '.src'))
+    elif _exists(mpy):
+        _keep_source(src_path, _path(digest, '.src'))
+    elif _exists(py):
+        _remove(src_path)
+    else:
+        os.rename(src_path, py)
+    set_pending(digest)
+    _prune(digest)
+    print(f"App {digest} cached ({'mpy' if _exists(mpy) else 'py'})")
+    return digest
+
+
+def cached(digest):
+    """Path of the cached app for digest (.mpy or .py), or None"""
+    for ext in ('.mpy', '.py'):
+        path = _path(digest, ext)
+        if _exists(path):
+            return path
+    return None
+
+
+def set_pending(digest):
+    """Run the cached app on the next boot. The marker is replaced atomically."""
+    path = cached(digest)
+    if path is None:
+        raise OSError('app %s is not cached' % digest)
+    tmp = PENDING + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write('%s %d' % (digest, asset_cache.file_size(path)))
+    _remove(PENDING)
+    os.rename(tmp, PENDING)
+
+
+def _prune(keep_digest):
+    apps = []
+    for name in os.listdir(APP_DIR):
+        if name.startswith('app_'):
+            path = '%s/%s' % (APP_DIR, name)
+            apps.append((os.stat(path)[8], path, name))
+    apps.sort(reverse=True)
+    kept = {keep_digest}
+    for _, path, name in apps:
+        digest = name[4:].split('.', 1)[0]
+        if digest not in kept and len(kept) < KEEP:
+            kept.add(digest)
+        if digest not in kept:
+            _remove(path)
+
+
+def pending():
+    """Digest of the app to run this boot, or None.
+
+    A bare user_app.py (e.g. copied with mpremote) is moved into the cache first.
+    """
+    if _exists(LEGACY):
+        install(LEGACY)
+    try:
+        with open(PENDING) as f:
+            marker = f.read().split()
+    except OSError:
+        return None
+    digest = marker[0] if marker else ''
+    size = int(marker[1]) if len(marker) > 1 else -1
+    path = cached(digest) if digest else None
+    if path and (size < 0 or asset_cache.file_size(path) == size):
+        return digest
+    print(f"App {digest} missing from cache or damaged")
+    _remove(PENDING)
+    return None
+
+
+def _first_frame(timer):
+    timer.delete()
+    stats['first_frame_ms'] = ticks_diff(ticks_ms(), stats['start'])
+    stats['free_at_first_frame'] = gc.mem_free()
+    print(f"App first frame after {stats['first_frame_ms']} ms, "
+          f"heap free {stats['free_at_first_frame']} (was {stats['free_before']})")
+    heap.report('first_frame')
+
+
+def _import(digest):
+    """Import the cached app, from its source if this firmware cannot load the .mpy"""
+    try:
+        __import__(module_name(digest))
+    except ValueError as e:
+        src = _path(digest, '.src')
+        if '.mpy' not in str(e) or not _exists(src):
+            raise
+        print(f"App {digest}: {e}, running its source instead")
+        _remove(_path(digest, '.mpy'))
+        os.rename(src, _path(digest, '.py'))
+        __import__(module_name(digest))
+
+
+def launch(digest, start=None, namespace=None):
+    """Import the cached app. Only returns if the app itself returns.
+
+    start is the ticks_ms() the launch was asked for, if that was earlier
+    (launcher.run() tears the firmware UI down first); the first frame is
+    timed from there.
+
+    The firmware's helper modules are unloaded first (heap.reclaim()). With
+    namespace, the caller's globals() are dropped as well and launch() never
+    returns, since the caller has nothing left to return to.
+    """
+    _remove(PENDING)
+    stats['reclaimed'] = heap.reclaim(namespace)
+    stats['free_before'] = gc.mem_free()
+    stats['start'] = ticks_ms() if start is None else start
+    stats['boot_ms'] = ticks_ms()  # ticks_ms() counts from reset on the ESP32
+    print(f"Launching app {digest} at {stats['boot_ms']} ms after boot, heap free {stats['free_before']} "
+          f"({stats['reclaimed']} bytes reclaimed)")
+    heap.report('launch')
+    try:
+        # One-shot LVGL timer: runs on the app's first task_handler(), right after its first frame
+        import lvgl as lv
+        lv.timer_create(_first_frame, 0, None)
+    except Exception:
+        pass
+    heap.watch(HEAP_REPORT_S)
+    if APP_DIR not in sys.path:
+        sys.path.append(APP_DIR)
+    # The app runs in its own module dict, never in the firmware's globals
+    if namespace is None:
+        _import(digest)
+        return
+    try:
+        _import(digest)
+    except Exception as e:
+        # The caller's globals are gone, so it cannot fall back to its UI: reboot into it
+        print(f"App {digest} raised {repr(e)}, restarting")
+        import machine
+        machine.reset()
+    import time
+    while True:
+        time.sleep(1)
@@ -0,0 +1,98 @@
+import json
+
+try:
+    import uhashlib as hashlib
+except ImportError:
+    import hashlib
+
+try:
+    import ubinascii as binascii
+except ImportError:
+    import binascii
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+# name -> [digest, size] for every image file on flash
+MANIFEST = 'assets.json'
+
+# Hex digits of sha256 kept per asset. 16 (64 bits) keeps the request URL short.
+DIGEST_LEN = 16
+
+
+def new_hasher():
+    return hashlib.sha256()
+
+
+def hexdigest(hasher):
+    return binascii.hexlify(hasher.digest()).decode()[:DIGEST_LEN]
+
+
+def file_digest(path, chunk=1024):
+    h = new_hasher()
+    buf = bytearray(chunk)
+    mv = memoryview(buf)
+    with open(path, 'rb') as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(mv[:n])
+    return hexdigest(h)
+
+
+def file_size(path):
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return -1
+
+
+def load(path=MANIFEST):
+    """Read the manifest, dropping entries whose file is gone or has the wrong size.
+
+    Only stat() is used here, so checking the cache costs nothing per byte.
+    """
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    for name in list(manifest):
+        entry = manifest[name]
+        if file_size('%s.png' % name) != entry[1]:
+            print(f"Asset cache: {name}.png missing or changed, will re-fetch")
+            del manifest[name]
+    return manifest
+
+
+def save(manifest, path=MANIFEST):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    os.rename(tmp, path)
+
+
+_SAFE = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_.'
+
+
+def _quote(s):
+    out = ''
+    for c in s:
+        if c in _SAFE:
+            out += c
+        else:
+            for b in c.encode():
+                out += '%%%02X' % b
+    return out
+
+
+def have_param(manifest):
+    """Digests we already hold, as sent to getProject: name:digest,name:digest"""
+    return ','.join('%s:%s' % (_quote(name), manifest[name][0]) for name in manifest)
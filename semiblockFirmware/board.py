@@ -0,0 +1,282 @@
+"""Display, touch and LVGL bring-up for the Waveshare ESP32-S3-Touch-LCD-3.5.
+
+Every app used to carry its own copy of the SPI bus / lcd_bus / ST7796 /
+FT6x36 setup. Instead:
+
+    import board
+    hw = board.start()                  # the DEFAULT profile
+    hw = board.start('dma')             # or another frame buffer strategy
+    hw = board.start('spiram', lines=60)  # or a profile with changes
+    display, indev, th = hw.display, hw.indev, hw.task_handler
+
+start() returns a handoff.Hardware. Under the firmware's in-process
+launcher it returns the hardware the firmware handed over, which already
+has its frame buffers, so only the rotation is applied then.
+
+A profile is a dict:
+
+- lines: height of one frame buffer in display lines (320 pixels of 2 bytes
+  each), 0 to let the driver allocate its own (a tenth of the screen,
+  internal DMA memory first)
+- memory: 'spiram' or 'dma' (internal, DMA capable: the SPI driver sends
+  straight from it instead of copying out of PSRAM, but the S3 only has
+  room for small buffers next to WiFi). A 'dma' buffer that does not fit
+  falls back to SPIRAM.
+- buffers: 1, or 2 to let LVGL render into one while the other is flushed
+- render_mode: 'partial', or 'full' / 'direct', which need full-screen
+  (HEIGHT lines) buffers
+
+The display bus runs at the SPI clock bus_tune.py found for this board
+(bus_freq()), LCD_FREQ if it was never tuned.
+
+stats has the ms each step took, the SPI clock and the buffers that were
+allocated. If profiler.py is on the board, each step is also a span on its
+timeline (spi_bus, display_bus, display, display.init, touch,
+indev.calibrate, fs_register).
+"""
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    from time import monotonic
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+import json
+
+import lvgl as lv
+
+import handoff
+
+try:
+    from profiler import begin as _begin, end as _end
+except ImportError:
+    # apps copy only board.py to the board
+    def _begin(name):
+        pass
+
+    def _end():
+        pass
+
+# Display settings for Waveshare ESP32-S3-Touch-LCD-3.5
+WIDTH = 320
+HEIGHT = 480
+MOSI = 1
+MISO = 2
+SCK = 5
+HOST = 1
+DC = 3
+LCD_CS = 0
+BL = 6
+LCD_FREQ = 20000000  # until bus_tune.py has found the board's fastest
+OFFSET_X = 0
+OFFSET_Y = 0
+I2C_SDA = 8
+I2C_SCL = 7
+
+# Touch settings
+TOUCH_I2C_ADDR = 0x38
+
+PROFILES = {
+    # What the apps always used: two 100-line buffers in SPIRAM
+    'spiram': {'lines': 100, 'memory': 'spiram', 'buffers': 2, 'render_mode': 'partial'},
+    # Two 46080-byte buffers in internal DMA memory (the commented-out ones in animate_cat_v2)
+    'dma': {'lines': 72, 'memory': 'dma', 'buffers': 2, 'render_mode': 'partial'},
+    # One internal buffer: leaves more RAM to the app, flushes block rendering
+    'dma_single': {'lines': 72, 'memory': 'dma', 'buffers': 1, 'render_mode': 'partial'},
+    # Whole screen redrawn into one SPIRAM buffer every frame
+    'full': {'lines': HEIGHT, 'memory': 'spiram', 'buffers': 1, 'render_mode': 'full'},
+    # Two full-screen SPIRAM buffers, LVGL only redraws what changed
+    'direct': {'lines': HEIGHT, 'memory': 'spiram', 'buffers': 2, 'render_mode': 'direct'},
+    # Whatever st7796 allocates by itself
+    'driver': {'lines': 0, 'memory': 'dma', 'buffers': 1, 'render_mode': 'partial'},
+}
+DEFAULT = 'spiram'
+
+# Highest SPI clock bus_tune.py found stable on this board
+BUS_FILE = 'bus_profile.json'
+
+# Filled in by start(): ms per step, SPI clock, buffer sizes and memory
+stats = {}
+
+
+def _board_id():
+    import binascii
+    import machine
+    return binascii.hexlify(machine.unique_id()).decode()
+
+
+def bus_freq():
+    """The SPI clock saved by bus_tune.py for this board, or LCD_FREQ"""
+    try:
+        with open(BUS_FILE) as f:
+            saved = json.load(f)
+        if saved['board'] == _board_id():
+            return saved['lcd_freq']
+    except (OSError, ValueError, KeyError):
+        pass
+    return LCD_FREQ
+
+
+def save_bus_freq(freq, results=None):
+    """Keep freq as this board's SPI clock. results: bus_tune's [[freq, errors], ...]"""
+    with open(BUS_FILE, 'w') as f:
+        json.dump({'board': _board_id(), 'lcd_freq': freq, 'results': results or []}, f)
+
+
+def profile(name=None, **changes):
+    """A copy of PROFILES[name] (DEFAULT if None) with changes applied. Checks it."""
+    p = dict(PROFILES[name or DEFAULT])
+    for key in changes:
+        if key not in p:
+            raise ValueError('unknown profile setting %s' % key)
+        p[key] = changes[key]
+    if p['memory'] not in ('spiram', 'dma'):
+        raise ValueError('memory is spiram or dma, not %s' % p['memory'])
+    if p['buffers'] not in (1, 2):
+        raise ValueError('buffers is 1 or 2')
+    if p['render_mode'] not in ('partial', 'full', 'direct'):
+        raise ValueError('render_mode is partial, full or direct, not %s' % p['render_mode'])
+    if p['render_mode'] != 'partial' and p['lines'] != HEIGHT:
+        raise ValueError('%s render mode needs %d-line buffers' % (p['render_mode'], HEIGHT))
+    return p
+
+
+def buffer_size(p):
+    return p['lines'] * WIDTH * 2
+
+
+def _step(name, start):
+    stats[name + '_ms'] = ticks_diff(ticks_ms(), start)
+    return ticks_ms()
+
+
+def _allocate(display_bus, p):
+    """The profile's frame buffers as a tuple of 2 (the second may be None)"""
+    import lcd_bus
+    if not p['lines']:
+        return None, None
+    size = buffer_size(p)
+    memory = p['memory']
+    bufs = []
+    for _ in range(p['buffers']):
+        buf = None
+        if memory == 'dma':
+            try:
+                buf = display_bus.allocate_framebuffer(size, lcd_bus.MEMORY_INTERNAL | lcd_bus.MEMORY_DMA)
+            except MemoryError:
+                buf = None
+            if buf is None:
+                print(f"No internal DMA memory for a {size} byte frame buffer, using SPIRAM")
+                memory = 'spiram'
+        if buf is None:
+            buf = display_bus.allocate_framebuffer(size, lcd_bus.MEMORY_SPIRAM)
+        bufs.append(buf)
+    stats['buffer_size'] = size
+    stats['memory'] = memory
+    return bufs[0], bufs[1] if len(bufs) > 1 else None
+
+
+def start(p=None, rotation=lv.DISPLAY_ROTATION._90, touch_rotation=None, touch=True, timer=True, fs=False,
+          bus_options=None, **changes):
+    """Bring up display, touch and LVGL, or take over what the firmware already did.
+
+    p is a profile name or dict, changes override its settings. touch_rotation
+    is the FT6x36 startup rotation, rotation if None. timer starts a
+    task_handler.TaskHandler (the firmware drives LVGL from asyncio instead).
+    fs registers the "S:" filesystem driver. bus_options are extra
+    lcd_bus.SPIBus() arguments.
+    """
+    hw = handoff.get()
+    if hw is not None:
+        hw.display.set_rotation(rotation)
+        return hw
+    if isinstance(p, dict):
+        p, changes = None, dict(p, **changes)
+    p = profile(p, **changes)
+    stats.clear()
+    stats['profile'] = p
+    import machine
+    import lcd_bus
+    import st7796
+
+    t = ticks_ms()
+    print("Initializing SPI bus...")
+    _begin('spi_bus')
+    spi_bus = machine.SPI.Bus(host=HOST, mosi=MOSI, miso=MISO, sck=SCK)
+    _end()
+    print("Initializing display bus...")
+    _begin('display_bus')
+    stats['lcd_freq'] = bus_freq()
+    display_bus = lcd_bus.SPIBus(spi_bus=spi_bus, freq=stats['lcd_freq'], dc=DC, cs=LCD_CS, **(bus_options or {}))
+    buf1, buf2 = _allocate(display_bus, p)
+    _end()
+    t = _step('bus', t)
+
+    print("Initializing ST7796 display...")
+    _begin('display')
+    display = st7796.ST7796(
+        data_bus=display_bus,
+        display_width=WIDTH,
+        display_height=HEIGHT,
+        backlight_pin=BL,
+        reset_pin=None,
+        backlight_on_state=st7796.STATE_HIGH,
+        color_space=lv.COLOR_FORMAT.RGB565,
+        color_byte_order=st7796.BYTE_ORDER_BGR,
+        rgb565_byte_swap=True,
+        offset_x=OFFSET_X,
+        offset_y=OFFSET_Y,
+        frame_buffer1=buf1,
+        frame_buffer2=buf2,
+    )
+    _begin('display.init')
+    display.init()
+    _end()
+    if p['render_mode'] != 'partial':
+        mode = lv.DISPLAY_RENDER_MODE.FULL if p['render_mode'] == 'full' else lv.DISPLAY_RENDER_MODE.DIRECT
+        lv.display_get_default().set_render_mode(mode)
+    _end()
+    t = _step('display', t)
+
+    i2c_bus = touch_dev = indev = None
+    if touch:
+        # Initialize touch BEFORE setting rotation
+        import i2c
+        import ft6x36
+        print("Initializing FT6336 touch...")
+        _begin('touch')
+        i2c_bus = i2c.I2C.Bus(host=0, scl=I2C_SCL, sda=I2C_SDA, freq=400000, use_locks=False)
+        touch_dev = i2c.I2C.Device(bus=i2c_bus, dev_id=TOUCH_I2C_ADDR, reg_bits=ft6x36.BITS)
+        indev = ft6x36.FT6x36(touch_dev, startup_rotation=rotation if touch_rotation is None else touch_rotation)
+        _end()
+        t = _step('touch', t)
+
+    # Set rotation AFTER touch initialization
+    display.set_rotation(rotation)
+    display.set_color_inversion(True)
+    display.set_backlight(100)
+    if indev is not None and not indev.is_calibrated:
+        _begin('indev.calibrate')
+        indev.calibrate()
+        _end()
+        t = _step('calibrate', t)
+
+    fs_drv = None
+    if fs:
+        from fs_driver import fs_register
+        _begin('fs_register')
+        fs_drv = lv.fs_drv_t()
+        fs_register(fs_drv, "S")
+        _end()
+
+    th = None
+    if timer:
+        import task_handler
+        th = task_handler.TaskHandler()
+    print("Display ready")
+    return handoff.Hardware(spi_bus=spi_bus, display_bus=display_bus, frame_buffers=(buf1, buf2), display=display,
+                           i2c_bus=i2c_bus, touch_dev=touch_dev, indev=indev, fs_drv=fs_drv, task_handler=th)
@@ -0,0 +1,266 @@
+"""Semiblock project bundle (.sbb) reader.
+
+Layout, all integers little-endian:
+
+    header  'SBB1' count:u16 reserved:u16
+    index   count x (kind:u8 method:u8 name_len:u8 reserved:u8
+                     offset:u32 comp_size:u32 size:u32 digest:8s) + name
+    data    entry payloads at their offsets
+
+kind is KIND_CODE, KIND_MPY (the code compiled by mpy-cross) or KIND_ASSET
+(written to <name>.png). method is
+METHOD_RAW, METHOD_DEFLATE (raw deflate, 2**WBITS window) or METHOD_CACHED
+(no payload, the device already has this digest). digest is the first 8
+bytes of the sha256 of the uncompressed data, as used by asset_cache.
+
+tools/bundle_pack.py writes this format.
+"""
+import gc
+import struct
+
+try:
+    import uio as io
+except ImportError:
+    import io
+
+try:
+    import ubinascii as binascii
+except ImportError:
+    import binascii
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+import asset_cache
+from project_stream import mem_used
+from staging import BlockWriter
+
+MAGIC = b'SBB1'
+CONTENT_TYPE = 'application/x-semiblock-bundle'
+HEADER = '<4sHH'
+ENTRY = '<BBBBIII8s'
+HEADER_SIZE = struct.calcsize(HEADER)
+ENTRY_SIZE = struct.calcsize(ENTRY)
+
+KIND_CODE = 0
+KIND_ASSET = 1
+KIND_MPY = 2
+
+METHOD_RAW = 0
+METHOD_DEFLATE = 1
+METHOD_CACHED = 2
+
+# Deflate window. 2**10 = 1 KB keeps the inflater small on the ESP32.
+WBITS = 10
+
+CHUNK = 1024
+
+
+def read_exact(stream, n):
+    out = b''
+    while len(out) < n:
+        data = stream.read(n - len(out))
+        if not data:
+            raise ValueError('bundle truncated')
+        out += data
+    return out
+
+
+class _Slice(io.IOBase):
+    """Reader limited to the next n bytes of a stream.
+
+    Implements readinto so deflate.DeflateIO can pull from it.
+    """
+
+    def __init__(self, stream, n):
+        self.stream = stream
+        self.left = n
+
+    def read(self, n):
+        if self.left <= 0:
+            return b''
+        data = self.stream.read(min(n, self.left))
+        self.left -= len(data)
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+
+class _ZlibReader:
+    """CPython stand-in for MicroPython's deflate.DeflateIO"""
+
+    def __init__(self, stream):
+        import zlib
+        self.stream = stream
+        self.d = zlib.decompressobj(-WBITS)
+
+    def read(self, n):
+        while True:
+            if self.d.unconsumed_tail:
+                out = self.d.decompress(self.d.unconsumed_tail, n)
+            else:
+                data = self.stream.read(CHUNK)
+                if not data:
+                    return self.d.flush()
+                out = self.d.decompress(data, n)
+            if out:
+                return out
+
+
+def _inflater(stream):
+    try:
+        import deflate
+    except ImportError:
+        return _ZlibReader(stream)
+    return deflate.DeflateIO(stream, deflate.RAW, WBITS)
+
+
+def mpy_path(code_path):
+    """Where compiled code is written next to code_path"""
+    return code_path.rsplit('.', 1)[0] + '.mpy.tmp'
+
+
+class Entry:
+    def __init__(self, raw, name):
+        (self.kind, self.method, _, _, self.offset,
+         self.comp_size, self.size, digest) = struct.unpack(ENTRY, raw)
+        self.digest = binascii.hexlify(digest).decode()
+        self.name = name
+
+
+class Unpacker:
+    """Extract a bundle from a stream straight to files.
+
+    Works on a socket (gaps are read and dropped) or a file (gaps are seeked
+    over). Exposes the same result fields as project_stream.ProjectHandler
+    plus total and peak like project_stream.JsonStream.
+    """
+
+    def __init__(self, stream, code_path='user_app.tmp', on_image=None, on_progress=None, manifest=None,
+                 stage=None):
+        self.stream = stream
+        self.code_path = code_path
+        self.on_image = on_image
+        self.progress = on_progress
+        self.manifest = manifest
+        self.stage = stage
+        self.success = False
+        self.code_size = -1
+        self.code_digest = None
+        self.mpy_path = None
+        self.images = []
+        self.unchanged = []
+        self.error = None
+        self.total = 0
+        self.peak = mem_used()
+        self.pos = 0
+
+    def _read(self, n):
+        data = read_exact(self.stream, n)
+        self.pos += n
+        self.total += n
+        return data
+
+    def _skip_to(self, offset):
+        gap = offset - self.pos
+        if gap < 0:
+            raise ValueError('bundle entries out of order')
+        if gap and hasattr(self.stream, 'seek'):
+            self.stream.seek(offset)
+        else:
+            self.total += gap
+            while gap:
+                gap -= len(read_exact(self.stream, min(gap, CHUNK)))
+        self.pos = offset
+
+    def index(self):
+        magic, count, _ = struct.unpack(HEADER, self._read(HEADER_SIZE))
+        if magic != MAGIC:
+            raise ValueError('not a bundle')
+        entries = []
+        for _ in range(count):
+            raw = self._read(ENTRY_SIZE)
+            name = self._read(raw[2]).decode()
+            entries.append(Entry(raw, name))
+        entries.sort(key=lambda e: e.offset)
+        return entries
+
+    def unpack(self):
+        for e in self.index():
+            if e.kind == KIND_CODE:
+                self._extract(e, self.code_path)
+                self.code_size = e.size
+                self.code_digest = e.digest
+            elif e.kind == KIND_MPY:
+                self.mpy_path = mpy_path(self.code_path)
+                self._extract(e, self.mpy_path)
+            elif e.kind == KIND_ASSET:
+                self._asset(e)
+        self.success = self.code_size >= 0
+        return self
+
+    def _asset(self, e):
+        manifest = self.manifest
+        target = '%s.png' % e.name
+        if manifest is not None:
+            entry = manifest.get(e.name)
+            if entry and entry[0] == e.digest and asset_cache.file_size(target) == e.size:
+                if e.method != METHOD_CACHED:
+                    self._skip_to(e.offset + e.comp_size)
+                self.unchanged.append((e.name, e.size))
+                print(f"{e.name}.png unchanged, kept cached copy")
+                return
+        if e.method == METHOD_CACHED:
+            # installing without it would leave the app without its image
+            self.error = 'server skipped %s but it is not on flash' % e.name
+            raise ValueError(self.error)
+        if self.stage:
+            self._extract(e, self.stage.path(target))
+            self.stage.add(target, e.digest, e.size)
+        else:
+            tmp = target + '.tmp'
+            self._extract(e, tmp)
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+            os.rename(tmp, target)
+        if manifest is not None:
+            manifest[e.name] = [e.digest, e.size]
+        self.images.append((e.name, e.size))
+        if self.on_image:
+            self.on_image(e.name, e.size)
+
+    def _extract(self, e, path):
+        self._skip_to(e.offset)
+        raw = _Slice(self.stream, e.comp_size)
+        src = _inflater(raw) if e.method == METHOD_DEFLATE else raw
+        hasher = asset_cache.new_hasher()
+        written = 0
+        with BlockWriter(path, hasher=hasher) as f:
+            while written < e.size:
+                data = src.read(min(CHUNK, e.size - written))
+                if not data:
+                    break
+                f.write(data)
+                written += len(data)
+                used = mem_used()
+                if used > self.peak:
+                    self.peak = used
+                if self.progress:
+                    self.progress(self.total + e.comp_size - raw.left)
+        # drop anything the inflater did not need (end-of-block padding)
+        while raw.left:
+            if not raw.read(CHUNK):
+                raise ValueError('bundle truncated')
+        self.pos += e.comp_size
+        self.total += e.comp_size
+        if written != e.size or asset_cache.hexdigest(hasher) != e.digest:
+            os.remove(path)
+            raise ValueError('bundle entry %s is corrupt' % e.name)
+        gc.collect()
@@ -0,0 +1,150 @@
+"""Find the fastest SPI clock the display takes on this board, and keep it
+
+board.start() drives the ST7796 at LCD_FREQ (20 MHz), well under what
+most boards manage, and the bus is what limits full-screen animation.
+tune() tries FREQS from the slowest up. At each one it writes ROUNDS
+test patterns into a PATCH_W x PATCH_H corner of the panel's memory,
+then reads them back over MISO (RAMRD) at READ_FREQ, slow enough for
+any panel. The first clock whose pattern comes back wrong ends the run,
+and the last one that passed every round is saved with
+board.save_bus_freq(). board.start() uses it from the next start on.
+
+The first clock is the untuned LCD_FREQ: if that fails too, reading the
+panel back does not work on this board and nothing is saved.
+
+Run it with nothing else on the display, right after a reset (make tune).
+
+or headless, against a failure threshold (tools/lcd_bus_sim.py):
+
+    micropython ../tools/simulator.py bus_tune.py --root /tmp/flash --spi-limit 40000000
+"""
+try:
+    from time import sleep_ms
+except ImportError:
+    from time import sleep
+
+    def sleep_ms(ms):
+        sleep(ms / 1000)
+
+import board
+
+# ESP32-S3 SPI clocks are 80 MHz divided by a whole number
+FREQS = (board.LCD_FREQ, 26666667, 40000000, 80000000)
+READ_FREQ = 5000000
+ROUNDS = 4
+PATCH_W = 32
+PATCH_H = 4
+
+SWRESET = 0x01
+SLPOUT = 0x11
+CASET = 0x2A
+RASET = 0x2B
+RAMWR = 0x2C
+RAMRD = 0x2E
+MADCTL = 0x36
+COLMOD = 0x3A
+
+# Filled in by tune(): (freq, wrong pixels) for each clock tried
+results = []
+
+
+def _pattern(n):
+    """Round n's pixels as big-endian RGB565.
+
+    Red and blue get the same bits in every pixel, so the panel's RGB/BGR
+    order cannot make a good read-back look wrong.
+    """
+    out = bytearray(PATCH_W * PATCH_H * 2)
+    seed = 0x1234
+    for i in range(PATCH_W * PATCH_H):
+        if n == 0:
+            v = 0xFFFF if i & 1 else 0  # every line toggling
+        elif n == 1:
+            v = 0xAAAA if i & 1 else 0x5555
+        elif n == 2:
+            v = 1 << (i % 11)  # walking one
+        else:
+            seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+            v = seed >> 8
+        rb = v & 0x1F
+        pixel = rb << 11 | (v >> 5 & 0x3F) << 5 | rb
+        out[2 * i] = pixel >> 8
+        out[2 * i + 1] = pixel & 0xFF
+    return out
+
+
+def _bus(spi_bus, freq):
+    import lcd_bus
+    bus = lcd_bus.SPIBus(spi_bus=spi_bus, freq=freq, dc=board.DC, cs=board.LCD_CS)
+    bus.init(board.WIDTH, board.HEIGHT, 16, PATCH_W * PATCH_H * 2, False)
+    return bus
+
+
+def _window(bus):
+    bus.tx_param(CASET, bytearray((0, 0, (PATCH_W - 1) >> 8, (PATCH_W - 1) & 0xFF)))
+    bus.tx_param(RASET, bytearray((0, 0, (PATCH_H - 1) >> 8, (PATCH_H - 1) & 0xFF)))
+
+
+def _wake(spi_bus):
+    """Just enough of the ST7796 init to write and read its memory in RGB565"""
+    bus = _bus(spi_bus, board.LCD_FREQ)
+    bus.tx_param(SWRESET)
+    sleep_ms(120)
+    bus.tx_param(SLPOUT)
+    sleep_ms(120)
+    bus.tx_param(COLMOD, bytearray((0x55,)))
+    bus.tx_param(MADCTL, bytearray((0x00,)))
+    bus.deinit()
+
+
+def check(spi_bus, freq, n):
+    """Write round n's pattern at freq and read it back. Returns the number of wrong pixels."""
+    pattern = _pattern(n)
+    bus = _bus(spi_bus, freq)
+    _window(bus)
+    bus.tx_param(RAMWR, pattern)
+    bus.deinit()
+
+    bus = _bus(spi_bus, READ_FREQ)
+    _window(bus)
+    back = bytearray(1 + PATCH_W * PATCH_H * 3)  # a dummy byte, then 6 bits per colour
+    bus.rx_param(RAMRD, back)
+    bus.deinit()
+
+    wrong = 0
+    for i in range(PATCH_W * PATCH_H):
+        pixel = pattern[2 * i] << 8 | pattern[2 * i + 1]
+        got = back[1 + 3 * i:4 + 3 * i]
+        if got[0] >> 3 != pixel >> 11 or got[1] >> 2 != pixel >> 5 & 0x3F or got[2] >> 3 != pixel & 0x1F:
+            wrong += 1
+    return wrong
+
+
+def tune(freqs=FREQS, rounds=ROUNDS, save=True):
+    """Try freqs in order and save the highest that passed. Returns it, or None."""
+    import machine
+    results.clear()
+    spi_bus = machine.SPI.Bus(host=board.HOST, mosi=board.MOSI, miso=board.MISO, sck=board.SCK)
+    _wake(spi_bus)
+    best = None
+    for freq in freqs:
+        wrong = 0
+        for n in range(rounds):
+            wrong += check(spi_bus, freq, n)
+        results.append((freq, wrong))
+        print(f"{freq / 1000000:6.2f} MHz: " + (f"{wrong} wrong pixels" if wrong else "ok"))
+        if wrong:
+            break
+        best = freq
+    spi_bus.deinit()
+    if best is None:
+        print("The panel does not read back at the default clock; nothing saved")
+        return None
+    if save:
+        board.save_bus_freq(best, [list(r) for r in results])
+        print(f"Saved {best / 1000000:.2f} MHz to {board.BUS_FILE}; reset to use it")
+    return best
+
+
+if __name__ == '__main__':
+    tune()
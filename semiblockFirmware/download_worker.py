@@ -0,0 +1,106 @@
+"""Run a project download on a _thread while the UI thread keeps drawing.
+
+The download (socket reads, base64 or bundle decoding, flash writes) used
+to run on the thread that calls lv.task_handler(), pumping LVGL from the
+idle and on_progress callbacks. Every read that had data, every decode
+and every flash block held a frame back, so the UI stuttered for the
+whole download.
+
+Worker runs the fetch function on its own thread with idle=None, so it
+blocks on the socket like any plain download. It never touches LVGL:
+on_progress and on_image only append to a lock-protected event list,
+which the UI thread drains with poll() between frames:
+
+    worker = Worker(peer_cache.fetch_project, url, code, stage=stage)
+    worker.start()
+    while True:
+        events = worker.poll()
+        for event in events:
+            ...  # ('progress', done, length), ('image', name, size),
+                 # then ('done', result) or ('error', exception)
+        if events and events[-1][0] in ('done', 'error'):
+            break
+        await asyncio.sleep_ms(LV_PERIOD_MS)
+
+Progress events are merged: poll() gives the latest one only, however
+many reads happened since the last frame.
+
+On the ESP32 MicroPython threads share one core and a GIL, so this does
+not decode in parallel with drawing; what it gains is that the UI thread
+only ever waits for one GIL slice, never for a socket read or a flash
+block. Without _thread start() runs the function inline.
+"""
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+# TLS handshake, JSON parsing and sha256 need more than the default thread stack
+STACK = 24 * 1024
+
+
+class _NoLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class Worker:
+    def __init__(self, fn, *args, **kwargs):
+        """fn(*args, on_image=..., on_progress=..., idle=None, **kwargs) is the download"""
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.lock = _thread.allocate_lock() if _thread else _NoLock()
+        self.events = []
+        self.finished = False
+        self.threaded = False
+
+    def _put(self, event):
+        with self.lock:
+            if event[0] == 'progress' and self.events and self.events[-1][0] == 'progress':
+                self.events[-1] = event
+            else:
+                self.events.append(event)
+
+    def _on_progress(self, done, length):
+        self._put(('progress', done, length))
+
+    def _on_image(self, name, size):
+        self._put(('image', name, size))
+
+    def _run(self):
+        try:
+            result = self.fn(*self.args, on_image=self._on_image, on_progress=self._on_progress,
+                             idle=None, **self.kwargs)
+            event = ('done', result)
+        except Exception as e:
+            event = ('error', e)
+        self._put(event)
+        self.finished = True
+
+    def start(self):
+        if _thread is not None:
+            try:
+                old = _thread.stack_size(STACK)
+            except (AttributeError, ValueError):
+                old = None
+            try:
+                _thread.start_new_thread(self._run, ())
+                self.threaded = True
+                return
+            except (RuntimeError, OSError, MemoryError):
+                pass  # no memory for another thread: download here instead
+            finally:
+                if old is not None:
+                    _thread.stack_size(old)
+        self._run()
+
+    def poll(self):
+        """Events since the last poll, oldest first"""
+        with self.lock:
+            events = self.events
+            self.events = []
+        return events
@@ -0,0 +1,385 @@
+"""Resumable project downloader.
+
+Asks getProject for a manifest (format=manifest) and then fetches the code
+and each asset on its own, over one kept-alive connection:
+
+- a file that was cut off is kept as <target>.part and resumed with Range
+- every request is retried with exponential backoff
+- assets whose digest matches the asset_cache manifest are not requested
+- bytes, re-sent bytes, retries and throughput are reported in Stats
+
+The manifest request carries what a streamed download would send (have=
+digests, Accept for bundles), so a server without manifest support
+answers it with the whole project, which is streamed to flash as it
+arrives (project_stream.read_project) on the same connection. A reply
+cut off half way is asked again, with the same backoff.
+
+With a mirror (a LAN peer, see peer_cache.py) each file is asked from the
+mirror first and from the server if that fails. The manifest, and with it
+every digest, always comes from the server, and a file without a digest
+is never taken from the mirror.
+"""
+import gc
+import json
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+try:
+    from time import ticks_ms, ticks_diff, sleep_ms
+except ImportError:
+    from time import monotonic, sleep
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+    def sleep_ms(ms):
+        sleep(ms / 1000)
+
+import asset_cache
+import netcache
+import project_stream
+from staging import BlockWriter
+
+CHUNK = project_stream.CHUNK
+RETRIES = 6
+BACKOFF_MS = 250
+MAX_BACKOFF_MS = 8000
+MANIFEST_HEADER = 'x-semiblock-manifest'
+
+
+class Stats:
+    def __init__(self):
+        self.start = ticks_ms()
+        self.total = 0      # body bytes received, including re-sent ones
+        self.resent = 0     # bytes we already had on flash but got again
+        self.retries = 0
+        self.requests = 0
+        self.connections = 0
+        self.mirrored = 0   # bytes of files that came from the mirror
+        self.peak = project_stream.mem_used()
+
+    def elapsed_ms(self):
+        return max(ticks_diff(ticks_ms(), self.start), 1)
+
+    def throughput(self):
+        """KB/s since the download started"""
+        return self.total * 1000 // self.elapsed_ms() // 1024
+
+    def report(self):
+        print(f"Download: {self.total} bytes in {self.elapsed_ms()} ms ({self.throughput()} KB/s), "
+              f"{self.requests} requests on {self.connections} connections, "
+              f"{self.retries} retries, {self.resent} bytes re-sent")
+
+
+class Connection:
+    """One HTTP/1.1 connection to a host, reopened only when it breaks"""
+
+    def __init__(self, base_url, stats, timeout=20):
+        self.scheme, self.host, self.port, _ = project_stream.split_url(base_url)
+        self.stats = stats
+        self.timeout = timeout
+        self.sock = None
+        self.stream = None
+
+    def get(self, path, headers=None, idle=None):
+        if self.sock is None:
+            self.sock, self.stream = project_stream.open_connection(
+                self.scheme, self.host, self.port, self.timeout)
+            self.stats.connections += 1
+        self.stats.requests += 1
+        try:
+            response = project_stream.send_request(
+                self.sock, self.stream, self.host, path, headers, True, self.timeout)
+        except Exception:
+            self.close()
+            raise
+        response.idle = idle
+        return response
+
+    def done(self, response):
+        """Call once the body has been read; keeps the socket if the server allows"""
+        h = response.headers
+        framed = 'content-length' in h or h.get('transfer-encoding', '').lower() == 'chunked'
+        if not framed or h.get('connection', '').lower() == 'close':
+            self.close()
+
+    def close(self):
+        if self.sock is not None:
+            netcache.release(self.sock)
+        self.sock = self.stream = None
+
+
+def backoff(ms, idle=None):
+    if idle is None:
+        sleep_ms(ms)
+        return
+    start = ticks_ms()
+    while ticks_diff(ticks_ms(), start) < ms:
+        idle()
+        sleep_ms(project_stream.IDLE_MS)
+
+
+def retry(stats, fn, *args, idle=None, retries=None):
+    """Call fn until it works, sleeping BACKOFF_MS, 2x, 4x... in between"""
+    retries = RETRIES if retries is None else retries
+    delay = BACKOFF_MS
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except (OSError, ValueError) as e:
+            if attempt == retries:
+                raise
+            stats.retries += 1
+            print(f"Download failed ({e}), retry {attempt + 1} in {delay} ms")
+            backoff(delay, idle)
+            delay = min(delay * 2, MAX_BACKOFF_MS)
+
+
+class Project:
+    """Result of a manifest install, same fields as project_stream.ProjectHandler"""
+
+    def __init__(self):
+        self.success = False
+        self.code_size = -1
+        self.code_digest = None
+        self.mpy_path = None
+        self.images = []
+        self.unchanged = []
+        self.error = None
+
+
+class Downloader:
+    def __init__(self, base_url, on_progress=None, idle=None, retries=None, mirror=None, mirror_retries=1):
+        """mirror is (base url, path_for): path_for(file name) is the mirror's path for it"""
+        self.retries = retries
+        self.stats = Stats()
+        self.conn = Connection(base_url, self.stats)
+        self.mirror = None
+        if mirror:
+            self.mirror = Connection(mirror[0], self.stats, timeout=5)
+            self.mirror_path = mirror[1]
+        self.mirror_retries = mirror_retries
+        self.on_progress = on_progress
+        self.idle = idle
+        self.expected = -1
+
+    def fetch_file(self, path, target, size, digest=None, name=None):
+        """Download path to target, resuming from target.part. Checks size and digest.
+
+        name is the file's name on the mirror; only files with a digest are asked there.
+        """
+        if self.mirror and digest and name:
+            try:
+                retry(self.stats, self._fetch_once, self.mirror, self.mirror_path(name), target, size,
+                      digest, idle=self.idle, retries=self.mirror_retries)
+                self.stats.mirrored += size
+                return
+            except (OSError, ValueError) as e:
+                print(f"Mirror could not send {name} ({e}), fetching it from the server")
+                # what the mirror did send is not resumed from: it may not be the same file
+                try:
+                    os.remove(target + '.part')
+                except OSError:
+                    pass
+        return retry(self.stats, self._fetch_once, self.conn, path, target, size, digest, idle=self.idle,
+                     retries=self.retries)
+
+    def close(self):
+        self.conn.close()
+        if self.mirror:
+            self.mirror.close()
+
+    def _fetch_once(self, conn, path, target, size, digest):
+        part = target + '.part'
+        have = max(asset_cache.file_size(part), 0)
+        if have > size:
+            os.remove(part)
+            have = 0
+        if have < size:
+            headers = {'Range': 'bytes=%d-' % have} if have else None
+            response = conn.get(path, headers, self.idle)
+            try:
+                if response.status_code == 200:
+                    # server ignored Range: start over
+                    self.stats.resent += have
+                    have = 0
+                elif response.status_code != 206:
+                    conn.close()
+                    raise OSError('HTTP %d for %s' % (response.status_code, path))
+                with BlockWriter(part, 'ab' if have else 'wb', offset=have) as f:
+                    while True:
+                        data = response.read(CHUNK)
+                        if not data:
+                            break
+                        f.write(data)
+                        have += len(data)
+                        self.stats.total += len(data)
+                        self._progress()
+            except Exception:
+                conn.close()
+                raise
+            if have != size:
+                conn.close()
+                raise OSError('%s cut off at %d of %d bytes' % (path, have, size))
+            conn.done(response)
+        if digest and asset_cache.file_digest(part) != digest:
+            os.remove(part)
+            raise ValueError('%s failed its digest check' % path)
+        try:
+            os.remove(target)
+        except OSError:
+            pass
+        os.rename(part, target)
+        gc.collect()
+
+    def _progress(self):
+        used = project_stream.mem_used()
+        if used > self.stats.peak:
+            self.stats.peak = used
+        if self.on_progress:
+            self.on_progress(self.stats.total, self.expected)
+
+    def manifest(self, path):
+        """The project manifest as a dict, or None if the server sent something else"""
+        response = self.conn.get(path, None, self.idle)
+        if response.status_code >= 500:
+            # overloaded or restarting, not an old server: retry rather than fall back
+            self.conn.close()
+            raise OSError('HTTP %d for %s' % (response.status_code, path))
+        if response.status_code != 200 or MANIFEST_HEADER not in response.headers:
+            self.conn.close()
+            return None, response.status_code
+        body = b''
+        while True:
+            data = response.read(CHUNK)
+            if not data:
+                break
+            body += data
+        self.stats.total += len(body)
+        self.conn.done(response)
+        return json.loads(body), 200
+
+    def project(self, path, code_path, manifest, on_image=None, stage=None, stream=True):
+        """Ask for the manifest, reading an old server's full reply as it comes.
+
+        Returns (manifest reply, None), or (None, (status, result, stats)) as
+        project_stream.fetch_project returns them. Without stream an old
+        server's reply is not read and (None, (status, None, None)) is returned.
+        """
+        path, headers = project_stream.project_request(
+            path + ('&' if '?' in path else '?') + 'format=manifest', manifest)
+        response = self.conn.get(path, headers, self.idle)
+        status = response.status_code
+        if status >= 500:
+            # overloaded or restarting: retry
+            self.conn.close()
+            raise OSError('HTTP %d for %s' % (status, path))
+        if status == 200 and MANIFEST_HEADER in response.headers:
+            body = b''
+            while True:
+                data = response.read(CHUNK)
+                if not data:
+                    break
+                body += data
+            self.stats.total += len(body)
+            self.conn.done(response)
+            return json.loads(body), None
+        if not stream:
+            self.conn.close()
+            return None, (status, None, None)
+        try:
+            result = project_stream.read_project(response, code_path, on_image, self.on_progress, manifest, stage)
+        except Exception:
+            self.conn.close()
+            raise
+        self.conn.done(response)
+        return None, result
+
+    def install(self, reply, code_path, manifest, on_image=None, stage=None):
+        """Fetch everything a manifest reply lists. manifest is the asset_cache one.
+
+        With a staging.Stage images are downloaded into the stage and recorded there.
+        A code entry without a url (a peer that only kept the .mpy) is not fetched;
+        its digest still identifies the app.
+        """
+        project = Project()
+        if not reply.get('success'):
+            project.error = reply.get('error')
+            return project
+        data = reply['data']
+        code, mpy = data['code'], data.get('mpy')
+        todo = []
+        for img in data.get('images', []):
+            entry = manifest.get(img['name'])
+            target = '%s.png' % img['name']
+            if entry and entry[0] == img['digest'] and asset_cache.file_size(target) == img['size']:
+                project.unchanged.append((img['name'], img['size']))
+            else:
+                todo.append(img)
+        fetch_code = code.get('url') is not None
+        if not fetch_code and not mpy:
+            project.error = 'manifest has neither code nor mpy'
+            return project
+        self.expected = ((code['size'] if fetch_code else 0) + (mpy['size'] if mpy else 0)
+                         + sum(i['size'] for i in todo))
+
+        for img in todo:
+            target = '%s.png' % img['name']
+            if stage:
+                self.fetch_file(img['url'], stage.path(target), img['size'], img['digest'], target)
+                stage.add(target, img['digest'], img['size'])
+            else:
+                self.fetch_file(img['url'], target, img['size'], img['digest'], target)
+            manifest[img['name']] = [img['digest'], img['size']]
+            project.images.append((img['name'], img['size']))
+            if on_image:
+                on_image(img['name'], img['size'])
+        if fetch_code:
+            self.fetch_file(code['url'], code_path, code['size'], code.get('digest'), 'code.py')
+        project.code_size = code['size']
+        project.code_digest = code.get('digest')
+        if mpy:
+            project.mpy_path = code_path.rsplit('.', 1)[0] + '.mpy.tmp'
+            self.fetch_file(mpy['url'], project.mpy_path, mpy['size'], mpy.get('digest'), 'code.mpy')
+        project.success = True
+        return project
+
+
+def fetch_project(url, code_path='user_app.tmp', on_image=None, on_progress=None, manifest=None,
+                  idle=None, stage=None, retries=None, stream_fallback=True, mirror=None):
+    """Resumable counterpart of project_stream.fetch_project, same arguments and return value.
+
+    stats (the third value) is a Stats with total and peak like JsonStream.
+    retries overrides RETRIES. Without stream_fallback a server that has no
+    manifest gives an unsuccessful result instead of a streamed download.
+    mirror, as in Downloader, is where files are asked first.
+    """
+    scheme, host, port, path = project_stream.split_url(url)
+    base = '%s://%s:%d' % (scheme, host, port)
+    d = Downloader(base, on_progress, idle, retries, mirror)
+    manifest = manifest if manifest is not None else {}
+    try:
+        reply, streamed = retry(d.stats, d.project, path, code_path, manifest, on_image, stage,
+                                stream_fallback, idle=idle, retries=retries)
+        if reply is not None:
+            status = 200
+            project = d.install(reply, code_path, manifest, on_image, stage)
+        elif streamed[1] is None:
+            status = streamed[0]
+            project = Project()
+            project.error = 'no manifest'
+        else:
+            # Old server: the project came in the reply itself
+            status, project, parser = streamed
+            d.stats.total += parser.total
+            d.stats.peak = max(d.stats.peak, parser.peak)
+    finally:
+        d.close()
+    d.stats.report()
+    return status, project, d.stats
@@ -0,0 +1,97 @@
+"""Render loop that only draws when something on screen changed.
+
+Scripts that drive LVGL themselves used to end every loop iteration with
+lv.task_handler(), lv.refr_now() and a fixed sleep: a static screen was
+woken and refreshed twice a second for ever, and an animation's frame
+rate was its sleep plus however long the frame took.
+
+FrameLoop takes over from the display's refresh timer instead:
+
+    import frame_loop
+    loop = frame_loop.FrameLoop(fps=30)
+    while True:
+        ...  # move things
+        loop.step()
+
+step() advances the LVGL tick, runs LVGL's timers (animations, input,
+app timers) and renders only if something was invalidated since the last
+frame; the display reports every invalidated area with an
+INVALIDATE_AREA event. It then sleeps out the rest of the frame. After a
+frame with nothing to draw it sleeps until LVGL's next timer is due (at
+most idle_ms), so a static screen costs next to nothing.
+
+rendered and skipped count the frames; report() prints them with the
+rate actually reached, every report_s seconds if given.
+
+Copy it next to the script with mpremote cp (make upload in semiblockFirmware does).
+"""
+try:
+    from time import ticks_ms, ticks_diff, sleep_ms
+except ImportError:
+    from time import monotonic, sleep
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+    def sleep_ms(ms):
+        sleep(ms / 1000)
+
+import lvgl as lv
+
+
+class FrameLoop:
+    def __init__(self, fps=30, display=None, tick=True, idle_ms=100, report_s=0):
+        """fps caps the frame rate. tick=False if a task_handler.TaskHandler already advances
+        lv.tick_inc(). report_s prints report() that often."""
+        self.period_ms = 1000 // fps
+        self.report_ms = report_s * 1000
+        self.display = display or lv.display_get_default()
+        self.tick = tick
+        self.idle_ms = idle_ms
+        self.dirty = True  # whatever was set up before the loop
+        self.rendered = 0
+        self.skipped = 0
+        self.start = self.last = self.reported = ticks_ms()
+        self.display.add_event_cb(self._invalidated, lv.EVENT.INVALIDATE_AREA, None)
+        # Rendering happens in step() now, not whenever the refresh timer fires
+        self.display.get_refr_timer().pause()
+
+    def _invalidated(self, event):
+        self.dirty = True
+
+    def step(self):
+        """One frame: timers, render if dirty, then sleep until the next frame is due"""
+        now = ticks_ms()
+        if self.tick:
+            lv.tick_inc(ticks_diff(now, self.last))
+        self.last = now
+        next_timer = lv.timer_handler()
+        if self.dirty:
+            self.dirty = False
+            lv.refr_now(self.display)
+            self.rendered += 1
+            delay = self.period_ms
+        else:
+            self.skipped += 1
+            delay = max(self.period_ms, min(next_timer, self.idle_ms))
+        if self.report_ms and ticks_diff(now, self.reported) >= self.report_ms:
+            self.reported = now
+            self.report()
+        delay -= ticks_diff(ticks_ms(), now)
+        if delay > 0:
+            sleep_ms(delay)
+
+    def run(self, update=None):
+        """step() for ever, calling update() first each frame"""
+        while True:
+            if update:
+                update()
+            self.step()
+
+    def report(self):
+        seconds = max(ticks_diff(ticks_ms(), self.start), 1) / 1000
+        print(f"Frames: {self.rendered} rendered, {self.skipped} skipped in {seconds:.1f} s "
+              f"({self.rendered / seconds:.1f} fps)")
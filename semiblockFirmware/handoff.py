@@ -0,0 +1,42 @@
+"""Live hardware the firmware hands to an app it starts in-process.
+
+launcher.run() publishes the firmware's SPI bus, display bus and frame
+buffers, ST7796, I2C bus, touch device and indev, the LVGL task handler
+and the registered "S:" filesystem driver before it imports the app.
+board.start() returns them instead of bringing up its own:
+
+    import board
+    hw = board.start()
+    display, indev, th = hw.display, hw.indev, hw.task_handler
+
+get() is None when there is nothing to hand over (the app was started at
+boot, before the firmware touched the display).
+"""
+
+_published = None
+
+
+class Hardware:
+    """The firmware's live objects. task_handler may be filled in by the launcher."""
+
+    def __init__(self, spi_bus, display_bus, frame_buffers, display, i2c_bus, touch_dev, indev, fs_drv,
+                 task_handler=None):
+        self.spi_bus = spi_bus
+        self.display_bus = display_bus
+        self.frame_buffers = frame_buffers
+        self.display = display
+        self.i2c_bus = i2c_bus
+        self.touch_dev = touch_dev
+        self.indev = indev
+        self.fs_drv = fs_drv
+        self.task_handler = task_handler
+
+
+def publish(hw):
+    global _published
+    _published = hw
+
+
+def get():
+    """The published Hardware, or None"""
+    return _published
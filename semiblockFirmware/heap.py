@@ -0,0 +1,137 @@
+"""Heap budget of the user app, and freeing what the firmware leaves behind.
+
+budget() measures:
+
+- gc_free / gc_used: the MicroPython heap, where Python objects and LVGL
+  widgets live (in SPIRAM on the ESP32-S3)
+- gc_largest: the biggest single block the GC heap can still hand out,
+  found by trying allocations (a bisection of PROBE_STEPS), since a
+  MemoryError is usually fragmentation, not the total running out
+- internal_* / spiram_*: free and largest free block of the ESP-IDF heaps
+  outside the GC heap (frame buffers, sockets, drivers), from
+  esp32.idf_heap_info(). A region bigger than INTERNAL_MAX is counted as
+  SPIRAM: the S3 has 512 KB of internal SRAM in all.
+
+report() prints one 'HEAP {...}' JSON line, so a serial log can be
+grepped or charted like the profiler's PROFILE lines. watch() repeats it
+every few seconds while the app runs, without the probe and without a
+gc.collect(), so the app's frames are not held up or its heap split by it.
+
+reclaim() drops the firmware's globals and its helper modules before an
+app starts, so only the app's own objects compete for the heap.
+"""
+import gc
+import json
+import sys
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    from time import monotonic
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+INTERNAL_MAX = 512 * 1024
+PROBE_STEPS = 12
+
+# Firmware modules an app never uses. handoff and app_cache stay.
+FIRMWARE_MODULES = ('profiler', 'staging', 'asset_cache', 'bundle', 'project_stream', 'downloader',
+                    'download_worker', 'netcache', 'peer_cache', 'wifi_cache', 'wifi_pool', 'ota', 'launcher')
+
+_start = ticks_ms()
+_timer = None
+
+
+def largest_block(limit=None, steps=PROBE_STEPS):
+    """Roughly the largest bytearray the GC heap can allocate right now"""
+    lo, hi = 0, limit if limit is not None else gc.mem_free()
+    for _ in range(steps):
+        if hi - lo < 64:
+            break
+        mid = (lo + hi) // 2
+        try:
+            block = bytearray(mid)
+            del block
+            lo = mid
+        except MemoryError:
+            hi = mid
+    gc.collect()
+    return lo
+
+
+def _idf_heaps():
+    """(internal_free, internal_largest, spiram_free, spiram_largest), or None off the ESP32"""
+    try:
+        import esp32
+        regions = esp32.idf_heap_info(esp32.HEAP_DATA)
+    except (ImportError, AttributeError):
+        return None
+    out = [0, 0, 0, 0]
+    for total, free, largest, _ in regions:
+        i = 2 if total > INTERNAL_MAX else 0
+        out[i] += free
+        out[i + 1] = max(out[i + 1], largest)
+    return out
+
+
+def budget(probe=True):
+    """Heap numbers as a dict; probe=False skips gc.collect() and the largest block search"""
+    if probe:
+        gc.collect()
+    b = {'t_ms': ticks_diff(ticks_ms(), _start)}
+    try:
+        b['gc_free'] = gc.mem_free()
+        b['gc_used'] = gc.mem_alloc()
+    except AttributeError:
+        return b  # CPython
+    if probe:
+        b['gc_largest'] = largest_block(b['gc_free'])
+    idf = _idf_heaps()
+    if idf:
+        b['internal_free'], b['internal_largest'], b['spiram_free'], b['spiram_largest'] = idf
+    return b
+
+
+def report(label='', probe=True):
+    b = budget(probe)
+    b['label'] = label
+    print('HEAP ' + json.dumps(b))
+    return b
+
+
+def _tick(_):
+    try:
+        report('app', probe=False)
+    except MemoryError:
+        print('HEAP {"label": "app", "error": "MemoryError"}')
+
+
+def watch(period_s=10):
+    """report() every period_s seconds from an LVGL timer (runs with the app's task_handler)"""
+    global _timer
+    if _timer is not None or not period_s:
+        return
+    try:
+        import lvgl as lv
+        _timer = lv.timer_create(_tick, period_s * 1000, None)
+    except ImportError:
+        pass
+
+
+def reclaim(namespace=None, modules=FIRMWARE_MODULES):
+    """Drop the globals in namespace and unload modules. Returns the GC heap bytes freed."""
+    gc.collect()
+    before = gc.mem_free() if hasattr(gc, 'mem_free') else 0
+    if namespace is not None:
+        for name in list(namespace):
+            if not name.startswith('__'):
+                del namespace[name]
+    for name in modules:
+        if name in sys.modules:
+            del sys.modules[name]
+    gc.collect()
+    return (gc.mem_free() if hasattr(gc, 'mem_free') else 0) - before
@@ -0,0 +1,69 @@
+"""Images compiled by tools/asset_compile.py, drawn by LVGL without decoding
+
+set_src("S:sps.jpg") had LVGL read the file through the "S:" driver and
+decode it on every load, and apps often showed it at another size with
+set_size(). asset_compile.py writes each image already scaled, as an
+LVGL binary image (<name>.bin: a 12-byte header, then RGB565 pixels and
+for RGB565A8 an alpha plane). load() reads it into RAM once and returns
+an image descriptor LVGL draws from as it is:
+
+    import images
+    img = lv.image(scrn)
+    img.set_src(images.load('sps'))
+
+No image decoder and no "S:" driver are involved. If <name>.bin is not
+there, load() returns fallback (e.g. "S:sps.jpg") if one is given.
+"""
+import struct
+
+import lvgl as lv
+
+MAGIC = 0x19
+HEADER = 12
+RGB565 = 0x12
+RGB565A8 = 0x14
+
+# name -> (descriptor, pixels): LVGL only points at the pixels, this keeps them alive
+_loaded = {}
+
+# Filled in by load(): images in RAM and their bytes
+stats = {'images': 0, 'bytes': 0}
+
+
+def load(name, fallback=None):
+    """Image descriptor for <name>.bin, read once and kept"""
+    entry = _loaded.get(name)
+    if entry is not None:
+        return entry[0]
+    try:
+        f = open(name + '.bin', 'rb')
+    except OSError:
+        if fallback is None:
+            raise
+        print(f"No {name}.bin, decoding {fallback} instead")
+        return fallback
+    with f:
+        magic, cf, flags, w, h, stride, _ = struct.unpack('<BBHHHHH', f.read(HEADER))
+        if magic != MAGIC or cf not in (RGB565, RGB565A8):
+            raise ValueError(f"{name}.bin is not an RGB565 LVGL image")
+        size = stride * h + (w * h if cf == RGB565A8 else 0)
+        pixels = bytearray(size)
+        if f.readinto(pixels) != size:
+            raise ValueError(f"{name}.bin is cut short")
+    dsc = lv.image_dsc_t({
+        'header': {'magic': MAGIC, 'cf': cf, 'flags': flags, 'w': w, 'h': h, 'stride': stride},
+        'data_size': size,
+        'data': pixels,
+    })
+    _loaded[name] = (dsc, pixels)
+    stats['images'] += 1
+    stats['bytes'] += size
+    return dsc
+
+
+def forget(name):
+    """Let name's pixels go. Nothing on screen may still show it."""
+    entry = _loaded.pop(name, None)
+    if entry is not None:
+        stats['images'] -= 1
+        stats['bytes'] -= len(entry[1])
@@ -0,0 +1,164 @@
+"""Start a freshly installed app in the running firmware, without a reset.
+
+The firmware has already brought up the SPI bus, the panel, its two
+frame buffers, the I2C bus and the touch controller. A reset would tear
+all of that down only for the app to build it again. run() instead:
+
+1. loads an empty screen and deletes the firmware's, with every object on it
+2. drops the firmware's module globals and runs gc.collect()
+3. hands the live hardware over to the app (handoff.py)
+4. imports the app from the app cache in its own module namespace
+
+Apps that know about handoff take the objects from handoff.get(). Apps
+written for a bare board create the hardware themselves (machine.SPI.Bus,
+lcd_bus.SPIBus, allocate_framebuffer, st7796.ST7796, i2c.I2C.Bus/Device,
+ft6x36.FT6x36, task_handler.TaskHandler, fs_register). For those, the
+names are served by stand-in modules in sys.modules that return the
+objects that are already running, so an unmodified app also gets the live
+display and touch instead of a second panel init and two more
+framebuffers. display.init() on the handed-over display does nothing.
+
+The time to the app's first frame and the heap it starts with are
+printed by app_cache.launch(); run() adds what the teardown freed.
+"""
+import gc
+import sys
+
+try:
+    from time import ticks_ms, ticks_diff, sleep
+except ImportError:
+    from time import monotonic, sleep
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+import app_cache
+import handoff
+
+# Filled in by run(): teardown time and heap before and after it
+stats = {}
+
+
+class _Proxy:
+    """A module or object whose attributes come from real, except the overridden ones"""
+
+    def __init__(self, real, **overrides):
+        self._real = real
+        for name in overrides:
+            setattr(self, name, overrides[name])
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+    def __call__(self, *args, **kwargs):
+        return self._real(*args, **kwargs)
+
+
+def _returns(obj):
+    return lambda *args, **kwargs: obj
+
+
+def _buffers(real_bus, buffers):
+    """allocate_framebuffer() that gives out the firmware's buffers before making new ones"""
+    # the 'full' profile has one buffer and 'driver' none (board.PROFILES)
+    spare = [buf for buf in buffers if buf is not None]
+
+    def allocate_framebuffer(size, caps):
+        for i, buf in enumerate(spare):
+            if len(buf) >= size:
+                return spare.pop(i)
+        return real_bus.allocate_framebuffer(size, caps)
+    return allocate_framebuffer
+
+
+def _stand_ins(hw):
+    """{module name: stand-in} that hand out the objects in hw, a handoff.Hardware"""
+    import machine
+    import lcd_bus
+    import st7796
+    import i2c
+    import ft6x36
+    import fs_driver
+    import task_handler
+    bus = _Proxy(hw.display_bus, allocate_framebuffer=_buffers(hw.display_bus, hw.frame_buffers))
+    display = _Proxy(hw.display, init=_returns(None))
+    touch_dev = hw.touch_dev
+
+    def device(*args, **kwargs):
+        if kwargs.get('dev_id') == getattr(touch_dev, 'dev_id', None):
+            return touch_dev
+        return i2c.I2C.Device(*args, **kwargs)
+
+    def fs_register(drv, letter, *args, **kwargs):
+        if letter != 'S':
+            fs_driver.fs_register(drv, letter, *args, **kwargs)
+
+    return {
+        'machine': _Proxy(machine, SPI=_Proxy(machine.SPI, Bus=_returns(hw.spi_bus))),
+        'lcd_bus': _Proxy(lcd_bus, SPIBus=_returns(bus)),
+        'st7796': _Proxy(st7796, ST7796=_returns(display)),
+        'i2c': _Proxy(i2c, I2C=_Proxy(i2c.I2C, Bus=_returns(hw.i2c_bus), Device=device)),
+        'ft6x36': _Proxy(ft6x36, FT6x36=_returns(hw.indev)),
+        'task_handler': _Proxy(task_handler, TaskHandler=lambda *args, **kwargs: hw.task_handler),
+        'fs_driver': _Proxy(fs_driver, fs_register=fs_register),
+    }
+
+
+def teardown(namespace=None):
+    """Free the firmware's UI: its screen and objects, and the globals in namespace"""
+    import lvgl as lv
+    old = lv.screen_active()
+    lv.screen_load(lv.obj())
+    old.delete()
+    if namespace is not None:
+        for name in list(namespace):
+            if not name.startswith('__'):
+                del namespace[name]
+    try:
+        import asyncio
+        asyncio.new_event_loop()  # tasks the firmware left behind never run again
+    except (ImportError, AttributeError):
+        pass
+    gc.collect()
+
+
+def run(digest, hw, namespace=None):
+    """Run app digest on the firmware's live hardware. Never returns.
+
+    hw is a handoff.Hardware with the firmware's objects. It also keeps
+    them alive, fs_drv included, which LVGL points at. namespace is the
+    firmware's globals(); everything in it is dropped, so call this last thing.
+    """
+    start = ticks_ms()
+    gc.collect()
+    stats['free_before_teardown'] = gc.mem_free()
+    stand_ins = _stand_ins(hw)
+    teardown(namespace)
+    if hw.task_handler is None:
+        # the firmware drove LVGL from asyncio, which is gone now
+        import task_handler
+        hw.task_handler = task_handler.TaskHandler()
+    handoff.publish(hw)
+    stats['teardown_ms'] = ticks_diff(ticks_ms(), start)
+    stats['freed'] = gc.mem_free() - stats['free_before_teardown']
+    print(f"Firmware UI torn down in {stats['teardown_ms']} ms, {stats['freed']} bytes freed")
+    for name in stand_ins:
+        sys.modules[name] = stand_ins[name]
+    push_server = sys.modules.get('push_server')
+    if push_server is not None:
+        # the firmware UI is gone: a push from now on resets into the new app
+        push_server.launch = None
+    try:
+        app_cache.launch(digest, start)
+    except Exception as e:
+        # The firmware UI is gone, so there is nothing to fall back to: reboot into it,
+        # as app_cache.launch() does for an app started at boot
+        print(f"App {digest} raised {repr(e)}, restarting")
+        import machine
+        machine.reset()
+    # If the app finishes, just hang, as after a launch at boot
+    while True:
+        sleep(1)
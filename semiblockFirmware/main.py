@@ -0,0 +1,3 @@
+# Boot selector: runs the firmware in slot fw_a or fw_b, see ota.py
+import ota
+ota.boot()
@@ -0,0 +1,319 @@
+"""DNS cache, TLS session reuse and connection warm-up for the project server.
+
+resolve() keeps each answer with its expiry time in RTC memory, which
+survives machine.reset() but not a power cut, or in CACHE on flash where
+there is no RTC memory. If DNS_SERVER is set (the firmware takes it from
+wlan.ifconfig()), the A record is queried here over UDP so its real TTL is
+used. Otherwise getaddrinfo() answers and DEFAULT_TTL applies.
+
+connect() opens a socket to the cached address. For https it offers the
+TLS session of the last connection to that host, so the server can answer
+with an abbreviated handshake, when the ssl module takes a session.
+
+warm() does all of that in the background, on a _thread if there is one,
+and parks the connection. The next connect() to the same host takes it.
+"""
+import json
+import struct
+
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+try:
+    from time import ticks_ms, ticks_diff, sleep_ms
+except ImportError:
+    from time import monotonic, sleep
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+    def sleep_ms(ms):
+        sleep(ms / 1000)
+
+import time
+
+CACHE = 'netcache.json'
+MAGIC = b'NC1'
+
+# Used when the answer came from getaddrinfo(), which gives no TTL
+DEFAULT_TTL = 300
+# Never keep an answer longer than this, whatever the TTL says
+MAX_TTL = 86400
+
+# DNS server to query directly, e.g. wlan.ifconfig()[3]. None = getaddrinfo().
+DNS_SERVER = None
+
+# A parked warm connection older than this is closed instead of used;
+# servers drop idle keep-alive connections after a while.
+PARK_MS = 15000
+
+# The warm-up thread's stack: a TLS handshake overflows the default one
+# (as in download_worker.STACK)
+WARM_STACK = 24 * 1024
+
+# Counters and the timing of the last connect(), in ms
+stats = {'dns_hits': 0, 'dns_misses': 0, 'handshakes': 0, 'resumed': 0, 'warm_used': 0}
+timing = {}
+
+_cache = None
+_context = None
+_sessions = {}   # host -> TLS session of the last connection
+_hosts = {}      # open TLS socket -> host, to pick up its session on release()
+_parked = None   # (scheme, host, port, sock, stream, ticks) from warm()
+_warming = False
+
+
+def _rtc():
+    try:
+        import machine
+        return machine.RTC()
+    except (ImportError, AttributeError):
+        return None
+
+
+def _load():
+    global _cache
+    if _cache is not None:
+        return _cache
+    _cache = {}
+    rtc = _rtc()
+    try:
+        if rtc:
+            raw = rtc.memory()
+            if raw[:len(MAGIC)] == MAGIC:
+                _cache = json.loads(raw[len(MAGIC):])
+        else:
+            with open(CACHE) as f:
+                _cache = json.load(f)
+    except (OSError, ValueError):
+        pass
+    return _cache
+
+
+def _save():
+    data = json.dumps(_cache)
+    rtc = _rtc()
+    try:
+        if rtc:
+            rtc.memory(MAGIC + data.encode())
+        else:
+            with open(CACHE, 'w') as f:
+                f.write(data)
+    except (OSError, ValueError):
+        pass  # too big for RTC memory: cache stays in RAM this boot
+
+
+def clear():
+    global _cache
+    _cache = {}
+    _sessions.clear()
+    _save()
+
+
+def _skip_name(msg, pos):
+    while True:
+        n = msg[pos]
+        if n == 0:
+            return pos + 1
+        if n & 0xC0 == 0xC0:  # compression pointer
+            return pos + 2
+        pos += n + 1
+
+
+def query(host, server, timeout=2):
+    """Ask server for host's A record over UDP. Returns (ip, ttl)."""
+    qid = ticks_ms() & 0xFFFF
+    msg = struct.pack('>HHHHHH', qid, 0x0100, 1, 0, 0, 0)
+    for label in host.split('.'):
+        msg += bytes((len(label),)) + label.encode()
+    msg += b'\x00' + struct.pack('>HH', 1, 1)
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.settimeout(timeout)
+        s.sendto(msg, socket.getaddrinfo(server, 53)[0][-1])
+        reply = s.recv(512)
+    finally:
+        s.close()
+    rid, flags, qd, an = struct.unpack('>HHHH', reply[:8])
+    if rid != qid or flags & 0x000F:
+        raise OSError('DNS error %d for %s' % (flags & 0x000F, host))
+    pos = 12
+    for _ in range(qd):
+        pos = _skip_name(reply, pos) + 4
+    ttl = MAX_TTL
+    for _ in range(an):
+        pos = _skip_name(reply, pos)
+        rtype, _, rttl, rlen = struct.unpack('>HHIH', reply[pos:pos + 10])
+        pos += 10
+        ttl = min(ttl, rttl)  # a CNAME in front counts too
+        if rtype == 1 and rlen == 4:
+            return '%d.%d.%d.%d' % tuple(reply[pos:pos + 4]), ttl
+        pos += rlen
+    raise OSError('no A record for %s' % host)
+
+
+def resolve(host, port):
+    """Socket address for host:port, from the cache while its TTL lasts"""
+    if host.replace('.', '').isdigit():
+        return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][-1]  # already an IP
+    dns = _load().setdefault('dns', {})
+    entry = dns.get(host)
+    now = time.time()
+    if entry and entry[1] > now:
+        stats['dns_hits'] += 1
+        ip = entry[0]
+    else:
+        stats['dns_misses'] += 1
+        if DNS_SERVER:
+            try:
+                ip, ttl = query(host, DNS_SERVER)
+            except (OSError, ValueError, IndexError):
+                ip, ttl = None, 0
+        else:
+            ip, ttl = None, 0
+        if ip is None:
+            addr = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][-1]
+            if not isinstance(addr, tuple):
+                return addr  # raw sockaddr bytes on older ports, nothing to cache
+            ip, ttl = addr[0], DEFAULT_TTL
+        dns[host] = [ip, now + min(ttl, MAX_TTL)]
+        _save()
+    return socket.getaddrinfo(ip, port, 0, socket.SOCK_STREAM)[0][-1]
+
+
+def tls_context():
+    """One SSLContext for every connection (None if the port only has ssl.wrap_socket)"""
+    global _context
+    if _context is None:
+        import ssl
+        if hasattr(ssl, 'create_default_context'):
+            _context = ssl.create_default_context()  # CPython
+        elif hasattr(ssl, 'SSLContext'):
+            _context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            _context.verify_mode = ssl.CERT_NONE  # as ssl.wrap_socket() did before
+    return _context
+
+
+def _wrap(sock, host):
+    ctx = tls_context()
+    if ctx is None:
+        import ssl
+        return ssl.wrap_socket(sock, server_hostname=host)
+    session = _sessions.get(host)
+    if session is not None:
+        try:
+            return ctx.wrap_socket(sock, server_hostname=host, session=session)
+        except TypeError:
+            _sessions.clear()  # this ssl module cannot resume, stop offering
+    return ctx.wrap_socket(sock, server_hostname=host)
+
+
+def _open(scheme, host, port, timeout):
+    start = ticks_ms()
+    addr = resolve(host, port)
+    timing['dns_ms'] = ticks_diff(ticks_ms(), start)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        start = ticks_ms()
+        sock.connect(addr)
+        timing['tcp_ms'] = ticks_diff(ticks_ms(), start)
+        if scheme == 'https':
+            start = ticks_ms()
+            sock = _wrap(sock, host)
+            timing['tls_ms'] = ticks_diff(ticks_ms(), start)
+            stats['handshakes'] += 1
+            if getattr(sock, 'session_reused', False):
+                stats['resumed'] += 1
+            _hosts[sock] = host
+    except Exception:
+        sock.close()
+        raise
+    stream = sock if hasattr(sock, 'readline') else sock.makefile('rb')
+    return sock, stream
+
+
+def _take_parked(scheme, host, port, timeout):
+    global _parked
+    for _ in range(timeout * 100):
+        if not _warming:
+            break
+        sleep_ms(10)
+    parked, _parked = _parked, None
+    if parked is None:
+        return None
+    if parked[:3] == (scheme, host, port) and ticks_diff(ticks_ms(), parked[5]) < PARK_MS:
+        stats['warm_used'] += 1
+        return parked[3], parked[4]
+    release(parked[3])
+    return None
+
+
+def connect(scheme, host, port, timeout=20):
+    """Connected (and for https, TLS-wrapped) socket plus a stream to read it by line"""
+    warm = _take_parked(scheme, host, port, timeout)
+    if warm:
+        return warm
+    return _open(scheme, host, port, timeout)
+
+
+def release(sock):
+    """Close a socket from connect(), keeping its TLS session for the next one"""
+    host = _hosts.pop(sock, None)
+    session = getattr(sock, 'session', None) if host else None
+    if session is not None:
+        _sessions[host] = session
+    try:
+        sock.close()
+    except Exception:
+        pass
+
+
+def _warm_up(scheme, host, port, timeout):
+    global _parked, _warming
+    try:
+        sock, stream = _open(scheme, host, port, timeout)
+        _parked = (scheme, host, port, sock, stream, ticks_ms())
+        print(f"Warmed up {host}: dns {timing.get('dns_ms')} ms, tcp {timing.get('tcp_ms')} ms, "
+              f"tls {timing.get('tls_ms', 0)} ms")
+    except Exception as e:
+        print(f"Warm-up of {host} failed: {e}")
+    finally:
+        _warming = False
+
+
+def warm(url, timeout=20):
+    """Resolve and connect to url's host in the background. Calls after the first are ignored."""
+    global _warming
+    if _warming or _parked is not None:
+        return
+    from project_stream import split_url
+    scheme, host, port, _ = split_url(url)
+    _warming = True
+    try:
+        import _thread
+    except ImportError:
+        _warm_up(scheme, host, port, timeout)
+        return
+    try:
+        old = _thread.stack_size(WARM_STACK)
+    except (AttributeError, ValueError):
+        old = None
+    try:
+        _thread.start_new_thread(_warm_up, (scheme, host, port, timeout))
+    except (RuntimeError, OSError, MemoryError):
+        _warm_up(scheme, host, port, timeout)
+    finally:
+        if old is not None:
+            _thread.stack_size(old)
+
+
+def report():
+    print(f"Net: dns {stats['dns_hits']} hits / {stats['dns_misses']} misses, "
+          f"{stats['resumed']} of {stats['handshakes']} TLS handshakes resumed, "
+          f"{stats['warm_used']} warm connections used, last connect {timing}")
@@ -0,0 +1,196 @@
+"""A/B slot updates of the firmware script, with rollback.
+
+The firmware lives in one of two slots, fw_a and fw_b (.py or .mpy).
+main.py on the board is only the boot selector:
+
+    import ota
+    ota.boot()
+
+STATE records the active slot, a slot on trial and how often the trial
+slot has been booted. update() downloads a new firmware into the other
+slot with the resumable downloader (one CHUNK in RAM plus a BlockWriter
+block, digest checked before the slot is touched) and puts it on trial.
+boot() runs a trial slot at most MAX_TRIES times. The firmware calls
+mark_ready() once it has its UI up and the network working; only then
+does the trial slot become the active one. A trial slot that raises
+during boot, or that is reset or power cycled before mark_ready(), is
+dropped and the previous slot runs again, and that version is not
+installed again.
+
+update() compares the offer with the version and digest it recorded for
+the running slot, not with a version the firmware claims, so a release
+that forgets to bump its version constant is not installed over and over.
+"""
+import json
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+import asset_cache
+
+STATE = 'ota.json'
+SLOTS = ('a', 'b')
+EXTS = ('.py', '.mpy')
+
+# Boots a trial slot gets to reach mark_ready()
+MAX_TRIES = 1
+
+# The slot boot() started
+running = None
+
+
+def module_name(slot):
+    return 'fw_' + slot
+
+
+def _path(slot, ext):
+    return module_name(slot) + ext
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def installed(slot):
+    return any(asset_cache.file_size(_path(slot, ext)) >= 0 for ext in EXTS)
+
+
+def other(slot):
+    return SLOTS[1 - SLOTS.index(slot)]
+
+
+def load():
+    try:
+        with open(STATE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    state.setdefault('active', SLOTS[0])
+    state.setdefault('trial', None)
+    state.setdefault('tries', 0)
+    state.setdefault('versions', {})
+    state.setdefault('digests', {})
+    return state
+
+
+def save(state):
+    tmp = STATE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    _remove(STATE)
+    os.rename(tmp, STATE)
+
+
+def _abandon(state, why):
+    print(f"Firmware slot {state['trial']} {why}, back to slot {state['active']}")
+    # not offered again by update(), or a bad release would install and roll back forever
+    state['rejected'] = state['versions'].get(state['trial'])
+    state['trial'] = None
+    state['tries'] = 0
+    save(state)
+
+
+def boot():
+    """Pick a slot and run it. Called from main.py."""
+    global running
+    state = load()
+    slot = state['active']
+    if state['trial']:
+        if state['tries'] >= MAX_TRIES:
+            _abandon(state, 'never got ready')
+        else:
+            state['tries'] += 1
+            save(state)
+            slot = state['trial']
+    if not installed(slot) and installed(other(slot)):
+        slot = other(slot)
+    running = slot
+    print(f"Booting firmware slot {slot} ({state['versions'].get(slot, 'unknown version')})")
+    try:
+        __import__(module_name(slot))
+    except Exception as e:
+        state = load()
+        if state['trial'] != slot:
+            raise
+        print(f"Firmware slot {slot} raised {repr(e)}")
+        _abandon(state, 'failed to start')
+        try:
+            import machine
+            machine.reset()
+        except ImportError:
+            raise e
+
+
+def trial():
+    """True while the running slot has not reached mark_ready() yet"""
+    return running is not None and load()['trial'] == running
+
+
+def mark_ready():
+    """The running firmware works: keep it. Does nothing outside a trial."""
+    state = load()
+    if running is None or state['trial'] != running:
+        return
+    state['active'] = running
+    state['trial'] = None
+    state['tries'] = 0
+    save(state)
+    print(f"Firmware slot {running} is good, keeping it")
+
+
+def version():
+    """Version of the running slot as recorded by update(), or None"""
+    return load()['versions'].get(running) if running else None
+
+
+def update(url, current_version=None, on_progress=None, idle=None, check_retries=None):
+    """Install the firmware url offers into the idle slot, unless the running slot has it.
+
+    url answers like getProject with format=manifest:
+    {"success": true, "data": {"version": ..., "file": {url, size, digest}, "mpy": {...}}}
+    where mpy is optional and preferred. The offer is skipped if its version
+    or digest is the one recorded for the running slot; current_version is
+    only used for a slot installed without update(). check_retries limits
+    the retries of the manifest request (default downloader.RETRIES).
+    Returns the new version, to be booted on the next reset, or None.
+    """
+    if running is None:
+        print("Not started by ota.boot(), no firmware update")
+        return None
+    import downloader
+    import project_stream
+    scheme, host, port, path = project_stream.split_url(url)
+    d = downloader.Downloader('%s://%s:%d' % (scheme, host, port), on_progress, idle)
+    try:
+        reply, status = downloader.retry(d.stats, d.manifest, path, idle=idle, retries=check_retries)
+        if reply is None or not reply.get('success'):
+            print(f"No firmware update: HTTP {status}")
+            return None
+        data = reply['data']
+        state = load()
+        ext = '.mpy' if data.get('mpy') else '.py'
+        entry = data['mpy'] if ext == '.mpy' else data['file']
+        installed_version = version() or current_version
+        if (data['version'] in (installed_version, state.get('rejected'))
+                or entry['digest'] == state['digests'].get(running)):
+            return None
+        slot = other(running)
+        print(f"Firmware {data['version']} available, installing into slot {slot}")
+        d.expected = entry['size']
+        d.fetch_file(entry['url'], _path(slot, ext), entry['size'], entry['digest'])
+        # import looks for .py first, so never keep both
+        _remove(_path(slot, '.py' if ext == '.mpy' else '.mpy'))
+        state['trial'] = slot
+        state['tries'] = 0
+        state['versions'][slot] = data['version']
+        state['digests'][slot] = entry['digest']
+        save(state)
+    finally:
+        d.close()
+    d.stats.report()
+    return data['version']
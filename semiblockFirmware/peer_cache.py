@@ -0,0 +1,271 @@
+"""LAN peer cache: boards on the same AP share a project instead of each
+downloading it from the cloud.
+
+A board that has just installed a project can keep its files available
+for a while: start() answers discovery broadcasts for that device code
+and serves the files over HTTP (getAsset with Range) on a _thread, next
+to the app. fetch_project() asks the LAN first, then takes the manifest
+from the cloud as always and downloads each file from the peer, falling
+back to the cloud for any file the peer cannot send:
+
+    board -> broadcast   SBQ1 <device code>
+    peer  -> board       SBA1 <device code> <http port>
+
+A peer only supplies bytes. Every file is checked against the digest in
+the cloud's manifest, and files the cloud lists without a digest are
+never asked from a peer, so a host that answers SBQ1 cannot get anything
+onto the board that the cloud did not publish. A cloud without manifest
+support gets the usual streamed download, with no peer involved.
+"""
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+try:
+    from time import ticks_ms, ticks_diff, sleep_ms
+except ImportError:
+    from time import monotonic, sleep
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+    def sleep_ms(ms):
+        sleep(ms / 1000)
+
+import app_cache
+import asset_cache
+import downloader
+
+ENABLED = True
+PEER_PORT = 50505
+HTTP_PORT = 8266
+BROADCAST = '255.255.255.255'
+
+# How long a board waits for a peer to answer before going to the cloud
+WAIT_MS = 400
+
+# After an install, keep serving this long, and this long after the last request
+SHARE_MS = 60000
+IDLE_MS = 15000
+
+# Peer downloads give up quickly; the cloud is always there
+PEER_RETRIES = 1
+
+CHUNK = 1024
+
+# Serving reads files and sockets only; a little over the default thread stack
+STACK = 12 * 1024
+
+# Filled in by serve(): connections, requests and bytes sent
+stats = {'connections': 0, 'requests': 0, 'bytes': 0}
+
+_SO_BROADCAST = getattr(socket, 'SO_BROADCAST', 0x20)
+
+
+def find_peer(device_code, wait_ms=WAIT_MS):
+    """(ip, http port) of a board sharing device_code, or None"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.setsockopt(socket.SOL_SOCKET, _SO_BROADCAST, 1)
+        s.settimeout(0.1)
+        query = b'SBQ1 ' + device_code.encode()
+        start = ticks_ms()
+        sent = None
+        while ticks_diff(ticks_ms(), start) < wait_ms:
+            if sent is None or ticks_diff(ticks_ms(), sent) >= 150:
+                # UDP can drop, so ask again a few times within wait_ms
+                s.sendto(query, (BROADCAST, PEER_PORT))
+                sent = ticks_ms()
+            try:
+                data, addr = s.recvfrom(64)
+            except OSError:
+                continue
+            parts = data.split()
+            if len(parts) == 3 and parts[0] == b'SBA1' and parts[1].decode() == device_code:
+                return addr[0], int(parts[2])
+    except OSError as e:
+        print(f"Peer discovery failed: {e}")
+    finally:
+        s.close()
+    return None
+
+
+def fetch_project(url, device_code, code_path='user_app.tmp', on_image=None, on_progress=None,
+                  manifest=None, idle=None, stage=None):
+    """downloader.fetch_project with a LAN peer, if there is one, as the mirror for the files.
+
+    The third value (a downloader.Stats) gets a source attribute: 'peer' if
+    any file came from the peer, else 'cloud'.
+    """
+    peer = find_peer(device_code) if ENABLED else None
+    mirror = None
+    if peer:
+        print(f"Peer {peer[0]}:{peer[1]} has project {device_code}")
+        prefix = '/api/getAsset?deviceCode=%s&file=' % device_code
+        mirror = ('http://%s:%d' % peer, lambda name: prefix + name)
+    status, project, st = downloader.fetch_project(
+        url, code_path, on_image, on_progress, manifest, idle, stage, mirror=mirror)
+    st.source = 'peer' if st.mirrored else 'cloud'
+    return status, project, st
+
+
+class Share:
+    """What a board offers its peers: the files of one installed project, by name"""
+
+    def __init__(self, device_code, project, app_digest):
+        self.device_code = device_code
+        self.files = {}  # name in getAsset -> local path
+        assets = asset_cache.load()
+        for name, size in project.images + project.unchanged:
+            if name in assets:
+                self.files[name + '.png'] = name + '.png'
+        app = app_cache.cached(app_digest)
+        if app:
+            # the app cache keeps the source or the .mpy; a peer that wants the other asks the cloud
+            self.files['code.py' if app.endswith('.py') else 'code.mpy'] = app
+
+
+def _query(path):
+    """'/api/x?a=1&b=2' -> ('/api/x', {'a': '1', 'b': '2'})"""
+    route, _, qs = path.partition('?')
+    args = {}
+    for pair in qs.split('&'):
+        k, _, v = pair.partition('=')
+        if k:
+            args[k] = v
+    return route, args
+
+
+def _send(conn, data):
+    write = getattr(conn, 'write', None) or conn.sendall
+    write(data)
+
+
+def _head(conn, status, length, extra=''):
+    _send(conn, ('HTTP/1.1 %s\r\nContent-Length: %d\r\n%s\r\n' % (status, length, extra)).encode())
+
+
+def _respond(conn, share, path, headers):
+    route, args = _query(path)
+    local = None
+    if route == '/api/getAsset' and args.get('deviceCode') == share.device_code:
+        local = share.files.get(args.get('file'))
+    size = asset_cache.file_size(local) if local else -1
+    if size < 0:
+        _head(conn, '404 Not Found', 0)
+        return
+    start = 0
+    spec = headers.get('range', '')
+    if spec.startswith('bytes='):
+        start = int(spec[6:].split('-')[0] or 0)
+    if start:
+        _head(conn, '206 Partial Content', size - start, 'Content-Range: bytes %d-%d/%d\r\n' % (start, size - 1, size))
+    else:
+        _head(conn, '200 OK', size, 'Accept-Ranges: bytes\r\n')
+    buf = bytearray(CHUNK)
+    with open(local, 'rb') as f:
+        f.seek(start)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            _send(conn, bytes(buf[:n]))
+            stats['bytes'] += n
+
+
+def _handle(conn, share):
+    """Answer requests on one kept-alive connection. Returns when the peer is done."""
+    stats['connections'] += 1
+    stream = conn if hasattr(conn, 'readline') else conn.makefile('rb')
+    try:
+        while True:
+            line = stream.readline()
+            if not line:
+                break
+            headers = {}
+            while True:
+                h = stream.readline()
+                if not h or h == b'\r\n':
+                    break
+                k, _, v = h.decode().partition(':')
+                headers[k.strip().lower()] = v.strip()
+            stats['requests'] += 1
+            _respond(conn, share, line.split()[1].decode(), headers)
+            if headers.get('connection', '').lower() == 'close':
+                break
+    except (OSError, IndexError, ValueError):
+        pass
+    finally:
+        if stream is not conn:
+            stream.close()
+        conn.close()
+
+
+def serve(share, share_ms=SHARE_MS, idle_ms=IDLE_MS, port=HTTP_PORT):
+    """Offer share on the LAN for share_ms, and idle_ms past the last request. Blocks."""
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    udp.bind(('0.0.0.0', PEER_PORT))
+    udp.settimeout(0)
+    tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    tcp.bind(('0.0.0.0', port))
+    tcp.listen(2)
+    tcp.settimeout(0)
+    query = b'SBQ1 ' + share.device_code.encode()
+    answer = b'SBA1 ' + share.device_code.encode() + b' ' + str(port).encode()
+    print(f"Sharing project {share.device_code} with peers on port {port}")
+    start = last = ticks_ms()
+    try:
+        while ticks_diff(ticks_ms(), start) < share_ms or ticks_diff(ticks_ms(), last) < idle_ms:
+            busy = False
+            try:
+                data, addr = udp.recvfrom(64)
+                if data == query:
+                    udp.sendto(answer, addr)
+                busy = True
+            except OSError:
+                pass
+            try:
+                conn, addr = tcp.accept()
+            except OSError:
+                conn = None
+            if conn is not None:
+                conn.settimeout(5)
+                _handle(conn, share)
+                last = ticks_ms()
+                busy = True
+            if not busy:
+                sleep_ms(50)
+    finally:
+        udp.close()
+        tcp.close()
+    print(f"Peer sharing done: {stats['requests']} requests on {stats['connections']} connections, "
+          f"{stats['bytes']} bytes")
+
+
+def _run(share, share_ms, idle_ms, port):
+    try:
+        serve(share, share_ms, idle_ms, port)
+    except Exception as e:
+        print(f"Peer sharing stopped: {e}")
+
+
+def start(share, share_ms=SHARE_MS, idle_ms=IDLE_MS, port=HTTP_PORT):
+    """Run serve() on a _thread, so the app can start right away"""
+    import _thread
+    try:
+        old = _thread.stack_size(STACK)
+    except (AttributeError, ValueError):
+        old = None
+    try:
+        _thread.start_new_thread(_run, (share, share_ms, idle_ms, port))
+    except (RuntimeError, OSError, MemoryError) as e:
+        print(f"Peer sharing not started: {e}")
+    finally:
+        if old is not None:
+            _thread.stack_size(old)
@@ -0,0 +1,132 @@
+"""Boot phase profiler.
+
+Records named spans with ticks_us() into a ring buffer allocated once at
+import, so profiling does not disturb the heap it is measuring.
+
+    import profiler
+    profiler.begin('display.init')
+    display.init()
+    profiler.end()
+
+    with profiler.span('wlan.connect'):
+        ...
+
+    profiler.dump()   # one 'PROFILE {...}' JSON line on the REPL
+
+tools/boot_timeline.py turns that line into a timeline chart.
+"""
+from array import array
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+SIZE = 64
+MAX_DEPTH = 8
+
+enabled = True
+
+_names = [None] * SIZE
+_start = array('i', [0] * SIZE)
+_dur = array('i', [0] * SIZE)
+_depth = bytearray(SIZE)
+_count = 0
+_stack = array('i', [0] * MAX_DEPTH)  # ring slots of the open spans
+_open = 0
+_overflow = 0  # begin() calls past MAX_DEPTH, not recorded; their end() pops nothing
+_base = ticks_us()
+
+
+def reset():
+    global _count, _open, _overflow, _base
+    _count = 0
+    _open = 0
+    _overflow = 0
+    _base = ticks_us()
+
+
+def begin(name):
+    """Open a span. Spans nest up to MAX_DEPTH deep; deeper ones are not recorded."""
+    global _count, _open, _overflow
+    if not enabled:
+        return
+    if _open >= MAX_DEPTH:
+        _overflow += 1
+        return
+    i = _count % SIZE
+    _names[i] = name
+    _start[i] = ticks_diff(ticks_us(), _base)
+    _dur[i] = -1
+    _depth[i] = _open
+    _stack[_open] = i
+    _open += 1
+    _count += 1
+
+
+def end():
+    """Close the innermost open span"""
+    global _open, _overflow
+    if not enabled:
+        return
+    if _overflow:
+        _overflow -= 1
+        return
+    if _open == 0:
+        return
+    _open -= 1
+    i = _stack[_open]
+    _dur[i] = ticks_diff(ticks_us(), _base) - _start[i]
+
+
+def mark(name):
+    """Zero-length span, for events like 'first frame'"""
+    begin(name)
+    end()
+
+
+class _Span:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        end()
+
+
+_span = _Span()
+
+
+def span(name):
+    """Context manager version of begin()/end()"""
+    begin(name)
+    return _span
+
+
+def spans():
+    """Recorded spans, oldest first, as (name, start_us, dur_us, depth)"""
+    first = max(0, _count - SIZE)
+    out = []
+    for n in range(first, _count):
+        i = n % SIZE
+        out.append((_names[i], _start[i], _dur[i], _depth[i]))
+    return out
+
+
+def dump():
+    """Print the spans as one JSON line prefixed with PROFILE"""
+    import json
+    rows = [{'name': n, 'start': s, 'dur': d, 'depth': k} for n, s, d, k in spans()]
+    print('PROFILE ' + json.dumps({'unit': 'us', 'dropped': max(0, _count - SIZE), 'spans': rows}))
+
+
+def report():
+    """Print the spans as an indented table"""
+    for name, start, dur, depth in spans():
+        took = '%9.1f ms' % (dur / 1000) if dur >= 0 else '     open'
+        print('%9.1f ms %s %s%s' % (start / 1000, took, '  ' * depth, name))
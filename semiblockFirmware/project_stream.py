@@ -0,0 +1,632 @@
+import gc
+
+try:
+    import ubinascii as binascii
+except ImportError:
+    import binascii
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+import asset_cache
+import netcache
+from staging import BlockWriter
+
+# Size of each socket read and of each base64 decode step.
+# Peak memory of a download is a small multiple of this, whatever the payload size.
+CHUNK = 1024
+
+# Longest string we keep in RAM (names, messages). Longer ones are skipped.
+MAX_VALUE = 256
+
+# While waiting for data with an idle callback, poll the socket this often
+IDLE_MS = 10
+
+
+def mem_used():
+    """Bytes currently allocated on the MicroPython heap (0 on CPython)"""
+    try:
+        return gc.mem_alloc()
+    except AttributeError:
+        return 0
+
+
+def send(sock, data):
+    # MicroPython (and its TLS sockets) use write(), CPython sockets sendall()
+    write = getattr(sock, 'write', None) or sock.sendall
+    write(data)
+
+
+def split_url(url):
+    """Split http(s)://host[:port]/path into (scheme, host, port, path)"""
+    scheme, _, rest = url.partition('://')
+    host, slash, path = rest.partition('/')
+    path = slash + path if slash else '/'
+    port = 443 if scheme == 'https' else 80
+    if ':' in host:
+        host, port = host.split(':', 1)
+        port = int(port)
+    return scheme, host, port, path
+
+
+class ChunkedReader:
+    """Decode HTTP chunked transfer encoding from a stream"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.left = 0
+        self.done = False
+
+    def read(self, n):
+        if self.done:
+            return b''
+        if self.left == 0:
+            line = self.stream.readline()
+            size = int(line.split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                # skip trailers up to the blank line, so a kept-alive
+                # connection is left at the next response
+                while line and line != b'\r\n':
+                    line = self.stream.readline()
+                self.done = True
+                return b''
+            self.left = size
+        data = self.stream.read(min(n, self.left))
+        if not data:
+            self.done = True
+            return b''
+        self.left -= len(data)
+        if self.left == 0:
+            self.stream.readline()  # CRLF after each chunk
+        return data
+
+
+class LimitedReader:
+    """Stop reading after Content-Length bytes"""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.left = length
+
+    def read(self, n):
+        if self.left <= 0:
+            return b''
+        data = self.stream.read(min(n, self.left))
+        self.left -= len(data)
+        return data
+
+
+class Response:
+    def __init__(self, sock, stream, status, headers, timeout=20):
+        self.sock = sock
+        self.raw = stream
+        self.status_code = status
+        self.headers = headers
+        self.timeout = timeout
+        # Called every IDLE_MS while no data has arrived, e.g. lv.task_handler
+        self.idle = None
+        self._poll = None
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            self.body = ChunkedReader(stream)
+        elif 'content-length' in headers:
+            self.body = LimitedReader(stream, int(headers['content-length']))
+        else:
+            self.body = stream
+
+    def read(self, n):
+        if self.idle and self.raw is self.sock:
+            self._wait()
+        return self.body.read(n)
+
+    def _wait(self):
+        # Only for unbuffered (MicroPython) sockets: a CPython makefile() may
+        # already hold data that poll() cannot see.
+        if self._poll is None:
+            import select
+            self._poll = select.poll()
+            self._poll.register(self.sock, select.POLLIN)
+        for _ in range(self.timeout * 1000 // IDLE_MS):
+            if self._poll.poll(IDLE_MS):
+                return
+            self.idle()
+
+    def close(self):
+        netcache.release(self.sock)
+
+
+def open_connection(scheme, host, port, timeout=20):
+    """Connected (and for https, TLS-wrapped) socket plus a stream to read it by line.
+
+    Goes through netcache: cached DNS, reused TLS session, or the connection
+    netcache.warm() opened ahead of time.
+    """
+    return netcache.connect(scheme, host, port, timeout)
+
+
+def send_request(sock, stream, host, path, headers=None, keep_alive=False, timeout=20):
+    """Send a GET on an open connection and read the status line and headers"""
+    req = 'GET %s HTTP/1.1\r\nHost: %s\r\nConnection: %s\r\n' % (
+        path, host, 'keep-alive' if keep_alive else 'close')
+    if headers:
+        for k in headers:
+            req += '%s: %s\r\n' % (k, headers[k])
+    send(sock, req.encode() + b'\r\n')
+    line = stream.readline()
+    if not line:
+        raise OSError('connection closed')
+    status = int(line.split(None, 2)[1])
+    hdrs = {}
+    while True:
+        line = stream.readline()
+        if not line or line == b'\r\n':
+            break
+        k, _, v = line.decode().partition(':')
+        hdrs[k.strip().lower()] = v.strip()
+    return Response(sock, stream, status, hdrs, timeout)
+
+
+def http_get(url, headers=None, timeout=20):
+    """Send a GET and return a Response whose body can be read piece by piece"""
+    scheme, host, port, path = split_url(url)
+    sock, stream = open_connection(scheme, host, port, timeout)
+    try:
+        return send_request(sock, stream, host, path, headers, False, timeout)
+    except Exception:
+        netcache.release(sock)
+        raise
+
+
+class Base64FileSink:
+    """Decode base64 text (optionally a data: URI) into a file, CHUNK bytes at a time"""
+
+    def __init__(self, path, hasher=None):
+        self.path = path
+        self.f = BlockWriter(path)
+        self.pending = b''
+        self.in_header = None  # None = undecided, True = skipping "data:...,"
+        self.size = 0
+        self.hasher = hasher
+
+    def write(self, data):
+        if self.in_header is None:
+            self.pending += data
+            if len(self.pending) < 5:
+                return
+            data, self.pending = self.pending, b''
+            self.in_header = data.startswith(b'data:')
+        if self.in_header:
+            comma = data.find(b',')
+            if comma < 0:
+                return
+            data = data[comma + 1:]
+            self.in_header = False
+        if b'\n' in data:
+            data = data.replace(b'\n', b'').replace(b'\r', b'')
+        data = self.pending + data if self.pending else data
+        cut = len(data) & ~3
+        pos = 0
+        step = CHUNK & ~3
+        while pos < cut:
+            end = min(pos + step, cut)
+            self._out(binascii.a2b_base64(data[pos:end]))
+            pos = end
+        self.pending = data[cut:]
+
+    def close(self):
+        if self.in_header is None and self.pending:
+            data, self.pending = self.pending, b''
+            self.in_header = False
+            self.write(data)
+        if self.pending:
+            self._out(binascii.a2b_base64(self.pending))
+            self.pending = b''
+        self.f.close()
+
+    def _out(self, out):
+        self.f.write(out)
+        self.size += len(out)
+        if self.hasher:
+            self.hasher.update(out)
+
+
+class FileSink:
+    """Write a JSON string value straight to a file as UTF-8"""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = BlockWriter(path)
+        self.size = 0
+
+    def write(self, data):
+        self.f.write(data)
+        self.size += len(data)
+
+    def close(self):
+        self.f.close()
+
+
+class ValueSink:
+    """Keep a short string value in RAM, dropping anything past MAX_VALUE"""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        if self.size < MAX_VALUE:
+            self.parts.append(data[:MAX_VALUE - self.size])
+        self.size += len(data)
+
+    def close(self):
+        pass
+
+    def value(self):
+        return b''.join(self.parts).decode()
+
+
+_ESCAPES = {
+    ord('"'): b'"', ord('\\'): b'\\', ord('/'): b'/', ord('b'): b'\b',
+    ord('f'): b'\f', ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t',
+}
+
+
+class JsonStream:
+    """Incremental JSON reader over a stream with read(n).
+
+    Walks the document once without building it. Every value is reported to
+    the handler together with its path (list of keys and array indexes).
+    String values are pushed to a sink chosen by the handler, so a large
+    string never has to sit in memory.
+    """
+
+    def __init__(self, stream, handler, chunk=CHUNK):
+        self.stream = stream
+        self.handler = handler
+        self.chunk = chunk
+        self.buf = b''
+        self.pos = 0
+        self.total = 0
+        self.peak = mem_used()
+
+    def _fill(self):
+        self.buf = b''  # let the old chunk go before reading the next one
+        self.buf = self.stream.read(self.chunk)
+        self.pos = 0
+        if not self.buf:
+            raise ValueError('unexpected end of JSON')
+        self.total += len(self.buf)
+        used = mem_used()
+        if used > self.peak:
+            self.peak = used
+        progress = getattr(self.handler, 'progress', None)
+        if progress:
+            progress(self.total)
+
+    def _peek(self):
+        # next non-whitespace byte, not consumed
+        while True:
+            if self.pos >= len(self.buf):
+                self._fill()
+            c = self.buf[self.pos]
+            if c in (0x20, 0x0A, 0x0D, 0x09):
+                self.pos += 1
+            else:
+                return c
+
+    def _take(self):
+        c = self._peek()
+        self.pos += 1
+        return c
+
+    def _raw(self):
+        if self.pos >= len(self.buf):
+            self._fill()
+        c = self.buf[self.pos]
+        self.pos += 1
+        return c
+
+    def _expect(self, c):
+        got = self._take()
+        if got != c:
+            raise ValueError('expected %r got %r' % (chr(c), chr(got)))
+
+    def parse(self):
+        self._value([])
+
+    def _value(self, path):
+        c = self._peek()
+        if c == 0x7B:  # {
+            self._object(path)
+        elif c == 0x5B:  # [
+            self._array(path)
+        elif c == 0x22:  # "
+            self.pos += 1
+            sink = self.handler.sink(path)
+            self._string(sink)
+            sink.close()
+            if isinstance(sink, ValueSink):
+                self.handler.value(path, sink.value())
+            else:
+                self.handler.value(path, sink)
+        else:
+            self.handler.value(path, self._scalar())
+
+    def _object(self, path):
+        self._expect(0x7B)
+        if self._peek() == 0x7D:
+            self.pos += 1
+            self.handler.end(path)
+            return
+        while True:
+            self._expect(0x22)
+            key = ValueSink()
+            self._string(key)
+            self._expect(0x3A)  # :
+            path.append(key.value())
+            self._value(path)
+            path.pop()
+            c = self._take()
+            if c == 0x7D:  # }
+                break
+            if c != 0x2C:
+                raise ValueError('bad object')
+        self.handler.end(path)
+
+    def _array(self, path):
+        self._expect(0x5B)
+        if self._peek() == 0x5D:
+            self.pos += 1
+            return
+        i = 0
+        while True:
+            path.append(i)
+            self._value(path)
+            path.pop()
+            i += 1
+            c = self._take()
+            if c == 0x5D:  # ]
+                break
+            if c != 0x2C:
+                raise ValueError('bad array')
+
+    def _scalar(self):
+        out = b''
+        while True:
+            if self.pos >= len(self.buf):
+                self._fill()
+            c = self.buf[self.pos]
+            if c in (0x2C, 0x7D, 0x5D, 0x20, 0x0A, 0x0D, 0x09):
+                break
+            out += bytes((c,))
+            self.pos += 1
+        if out == b'true':
+            return True
+        if out == b'false':
+            return False
+        if out == b'null':
+            return None
+        if b'.' in out or b'e' in out or b'E' in out:
+            return float(out)
+        return int(out)
+
+    def _string(self, sink):
+        # Opening quote already consumed. Copy runs between escapes in one go.
+        while True:
+            if self.pos >= len(self.buf):
+                self._fill()
+            buf = self.buf
+            q = buf.find(b'"', self.pos)
+            end = q if q >= 0 else len(buf)
+            b = buf.find(b'\\', self.pos, end)
+            if b >= 0:
+                end = b
+            if end > self.pos:
+                sink.write(buf[self.pos:end])
+            self.pos = end
+            if b >= 0:
+                self.pos += 1
+                self._escape(sink)
+            elif q >= 0:
+                self.pos += 1
+                return
+
+    def _escape(self, sink):
+        c = self._raw()
+        if c != 0x75:  # not \u
+            sink.write(_ESCAPES.get(c, bytes((c,))))
+            return
+        code = self._hex4()
+        if 0xD800 <= code < 0xDC00:
+            # surrogate pair
+            if self._raw() == 0x5C and self._raw() == 0x75:
+                low = self._hex4()
+                code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+        sink.write(chr(code).encode())
+
+    def _hex4(self):
+        h = bytes((self._raw(), self._raw(), self._raw(), self._raw()))
+        return int(h, 16)
+
+
+class ProjectHandler:
+    """Handler for the getProject reply.
+
+    data.code is written to code_path and every data.images[].image_data is
+    decoded into its own file, renamed to <name>.png once the image object ends.
+    data.mpy, if the server compiled the code, is decoded next to code_path.
+
+    With a manifest (see asset_cache) every image is hashed while it is decoded.
+    Images the server marks "cached", or whose digest matches what is already
+    on flash, leave the existing file untouched.
+
+    With a staging.Stage images go into the stage instead of replacing the
+    files on flash, and one whose digest differs from the server's is an error.
+    """
+
+    def __init__(self, code_path='user_app.tmp', on_image=None, on_progress=None, manifest=None,
+                 stage=None):
+        self.code_path = code_path
+        self.on_image = on_image
+        self.progress = on_progress
+        self.manifest = manifest
+        self.stage = stage
+        self.success = False
+        self.code_size = -1
+        self.code_digest = None
+        self.mpy_path = None
+        self.images = []
+        self.unchanged = []
+        self.error = None
+        self._reset_image()
+
+    def _reset_image(self):
+        self._name = None
+        self._tmp = None
+        self._cached = False
+        self._digest = None
+
+    def sink(self, path):
+        n = len(path)
+        if n == 2 and path[0] == 'data' and path[1] == 'code':
+            return FileSink(self.code_path)
+        if n == 2 and path[0] == 'data' and path[1] == 'mpy':
+            return Base64FileSink(self.code_path.rsplit('.', 1)[0] + '.mpy.tmp')
+        if n == 4 and path[1] == 'images' and path[3] == 'image_data':
+            tmp = '_img%d.tmp' % path[2]
+            if self.stage:
+                tmp = self.stage.path(tmp)
+            hashed = self.manifest is not None or self.stage is not None
+            return Base64FileSink(tmp, asset_cache.new_hasher() if hashed else None)
+        return ValueSink()
+
+    def value(self, path, v):
+        n = len(path)
+        if n == 1:
+            if path[0] == 'success':
+                self.success = v is True
+            elif path[0] in ('error', 'message'):
+                self.error = v
+        elif n == 2 and path[1] == 'code':
+            self.code_size = getattr(v, 'size', -1)
+        elif n == 2 and path[1] == 'mpy' and hasattr(v, 'path'):
+            self.mpy_path = v.path
+        elif n == 4 and path[1] == 'images':
+            if path[3] == 'name':
+                self._name = v
+            elif path[3] == 'image_data':
+                self._tmp = v
+            elif path[3] == 'cached':
+                self._cached = v is True
+            elif path[3] == 'digest':
+                self._digest = v
+
+    def end(self, path):
+        if len(path) == 3 and path[1] == 'images':
+            tmp, name, cached, expected = self._tmp, self._name, self._cached, self._digest
+            self._reset_image()
+            manifest = self.manifest
+            if tmp is None:
+                if not cached:
+                    return
+                entry = manifest.get(name) if manifest is not None else None
+                if entry is None or asset_cache.file_size('%s.png' % name) != entry[1]:
+                    # installing without it would leave the app without its image
+                    self.error = 'server skipped %s but it is not on flash' % name
+                    raise ValueError(self.error)
+                self._keep(name, entry[1])
+                return
+            if name is None:
+                os.remove(tmp.path)
+                return
+            target = '%s.png' % name
+            digest = asset_cache.hexdigest(tmp.hasher) if tmp.hasher else None
+            if digest and expected and digest != expected:
+                os.remove(tmp.path)
+                self.error = '%s does not match its digest' % target
+                raise ValueError(self.error)
+            if manifest is not None:
+                entry = manifest.get(name)
+                if entry and entry[0] == digest and asset_cache.file_size(target) == tmp.size:
+                    os.remove(tmp.path)
+                    self._keep(name, tmp.size)
+                    return
+                manifest[name] = [digest, tmp.size]
+            if self.stage:
+                self.stage.place(tmp.path, target, digest, tmp.size)
+            else:
+                try:
+                    os.remove(target)
+                except OSError:
+                    pass
+                os.rename(tmp.path, target)
+            self.images.append((name, tmp.size))
+            if self.on_image:
+                self.on_image(name, tmp.size)
+
+    def _keep(self, name, size):
+        self.unchanged.append((name, size))
+        print(f"{name}.png unchanged, kept cached copy")
+
+
+def fetch_project(url, code_path='user_app.tmp', on_image=None, on_progress=None, manifest=None,
+                  accept_bundle=True, idle=None, stage=None):
+    """Stream a getProject reply to flash. Returns (status, result, stats).
+
+    Pass an asset_cache manifest to send the digests already on flash and
+    skip images that did not change. The manifest is updated in place.
+
+    With accept_bundle the server may answer with a binary bundle (see
+    bundle.py) instead of JSON; result and stats then are the same
+    bundle.Unpacker, which has the fields of both ProjectHandler and JsonStream.
+
+    on_progress(done, length) is called after every chunk; length is the
+    Content-Length or -1. idle is called while the socket has no data, so the
+    caller can keep its UI running during network stalls. With a stage
+    (staging.Stage) images are staged for stage.commit() rather than
+    written over the ones on flash; code_path should then be in the stage too.
+    """
+    gc.collect()
+    url, headers = project_request(url, manifest, accept_bundle)
+    response = http_get(url, headers)
+    response.idle = idle
+    try:
+        return read_project(response, code_path, on_image, on_progress, manifest, stage)
+    finally:
+        response.close()
+
+
+def project_request(url, manifest=None, accept_bundle=True):
+    """(url, headers) of a getProject request: the have= digests and the Accept header"""
+    if manifest:
+        url += ('&' if '?' in url else '?') + 'have=' + asset_cache.have_param(manifest)
+    headers = None
+    if accept_bundle:
+        import bundle
+        headers = {'Accept': bundle.CONTENT_TYPE + ', application/json'}
+    return url, headers
+
+
+def read_project(response, code_path='user_app.tmp', on_image=None, on_progress=None, manifest=None,
+                 stage=None):
+    """Stream a getProject response (JSON or bundle) to flash, as fetch_project does.
+
+    Returns (status, result, stats) and leaves the response open.
+    """
+    length = int(response.headers.get('content-length', -1))
+    progress = None
+    if on_progress:
+        def progress(done):
+            on_progress(done, length)
+    if response.headers.get('content-type', '').startswith('application/x-semiblock-bundle'):
+        import bundle
+        unpacker = bundle.Unpacker(response, code_path, on_image, progress, manifest, stage)
+        if response.status_code == 200:
+            unpacker.unpack()
+        return response.status_code, unpacker, unpacker
+    handler = ProjectHandler(code_path, on_image, progress, manifest, stage)
+    parser = JsonStream(response, handler)
+    if response.status_code == 200:
+        parser.parse()
+    return response.status_code, handler, parser
@@ -0,0 +1,374 @@
+"""Push-deploy: install an app straight from a laptop on the LAN.
+
+A small blocking HTTP server on its own _thread, so it keeps listening
+while the firmware UI or a user app owns the main loop:
+
+    GET  /status   {"pending": app digest or null, "assets": {name: [digest, size]}}
+    POST /push     the app, then the board starts it
+
+The body of /push is either a bundle (Content-Type
+application/x-semiblock-bundle, see bundle.py and tools/push.py) or
+multipart/form-data with one .py (the app), optionally its .mpy, and any
+number of .png files:
+
+    curl -F f=@flippybird.py -F f=@semiblockGames.png http://<board>:8080/push
+
+A pushed app is started in the running firmware (launcher.py) when the
+firmware UI is up and has set launch; the display, touch and WiFi stay as
+they are. While an app runs, it owns the main loop and there is no safe
+point to swap it from this thread, so the board resets into the new app,
+which then starts straight from the boot path.
+
+The upload is streamed into a staging.Stage with digest checks, never held
+in RAM, and committed like a cloud download. While the firmware is
+installing a download there is no stage to push into, and /push answers
+409 Conflict. Images already on flash with
+the same digest are not rewritten; tools/push.py reads /status so it does
+not even send them.
+
+Anyone on the LAN can replace the app, so this is for development: it is
+off unless the firmware sets PUSH_DEPLOY, and TOKEN (sent as X-Push-Token)
+can be set to something only the laptop knows.
+"""
+import json
+
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+try:
+    from time import ticks_ms, ticks_diff, sleep_ms
+except ImportError:
+    from time import monotonic, sleep
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+    def sleep_ms(ms):
+        sleep(ms / 1000)
+
+import app_cache
+import asset_cache
+import bundle
+import staging
+from project_stream import send
+from staging import BlockWriter
+
+PORT = 8080
+TOKEN = None
+
+# Called on this server's thread with the digest of each pushed app, instead of
+# restart(). The firmware UI sets it while it can launch apps in-process.
+launch = None
+
+# How long start() waits for WiFi before giving up
+WIFI_WAIT_MS = 30000
+
+CHUNK = 1024
+
+# Filled in by each push: bytes received, files written and skipped, timings in ms
+stats = {}
+
+
+class Multipart:
+    """Stream the parts of a multipart/form-data body without buffering a whole part"""
+
+    def __init__(self, stream, boundary):
+        self.stream = stream
+        self.delim = b'\r\n--' + boundary
+        # the first boundary has no CRLF in front of it
+        self.buf = b'\r\n'
+
+    def _fill(self):
+        data = self.stream.read(CHUNK)
+        if not data:
+            raise ValueError('upload truncated')
+        self.buf += data
+
+    def _take_line(self):
+        while b'\r\n' not in self.buf:
+            self._fill()
+        line, _, self.buf = self.buf.partition(b'\r\n')
+        return line
+
+    def next(self):
+        """Headers of the next part (lower-case keys), or None after the last one"""
+        while len(self.buf) < len(self.delim) + 2:
+            self._fill()
+        if not self.buf.startswith(self.delim):
+            raise ValueError('bad multipart boundary')
+        self.buf = self.buf[len(self.delim):]
+        if self.buf.startswith(b'--'):
+            return None
+        self._take_line()  # rest of the boundary line
+        headers = {}
+        while True:
+            line = self._take_line()
+            if not line:
+                return headers
+            k, _, v = line.decode().partition(':')
+            headers[k.strip().lower()] = v.strip()
+
+    def copy(self, out):
+        """Write the body of the current part to out, up to the next boundary"""
+        keep = len(self.delim) - 1
+        while True:
+            i = self.buf.find(self.delim)
+            if i >= 0:
+                out.write(self.buf[:i])
+                self.buf = self.buf[i:]
+                return
+            if len(self.buf) > keep:
+                out.write(self.buf[:-keep])
+                self.buf = self.buf[-keep:]
+            self._fill()
+
+
+def _param(header, key):
+    """Value of key="..." (or key=...) in a header like Content-Disposition"""
+    for item in header.split(';'):
+        k, _, v = item.strip().partition('=')
+        if k == key:
+            return v.strip('"')
+    return None
+
+
+class Push:
+    """One upload: files go into a Stage and are checked before commit()"""
+
+    def __init__(self):
+        self.stage = staging.Stage()
+        self.code_path = self.stage.path('user_app.tmp')
+        self.manifest = asset_cache.load()
+        self.code_digest = None
+        self.mpy_path = None
+        self.written = 0
+        self.unchanged = 0
+
+    def bundle(self, stream):
+        u = bundle.Unpacker(stream, self.code_path, manifest=self.manifest, stage=self.stage).unpack()
+        if u.error:
+            raise ValueError(u.error)
+        if not u.success:
+            raise ValueError('bundle has no code')
+        self.code_digest = u.code_digest
+        self.mpy_path = u.mpy_path
+        self.written = len(u.images) + 1
+        self.unchanged = len(u.unchanged)
+
+    def multipart(self, stream, boundary):
+        parts = Multipart(stream, boundary)
+        while True:
+            headers = parts.next()
+            if headers is None:
+                break
+            name = _param(headers.get('content-disposition', ''), 'filename')
+            if not name:
+                parts.copy(_Discard())  # a plain form field
+                continue
+            name = name.rsplit('/', 1)[-1]
+            if name.endswith('.py'):
+                if self.code_digest:
+                    raise ValueError('more than one .py in the upload')
+                self.code_digest = self._write(parts, self.code_path)[0]
+            elif name.endswith('.mpy'):
+                self.mpy_path = bundle.mpy_path(self.code_path)
+                self._write(parts, self.mpy_path)
+            elif name.endswith('.png'):
+                self._asset(parts, name)
+            else:
+                parts.copy(_Discard())
+        if not self.code_digest:
+            raise ValueError('upload has no .py')
+
+    def _write(self, parts, path):
+        hasher = asset_cache.new_hasher()
+        with BlockWriter(path, hasher=hasher) as f:
+            parts.copy(f)
+            size = f.size
+        self.written += 1
+        return asset_cache.hexdigest(hasher), size
+
+    def _asset(self, parts, target):
+        path = self.stage.path(target)
+        digest, size = self._write(parts, path)
+        entry = self.manifest.get(target[:-4])
+        if entry and entry[0] == digest and asset_cache.file_size(target) == size:
+            staging._remove(path)
+            self.written -= 1
+            self.unchanged += 1
+            return
+        self.stage.add(target, digest, size)
+
+    def commit(self):
+        return self.stage.commit(self.code_path, self.mpy_path, self.code_digest)
+
+
+class _Discard:
+    def write(self, data):
+        return len(data)
+
+
+def _reply(conn, status, obj):
+    body = json.dumps(obj).encode()
+    send(conn, b'HTTP/1.1 %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n'
+               b'Connection: close\r\n\r\n' % (status.encode(), len(body)) + body)
+
+
+def _status():
+    try:
+        with open(app_cache.PENDING) as f:
+            pending = f.read().split()[0]
+    except (OSError, IndexError):
+        pending = None
+    return {'pending': pending, 'assets': asset_cache.load()}
+
+
+def handle(conn, stream):
+    """Answer one request. Returns the app digest after a successful push, else None."""
+    line = stream.readline()
+    if not line:
+        return None
+    headers = {}
+    while True:
+        h = stream.readline()
+        if not h or h == b'\r\n':
+            break
+        k, _, v = h.decode().partition(':')
+        headers[k.strip().lower()] = v.strip()
+    method, path = line.decode().split()[:2]
+    if TOKEN and headers.get('x-push-token') != TOKEN:
+        _reply(conn, '403 Forbidden', {'error': 'bad token'})
+        return None
+    if method == 'GET' and path == '/status':
+        _reply(conn, '200 OK', _status())
+        return None
+    if method not in ('POST', 'PUT') or path != '/push':
+        _reply(conn, '404 Not Found', {'error': 'unknown route'})
+        return None
+    length = int(headers.get('content-length', -1))
+    if length < 0:
+        _reply(conn, '411 Length Required', {'error': 'no Content-Length'})
+        return None
+    if staging.busy():
+        _reply(conn, '409 Conflict', {'error': 'the board is installing a download'})
+        return None
+    body = bundle._Slice(stream, length)
+    ctype = headers.get('content-type', '')
+    start = ticks_ms()
+    push = None
+    try:
+        push = Push()
+        if ctype.startswith(bundle.CONTENT_TYPE):
+            push.bundle(body)
+        elif ctype.startswith('multipart/form-data'):
+            boundary = _param(ctype, 'boundary')
+            if not boundary:
+                raise ValueError('no multipart boundary')
+            push.multipart(body, boundary.encode())
+        else:
+            raise ValueError('unsupported Content-Type %s' % ctype)
+        received = ticks_ms()
+        digest = push.commit()
+    except (OSError, ValueError) as e:
+        if push is not None:
+            push.stage.close()
+        print(f"Push failed: {e}")
+        _reply(conn, '400 Bad Request', {'error': str(e)})
+        return None
+    stats.update({'bytes': length, 'written': push.written, 'unchanged': push.unchanged,
+                  'receive_ms': ticks_diff(received, start),
+                  'commit_ms': ticks_diff(ticks_ms(), received),
+                  'flash_kbs': staging.throughput()})
+    print(f"Pushed app {digest}: {length} bytes in {stats['receive_ms']} ms, "
+          f"{push.written} files written, {push.unchanged} unchanged, commit {stats['commit_ms']} ms")
+    _reply(conn, '200 OK', dict(stats, app=digest))
+    return digest
+
+
+def restart(digest):
+    """Boot into the app that was just installed"""
+    print(f"Restarting into app {digest}")
+    sleep_ms(100)  # let the reply leave before the WiFi goes down
+    import machine
+    machine.reset()
+
+
+def _on_push(digest):
+    """Default on_push: hand the app to launch if set, else restart into it"""
+    if launch is not None:
+        launch(digest)
+    else:
+        restart(digest)
+
+
+def serve(port=PORT, on_push=_on_push, once=False):
+    """Accept pushes forever (or, with once, until the first good one)"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind(socket.getaddrinfo('0.0.0.0', port)[0][-1])
+    s.listen(1)
+    try:
+        while True:
+            conn, addr = s.accept()
+            conn.settimeout(10)
+            stream = conn if hasattr(conn, 'readline') else conn.makefile('rb')
+            try:
+                digest = handle(conn, stream)
+            except (OSError, ValueError, IndexError) as e:
+                print(f"Push from {addr[0] if isinstance(addr, tuple) else addr} dropped: {e}")
+                digest = None
+            finally:
+                if stream is not conn:
+                    stream.close()
+                conn.close()
+            if digest:
+                on_push(digest)
+                if once:
+                    return digest
+    finally:
+        s.close()
+
+
+def _run(wlan, port):
+    start = ticks_ms()
+    while wlan is not None and not wlan.isconnected():
+        if ticks_diff(ticks_ms(), start) > WIFI_WAIT_MS:
+            print("Push server: no WiFi, not started")
+            return
+        sleep_ms(100)
+    ip = wlan.ifconfig()[0] if wlan is not None else '0.0.0.0'
+    print(f"Push server on http://{ip}:{port}/push")
+    try:
+        serve(port)
+    except Exception as e:
+        print(f"Push server stopped: {e}")
+
+
+def start(wlan=None, port=PORT):
+    """Run serve() on a _thread once wlan is connected.
+
+    Without wlan (before a user app, when the firmware has not touched the
+    WiFi yet) the saved access point from wifi_cache is joined first.
+    """
+    if wlan is None:
+        import network
+        import wifi_cache
+        wlan = network.WLAN(network.STA_IF)
+        record = wifi_cache.load()
+        if record and not wlan.isconnected():
+            wifi_cache.start(wlan, record['ssid'], record['password'], record['bssid'], record['channel'])
+    import _thread
+    try:
+        old = _thread.stack_size(16 * 1024)  # JSON and sha256 need more than the default
+    except (AttributeError, ValueError):
+        old = None
+    try:
+        _thread.start_new_thread(_run, (wlan, port))
+    finally:
+        if old is not None:
+            _thread.stack_size(old)
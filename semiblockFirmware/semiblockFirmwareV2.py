@@ -1,54 +1,45 @@
-import lcd_bus
+import profiler
+profiler.begin('boot')
+profiler.begin('imports')
 import machine
-from time import sleep, sleep_ms, sleep_us
-import st7796
 import lvgl as lv
-import i2c
-import ft6x36
-import pointer_framework
-import task_handler
+import board
 import network
-from fs_driver import fs_register
-import os
+import asyncio
+profiler.end()
+
+# Developer push-deploy: accept apps from tools/push.py on port 8080 (see push_server.py).
+# A push while the firmware UI is up starts the app in-process (IN_PROCESS_LAUNCH);
+# the server also runs next to a user app, where a push resets into the new app.
+PUSH_DEPLOY = False
 
 # Check if user app exists and run it instead of firmware UI
 try:
-    if 'user_app.py' in os.listdir():
-        print("Found user_app.py - running user application...")
-        with open('user_app.py', 'r') as f:
-            user_code = f.read()
-        # Delete the file so next boot returns to firmware UI
-        os.remove('user_app.py')
-        print("Deleted user_app.py - next boot will show firmware UI")
-        # Execute user code
-        exec(user_code)
-        # If user code finishes, just hang
-        while True:
-            sleep(1)
+    import staging
+    import app_cache
+    import ota
+    # Finish an install that was committed but cut short by a reset (one stat() otherwise)
+    staging.recover()
+    app_digest = app_cache.pending()
+    if app_digest and ota.trial():
+        # A new firmware has to reach its ready state first, or it is rolled back
+        print(f"Firmware update on trial, user app {app_digest} waits for the next boot")
+        app_digest = None
+    if app_digest:
+        print(f"Found user app {app_digest} - running user application...")
+        if PUSH_DEPLOY:
+            import push_server
+            push_server.start()
+        # Imports the cached .mpy (or .py) and clears the marker, so next boot
+        # returns to firmware UI. Drops this module's globals (drivers, settings,
+        # helpers) first and never returns.
+        app_cache.launch(app_digest, namespace=globals())
 except Exception as e:
-    print(f"Error checking/running user_app.py: {e}")
+    print(f"Error checking/running user app: {e}")
     # Continue to firmware UI on error
 
-# Display settings for Waveshare ESP32-S3-Touch-LCD-3.5
-_WIDTH = 320
-_HEIGHT = 480
-_MOSI = 1 
-_MISO = 2
-_SCK = 5
-_HOST = 1
-_DC = 3
-_LCD_CS = 0
-_BL = 6
-_LCD_FREQ = 20000000
-_OFFSET_X = 0
-_OFFSET_Y = 0
-_I2C_SDA = 8
-_I2C_SCL = 7
-
-# Touch settings
-_TOUCH_I2C_ADDR = 0x38
-_TOUCH_INT = 4
-_TOUCH_RST = None
+# Frame buffer strategy, see board.PROFILES
+BOARD_PROFILE = 'spiram'
 
 # Debug mode - set to True to skip WiFi selection UI
 DEBUG = True
@@ -59,65 +50,58 @@ DEBUG_PASSWORD = "quantrwifi"
 SSID = "perfect group"
 PASSWORD = "LanghamPlace51#"
 
-print("Initializing SPI bus...")
-spi_bus = machine.SPI.Bus(host=_HOST, mosi=_MOSI, miso=_MISO, sck=_SCK)
-
-print("Initializing display bus...")
-display_bus = lcd_bus.SPIBus(spi_bus=spi_bus, freq=_LCD_FREQ, dc=_DC, cs=_LCD_CS)
-
-buf1 = display_bus.allocate_framebuffer(100*320*2, lcd_bus.MEMORY_SPIRAM)
-buf2 = display_bus.allocate_framebuffer(100*320*2, lcd_bus.MEMORY_SPIRAM)
-
-print("Initializing ST7796 display...")
-display = st7796.ST7796(
-    data_bus=display_bus,
-    display_width=_WIDTH,
-    display_height=_HEIGHT,
-    backlight_pin=_BL,
-    reset_pin=None,
-    backlight_on_state=st7796.STATE_HIGH,
-    color_space=lv.COLOR_FORMAT.RGB565,
-    color_byte_order=st7796.BYTE_ORDER_BGR,
-    rgb565_byte_swap=True,
-    offset_x=_OFFSET_X,
-    offset_y=_OFFSET_Y,
-    frame_buffer1=buf1,
-    frame_buffer2=buf2,
-)
-
-display.init()
-
-# Initialize touch BEFORE setting rotation
-print("Initializing FT6336 touch...")
-i2c_bus = i2c.I2C.Bus(host=0, scl=_I2C_SCL, sda=_I2C_SDA, freq=400000, use_locks=False)
-touch_dev = i2c.I2C.Device(bus=i2c_bus, dev_id=_TOUCH_I2C_ADDR, reg_bits=ft6x36.BITS)
-indev = ft6x36.FT6x36(touch_dev, startup_rotation=pointer_framework.lv.DISPLAY_ROTATION._90)
-print("Touch driver initialized")
-
-# Set rotation AFTER touch initialization
-display.set_rotation(lv.DISPLAY_ROTATION._90)
-display.set_color_inversion(True)
-display.set_backlight(100)
-
-if not indev.is_calibrated:
-    indev.calibrate()
-
-print("Display ready")
-
-# Initialize task handler for LVGL
-th = task_handler.TaskHandler()
+PROJECT_URL = "https://build.semiblock.ai/api/getProject"
+
+# Firmware updates over the air into the idle A/B slot (ota.py), checked once WiFi is up.
+# ota.py compares offers with what it installed; this is only for a slot flashed by hand
+FIRMWARE_VERSION = "2.0"
+FIRMWARE_URL = "https://build.semiblock.ai/api/getFirmware"
+OTA_UPDATES = True
+
+# LAN peer cache: take the project's files from a board nearby that already has
+# them (checked against the cloud's digests), and share a freshly installed
+# project with the boards around us, in the background next to the app
+PEER_CACHE = False
+
+# Start a downloaded app in the running firmware, on the display and touch that
+# are already up (launcher.py), instead of resetting into it
+IN_PROCESS_LAUNCH = True
+
+# Download on a second thread (download_worker.py) so the UI keeps drawing;
+# False runs it on the UI thread, pumping LVGL from the download's callbacks
+DOWNLOAD_THREAD = True
+
+# Start associating now so it overlaps with the display bring-up below.
+# The last good AP is kept on flash, so there is no scan on the way.
+import wifi_cache
+import netcache
+import ota
+with profiler.span('wlan.start'):
+    wlan = network.WLAN(network.STA_IF)
+    wifi_record = wifi_cache.load()
+    if DEBUG:
+        if not wifi_record or wifi_record['ssid'] != DEBUG_SSID:
+            wifi_record = {'ssid': DEBUG_SSID, 'bssid': None, 'channel': None}
+        wifi_record['password'] = DEBUG_PASSWORD
+    if wifi_record:
+        print(f"Connecting to {wifi_record['ssid']} in the background...")
+        wifi_cache.start(wlan, wifi_record['ssid'], wifi_record['password'],
+                         wifi_record['bssid'], wifi_record['channel'])
+    else:
+        wlan.active(True)
+
+# Display, touch and "S:" filesystem (board.py). LVGL is serviced by lvgl_task()
+# once the asyncio loop starts, so no task_handler.TaskHandler() timer here
+with profiler.span('board'):
+    hw = board.start(BOARD_PROFILE, timer=False, fs=True)
 
 # Create screen
 scrn = lv.screen_active()
 scrn.set_style_bg_color(lv.color_hex(0x000000), 0)  # Black background
 scrn.set_scrollbar_mode(lv.SCROLLBAR_MODE.OFF)
 
-# Register filesystem driver
-print("Registering filesystem...")
-fs_drv = lv.fs_drv_t()
-fs_register(fs_drv, "S")
-
 # Create logo at top
+profiler.begin('logo')
 logo_img = lv.image(scrn)
 logo_img.set_src("S:semiblock_logo_2.png")
 logo_img.align(lv.ALIGN.TOP_MID, 0, 10)
@@ -129,13 +113,80 @@ status_label.align(lv.ALIGN.TOP_MID, 0, 90)
 status_label.set_style_text_color(lv.color_hex(0xFFFFFF), 0)
 status_label.set_style_text_font(lv.font_montserrat_14, 0)
 
-# Initial refresh
+# Initial refresh (decodes the logo)
 lv.task_handler()
 lv.refr_now(None)
+profiler.end()
+
+# How often lvgl_task() services LVGL (~60 fps)
+LV_PERIOD_MS = 16
+
+# Set by LVGL event callbacks, awaited by the flow below
+ui_event = asyncio.Event()
+ui_result = None
+
+
+def ui_done(result):
+    """Hand a result from an LVGL callback to the coroutine waiting on it"""
+    global ui_result
+    ui_result = result
+    ui_event.set()
+
+
+async def wait_ui():
+    ui_event.clear()
+    await ui_event.wait()
+    return ui_result
+
+
+# Apps push_server installed while the UI is up, launched like a finished download
+pushed = []
+
+# The boot span ends at the first code screen, not at the ones after a failed download
+boot_profiled = False
 
-# Define show_main_app function before connect_to_wifi (which calls it)
-def show_main_app():
-    """Show the main application after WiFi connection"""
+
+async def push_watch_task():
+    """Wake whatever the UI waits for once push_server has installed an app"""
+    while True:
+        if pushed:
+            ui_done(('push',))
+        await asyncio.sleep_ms(100)
+
+
+async def lvgl_task():
+    """Run LVGL at a steady rate for the whole life of the firmware"""
+    while True:
+        lv.task_handler()
+        await asyncio.sleep_ms(LV_PERIOD_MS)
+
+
+def make_spinner(y):
+    spinner = lv.spinner(scrn)
+    spinner.set_size(40, 40)
+    spinner.align(lv.ALIGN.TOP_MID, 0, y)
+    return spinner
+
+
+async def wifi_monitor_task(net_label):
+    """Show when the WiFi drops while the user is typing or downloading"""
+    was_connected = True
+    while True:
+        connected = wlan.isconnected()
+        if connected != was_connected:
+            was_connected = connected
+            if connected:
+                net_label.set_text(f"WiFi: {wlan.ifconfig()[0]}")
+                net_label.set_style_text_color(lv.color_hex(0x00FF00), 0)
+            else:
+                print("WiFi connection lost")
+                net_label.set_text("WiFi lost, reconnecting...")
+                net_label.set_style_text_color(lv.color_hex(0xFF0000), 0)
+        await asyncio.sleep_ms(1000)
+
+
+async def enter_code():
+    """Show the keypad screen and return the 4-digit code once OK is pressed"""
     # Clear screen completely
     lv.obj.clean(scrn)
     
@@ -149,9 +200,8 @@ def show_main_app():
     logo_img2.align(lv.ALIGN.TOP_MID, 0, 10)
     
     # Create keypad screen
-    global code_input, code_complete
+    global code_input, boot_profiled
     code_input = ""
-    code_complete = False
     
     # Create display label for entered code
     code_display = lv.label(scrn)
@@ -166,9 +216,19 @@ def show_main_app():
     code_label.set_style_text_color(lv.color_hex(0xffffff), 0)
     code_label.set_style_text_font(lv.font_montserrat_16, 0)
     
+    # WiFi status in the corner, kept up to date by wifi_monitor_task()
+    net_label = lv.label(scrn)
+    net_label.set_text(f"WiFi: {wlan.ifconfig()[0]}")
+    net_label.align(lv.ALIGN.BOTTOM_RIGHT, -5, -5)
+    net_label.set_style_text_color(lv.color_hex(0x00FF00), 0)
+    net_label.set_style_text_font(lv.font_montserrat_14, 0)
+    
     # Button event handlers
     def num_btn_event_with_num(event, num):
         global code_input
+        if not code_input:
+            # Resolve and handshake with the server while the rest of the code is typed
+            netcache.warm(PROJECT_URL)
         if len(code_input) < 4:
             code_input += str(num)
             display_text = code_input + "_" * (4 - len(code_input))
@@ -182,11 +242,10 @@ def show_main_app():
         print("Code cleared")
     
     def enter_btn_event(event):
-        global code_input, code_complete
         print(f"Enter button pressed! Code length: {len(code_input)}")
         if len(code_input) == 4:
-            code_complete = True
             print(f"Code entered: {code_input}")
+            ui_done(code_input)
         else:
             print(f"Need 4 digits, only have {len(code_input)}")
     
@@ -257,76 +316,128 @@ def show_main_app():
     label_enter.center()
     
     btn_enter.add_event_cb(enter_btn_event, lv.EVENT.CLICKED, None)
-    btn_enter.add_event_cb(enter_btn_event, lv.EVENT.PRESSED, None)
     
-    lv.task_handler()
-    lv.refr_now(None)
+    if not boot_profiled:
+        boot_profiled = True
+        profiler.mark('code_screen')
+        profiler.end()  # boot
+        profiler.dump()
     
-    # Wait for code entry
+    # Wait for code entry; LVGL and the WiFi monitor keep running meanwhile
     print("Waiting for 4-digit code...")
-    while not code_complete:
-        lv.task_handler()
-        sleep(0.05)
-    
+    monitor = asyncio.create_task(wifi_monitor_task(net_label))
+    code = await wait_ui()
+    monitor.cancel()
+    return code
+
+
+async def download_project(code):
+    """Fetch the project for a device code and install it.
+
+    Returns the app digest to launch in-process, or None to go back to the
+    keypad. Without IN_PROCESS_LAUNCH it reboots into the app instead.
+    """
     # Code entered, fetch from server
-    print(f"Fetching code with: {code_input}")
+    print(f"Fetching code with: {code}")
+    lv.obj.clean(scrn)
+    code_display = lv.label(scrn)
     code_display.set_text("Fetching code...")
-    lv.task_handler()
-    
+    code_display.align(lv.ALIGN.TOP_MID, 0, 90)
+    code_display.set_style_text_color(lv.color_hex(0xFFFFFF), 0)
+    code_display.set_style_text_font(lv.font_montserrat_16, 0)
+    spinner = make_spinner(130)
+    bar = lv.bar(scrn)
+    bar.set_size(300, 16)
+    bar.align(lv.ALIGN.TOP_MID, 0, 190)
+    bar.set_range(0, 100)
+    # Let the new screen render before the network call starts
+    await asyncio.sleep_ms(LV_PERIOD_MS * 2)
+    
+    stage = None
     try:
-        import urequests
-        import ubinascii
-        url = f"https://build.semiblock.ai/api/getProject?deviceCode={code_input}"
+        import peer_cache
+        import asset_cache
+        import staging
+        peer_cache.ENABLED = PEER_CACHE
+        # Images already on flash, by content digest, so unchanged ones are skipped
+        manifest = asset_cache.load()
+        print(f"Asset cache: {len(manifest)} images on flash")
+        url = f"{PROJECT_URL}?deviceCode={code}"
         print(f"URL: {url}")
-        response = urequests.get(url)
-        if response.status_code == 200:
-            response_json = response.json()
-            if response_json.get('success') and 'data' in response_json:
-                code = response_json['data']['code']
-                images = response_json['data'].get('images', [])
-                
-                print(f"Code received ({len(code)} bytes)")
-                print(f"Images received: {len(images)}")
-                
-                # Download and save images first
-                if images:
-                    code_display.set_text(f"Downloading {len(images)} images...")
-                    lv.task_handler()
-                    
-                    for idx, img in enumerate(images):
-                        img_name = img['name']
-                        img_data = img['image_data']
-                        
-                        print(f"Saving {img_name}.png ({idx+1}/{len(images)})...")
-                        code_display.set_text(f"Saving {img_name}.png...")
-                        lv.task_handler()
-                        
-                        try:
-                            # Remove data:image/png;base64, prefix if present
-                            if img_data.startswith('data:'):
-                                img_data = img_data.split(',', 1)[1]
-                            
-                            # Decode base64 to binary
-                            img_binary = ubinascii.a2b_base64(img_data)
-                            
-                            # Save as PNG file
-                            with open(f"{img_name}.png", 'wb') as f:
-                                f.write(img_binary)
-                            print(f"Saved {img_name}.png")
-                        except Exception as img_error:
-                            print(f"Failed to save {img_name}.png: {img_error}")
+        
+        def on_image(img_name, size):
+            print(f"Saved {img_name}.png ({size} bytes)")
+        
+        def show_progress(done, length):
+            code_display.set_text(f"Downloading... {done // 1024} KB")
+            if length > 0:
+                bar.set_value(done * 100 // length, lv.ANIM.OFF)
+        
+        def on_progress(done, length):
+            show_progress(done, length)
+            lv.task_handler()
+        
+        with profiler.span('fetch'):
+            # With PEER_CACHE a board on the LAN that has this project sends the files (the
+            # manifest and digests still come from the cloud).
+            # Files are fetched one by one over a kept-alive connection and resumed with
+            # Range after a drop; servers without a manifest get the single streamed
+            # download (JSON or bundle), retried with backoff.
+            # Everything lands in the staging directory; the app on flash is untouched until commit.
+            stage = staging.Stage()
+            code_path = stage.path('user_app.tmp')
+            if DOWNLOAD_THREAD:
+                # The worker thread never touches LVGL; its progress is drawn here, once per frame
+                import download_worker
+                worker = download_worker.Worker(peer_cache.fetch_project, url, code, code_path=code_path,
+                                                manifest=manifest, stage=stage)
+                worker.start()
+                result = None
+                while result is None:
+                    for event in worker.poll():
+                        if event[0] == 'progress':
+                            show_progress(event[1], event[2])
+                        elif event[0] == 'image':
+                            on_image(event[1], event[2])
+                        elif event[0] == 'error':
+                            raise event[1]
+                        else:
+                            result = event[1]
+                    if result is None:
+                        await asyncio.sleep_ms(LV_PERIOD_MS)
+                status, project, stats = result
+            else:
+                # Synchronous; idle= keeps LVGL running while the socket waits
+                status, project, stats = peer_cache.fetch_project(
+                    url, code, code_path=code_path, on_image=on_image, on_progress=on_progress,
+                    manifest=manifest, idle=lv.task_handler, stage=stage)
+        print(f"Downloaded {stats.total} bytes from {stats.source} at {stats.throughput()} KB/s, "
+              f"peak heap {stats.peak} bytes")
+        netcache.report()
+        profiler.dump()
+        spinner.delete()
+        
+        if status == 200:
+            if project.success and project.code_size >= 0:
+                print(f"Code received ({project.code_size} bytes)")
+                print(f"Images received: {len(project.images)}, unchanged: {len(project.unchanged)}")
+                bar.set_value(100, lv.ANIM.OFF)
                 
                 code_display.set_text("Saving code...")
-                lv.task_handler()
+                await asyncio.sleep_ms(0)
                 
-                # Save code to file
+                # One atomic commit, then images, asset manifest and app cache are updated
                 try:
-                    with open('user_app.py', 'w') as f:
-                        f.write(code)
-                    print("Code saved to user_app.py")
+                    app_digest = stage.commit(code_path, project.mpy_path, project.code_digest)
+                    print("Code saved to app cache")
+                    if PEER_CACHE and IN_PROCESS_LAUNCH:
+                        # serves on its own thread for peer_cache.SHARE_MS while the app runs
+                        peer_cache.start(peer_cache.Share(code, project, app_digest))
+                    if IN_PROCESS_LAUNCH:
+                        # firmware_main() returns it and the app starts on the live display
+                        return app_digest
                     code_display.set_text("Rebooting...")
-                    lv.task_handler()
-                    sleep(1)
+                    await asyncio.sleep(1)
                     
                     # Reset to run the new code
                     machine.reset()
@@ -335,30 +446,38 @@ def show_main_app():
                     code_display.set_text(f"Save error: {str(write_error)}")
                     code_display.set_style_text_color(lv.color_hex(0xFF0000), 0)
             else:
-                print(f"Invalid response format: {response.text}")
+                print(f"Invalid response format: {project.error}")
                 code_display.set_text("Invalid response format")
                 code_display.set_style_text_color(lv.color_hex(0xFF0000), 0)
         else:
-            print(f"Failed to fetch code: HTTP {response.status_code}")
-            code_display.set_text(f"Fetch failed: {response.status_code}")
+            print(f"Failed to fetch code: HTTP {status}")
+            code_display.set_text(f"Fetch failed: {status}")
             code_display.set_style_text_color(lv.color_hex(0xFF0000), 0)
-        response.close()
     except Exception as e:
         import sys
         sys.print_exception(e)
         print(f"Error fetching/executing code: {e}")
-        # Don't try to update UI after exec error - objects may be deleted
-        # Just print error and continue
+        code_display.set_text(f"Error: {e}")
+        code_display.set_style_text_color(lv.color_hex(0xFF0000), 0)
+    if stage is not None:
+        stage.close()  # nothing was installed: pushes can use the stage again
+    # Leave the error up for a moment, then go back to the keypad
+    await asyncio.sleep(3)
+    return None
+
 
-# Define connect_to_wifi function before it's used
-def connect_to_wifi(ssid, password):
-    """Connect to selected WiFi network"""
+async def connect_to_wifi(ssid, password, bssid=None, started=False):
+    """Connect to selected WiFi network, returns True once connected.
+
+    started means wifi_cache.start() already kicked off this connection at boot.
+    """
     # Show connecting status
+    status_label.remove_flag(lv.obj.FLAG.HIDDEN)
     status_label.set_style_opa(lv.OPA.COVER, 0)
+    status_label.set_style_text_color(lv.color_hex(0xFFFFFF), 0)
     status_label.set_text(f"Connecting to {ssid}...")
     status_label.align(lv.ALIGN.CENTER, 0, 0)
-    lv.task_handler()
-    lv.refr_now(None)
+    spinner = make_spinner(200)
     
     print(f"Connecting to WiFi: {ssid}")
     print("WiFi Status Codes:")
@@ -370,13 +489,19 @@ def connect_to_wifi(ssid, password):
     print("  203 = STAT_CONNECT_FAIL")
     print()
     
-    wlan.connect(ssid, password)
+    profiler.begin('wlan.connect')
+    if not started:
+        wifi_cache.start(wlan, ssid, password, bssid)
     
-    # Wait for connection
-    max_wait = 30
-    while max_wait > 0:
+    # Wait for connection, polling often so the UI never waits on us
+    max_wait_ms = 30000
+    waited = 0
+    last_status = None
+    while waited < max_wait_ms:
         status = wlan.status()
-        print(f'Waiting for connection... Status: {status}')
+        if status != last_status:
+            print(f'Waiting for connection... Status: {status}')
+            last_status = status
         
         # Check if connected (status 1010 or 3)
         if status == 1010 or status == 3:
@@ -386,15 +511,12 @@ def connect_to_wifi(ssid, password):
         # Check if connection failed
         if status in [201, 202, 203] or status < 0:
             print("Connection failed!")
-            status_label.set_text(f"Failed to connect to {ssid}")
-            status_label.set_style_text_color(lv.color_hex(0xFF0000), 0)
-            lv.task_handler()
-            sleep(3)
-            return
+            break
         
-        max_wait -= 1
-        sleep(1)
-        lv.task_handler()
+        await asyncio.sleep_ms(100)
+        waited += 100
+    profiler.end()
+    spinner.delete()
     
     # Check connection status
     final_status = wlan.status()
@@ -406,41 +528,31 @@ def connect_to_wifi(ssid, password):
         ip = wlan.ifconfig()[0]
         status_label.set_text(f"Connected! IP: {ip}")
         print(f'Connected! IP: {ip}')
-        
-        lv.task_handler()
-        lv.refr_now(None)
-        sleep(2)
+        wifi_cache.remember(wlan, ssid, password, bssid)
+        # Ask the router directly so cached DNS answers carry their real TTL
+        netcache.DNS_SERVER = wlan.ifconfig()[3]
+        if PUSH_DEPLOY:
+            import push_server
+            if IN_PROCESS_LAUNCH:
+                # push_server's thread only records the app; this thread launches it
+                push_server.launch = pushed.append
+                asyncio.create_task(push_watch_task())
+            push_server.start(wlan)
+        await asyncio.sleep_ms(500)
         
         # Hide status and continue to main app
         status_label.add_flag(lv.obj.FLAG.HIDDEN)
-        show_main_app()
-    else:
-        status_label.set_text("Connection timeout")
-        status_label.set_style_text_color(lv.color_hex(0xFF0000), 0)
-        lv.task_handler()
-        sleep(3)
-
-# Initialize WiFi
-wlan = network.WLAN(network.STA_IF)
-wlan.active(True)
-
-# Debug mode - skip WiFi selection UI
-if DEBUG:
-    print("DEBUG MODE: Auto-connecting to WiFi...")
-    status_label.set_text(f"DEBUG: Connecting to {DEBUG_SSID}...")
-    lv.task_handler()
-    lv.refr_now(None)
-    connect_to_wifi(DEBUG_SSID, DEBUG_PASSWORD)
-    # Script continues from show_main_app() after connection
-else:
-    # Scan WiFi networks
-    print("Scanning WiFi networks...")
-    status_label.set_text("Scanning WiFi networks...")
-    networks = wlan.scan()
-    
-    # Sort by signal strength (RSSI)
-    networks_sorted = sorted(networks, key=lambda x: x[3], reverse=True)
+        return True
     
+    if waited >= max_wait_ms:
+        status_label.set_text("Connection timeout")
+    else:
+        status_label.set_text(f"Failed to connect to {ssid}")
+    status_label.set_style_text_color(lv.color_hex(0xFF0000), 0)
+    await asyncio.sleep(3)
+    return False
+
+if not DEBUG:
     # Create scrollable list for WiFi networks
     wifi_list = lv.list(scrn)
     wifi_list.set_size(440, 200)
@@ -448,6 +560,7 @@ else:
     wifi_list.set_style_bg_color(lv.color_hex(0xaaaaaa), 0)
     wifi_list.set_style_border_width(3, 0)
     wifi_list.set_style_border_color(lv.color_hex(0xcbb3d5), 0)
+    wifi_list.set_style_opa(lv.OPA.TRANSP, 0)  # shown by choose_wifi()
     
     # Create refresh button
     refresh_btn = lv.button(scrn)
@@ -457,19 +570,10 @@ else:
     refresh_btn_label = lv.label(refresh_btn)
     refresh_btn_label.set_text("Refresh")
     refresh_btn_label.center()
+    refresh_btn.add_flag(lv.obj.FLAG.HIDDEN)
 
-if not DEBUG:
-    selected_ssid = None
-    selected_password = ""
-    selected_auth = 0
-
-def show_keyboard_screen(ssid, auth):
-    """Show password entry keyboard screen"""
-    global selected_ssid, selected_auth, selected_password
-    selected_ssid = ssid
-    selected_auth = auth
-    selected_password = ""
-    
+def show_keyboard_screen(ssid, auth, bssid):
+    """Show password entry keyboard screen, reports ('connect', ssid, password, bssid) via ui_done"""
     # Hide WiFi list and status
     wifi_list.set_style_opa(lv.OPA.TRANSP, 0)
     status_label.set_style_opa(lv.OPA.TRANSP, 0)
@@ -508,140 +612,177 @@ def show_keyboard_screen(ssid, auth):
     kb.align(lv.ALIGN.BOTTOM_MID, 0, 0)
     kb.set_textarea(pwd_display)
     
-    def back_btn_event(event):
-        """Handle back button click"""
-        print("Back button clicked - returning to WiFi list")
+    def close_keyboard_screen():
         # Restore logo position and size
         logo_img.set_size(lv.SIZE_CONTENT, lv.SIZE_CONTENT)
         logo_img.align(lv.ALIGN.TOP_MID, 0, 10)
-        # Hide and clean up keyboard screen
-        kb.add_flag(lv.obj.FLAG.HIDDEN)
+        # Clean up keyboard screen
         kb.delete()
         pwd_display.delete()
         pwd_label.delete()
         back_btn.delete()
+    
+    def back_btn_event(event):
+        """Handle back button click"""
+        print("Back button clicked - returning to WiFi list")
+        close_keyboard_screen()
         # Show WiFi list and status again
         wifi_list.set_style_opa(lv.OPA.COVER, 0)
         status_label.set_style_opa(lv.OPA.COVER, 0)
         status_label.align(lv.ALIGN.TOP_MID, 0, 90)
-        lv.task_handler()
-        lv.refr_now(None)
     
     back_btn.add_event_cb(back_btn_event, lv.EVENT.CLICKED, None)
     
     def kb_event(event):
-        global selected_password
         code = event.get_code()
         if code == lv.EVENT.READY or code == lv.EVENT.CANCEL:
-            selected_password = pwd_display.get_text()
-            print(f"Password entered: {'*' * len(selected_password)}")
-            # Restore logo position and size
-            logo_img.set_size(lv.SIZE_CONTENT, lv.SIZE_CONTENT)
-            logo_img.align(lv.ALIGN.TOP_MID, 0, 10)
-            # Clean up keyboard screen
-            kb.delete()
-            pwd_display.delete()
-            pwd_label.delete()
-            back_btn.delete()
-            # Start WiFi connection
-            connect_to_wifi(selected_ssid, selected_password)
+            password = pwd_display.get_text()
+            print(f"Password entered: {'*' * len(password)}")
+            close_keyboard_screen()
+            # Start WiFi connection from the flow, not from inside this LVGL event
+            ui_done(('connect', ssid, password, bssid))
     
     kb.add_event_cb(kb_event, lv.EVENT.READY, None)
     kb.add_event_cb(kb_event, lv.EVENT.CANCEL, None)
-    
-    lv.task_handler()
-    lv.refr_now(None)
 
-def wifi_btn_event(event, ssid, auth):
+def wifi_btn_event(ssid, auth, bssid):
     print(f"Selected SSID: {ssid}, Auth: {auth}")
     if auth > 0:  # Secured network
-        show_keyboard_screen(ssid, auth)
+        show_keyboard_screen(ssid, auth, bssid)
     else:  # Open network
-        connect_to_wifi(ssid, "")
+        ui_done(('connect', ssid, "", bssid))
+
+# Rescan in the background this often while the list is up
+RESCAN_MS = 15000
+
+if not DEBUG:
+    import wifi_pool
+    # Rows are created once and updated in place on every scan
+    wifi_table = wifi_pool.NetworkTable()
+    wifi_rows = wifi_pool.WifiListPool(wifi_list, wifi_btn_event)
 
 def populate_wifi_list(networks_list):
-    """Populate the WiFi list with scanned networks"""
-    # Clear existing items
-    wifi_list.clean()
-    
-    # Sort by signal strength (RSSI)
-    networks_sorted = sorted(networks_list, key=lambda x: x[3], reverse=True)
-    
-    # Add WiFi networks to list
-    seen_ssids = set()  # Track SSIDs we've already added
-    for net in networks_sorted[:20]:  # Check more networks to get 10 unique ones
-        ssid = net[0].decode('utf-8') if isinstance(net[0], bytes) else net[0]
-        
-        # Skip if we've already added this SSID
-        if ssid in seen_ssids:
-            continue
-        
-        seen_ssids.add(ssid)
-        
-        # Stop after adding 10 unique networks
-        if len(seen_ssids) > 10:
-            break
-        
-        rssi = net[3]
-        auth = net[4]
-        
-        # Create signal strength indicator
-        if rssi > -50:
-            signal = "▂▄▆█"
-        elif rssi > -60:
-            signal = "▂▄▆"
-        elif rssi > -70:
-            signal = "▂▄"
-        else:
-            signal = "▂"
-        
-        # Create lock icon for secured networks
-        lock = "🔒" if auth > 0 else ""
-        
-        # btn_text = f"{signal} {ssid} {lock}"
-        btn_text = f"{ssid}"
-        btn = wifi_list.add_button(None, btn_text)
-        btn.add_event_cb(lambda e, s=ssid, a=auth: wifi_btn_event(e, s, a), lv.EVENT.CLICKED, None)
-        btn.set_style_bg_color(lv.color_hex(0xaaaaaa), 0)
-    
-    status_label.set_text(f"Found {len(networks_list)} networks")
-    lv.task_handler()
-    lv.refr_now(None)
+    """Merge scan results into the table and update the pooled rows"""
+    wifi_table.merge(networks_list)
+    took_us, churn = wifi_rows.show(wifi_table)
+    print(f"WiFi list refresh: {took_us} us, {churn} bytes allocated")
+    status_label.set_text(f"Found {len(wifi_table.nets)} networks")
 
-def refresh_wifi_list(event):
+async def scan_wifi(background=False):
     """Rescan WiFi networks and refresh the list"""
-    print("Refreshing WiFi list...")
-    status_label.set_text("Scanning WiFi...")
-    lv.task_handler()
-    lv.refr_now(None)
-    
-    # Rescan networks
-    global networks, networks_sorted
-    networks = wlan.scan()
-    networks_sorted = sorted(networks, key=lambda x: x[3], reverse=True)
-    
-    # Repopulate the list
+    print("Scanning WiFi networks...")
+    spinner = None
+    if not background:
+        status_label.set_text("Scanning WiFi...")
+        spinner = make_spinner(60)
+        # Let the spinner draw before the scan, which blocks in the driver
+        await asyncio.sleep_ms(LV_PERIOD_MS * 2)
+    with profiler.span('wlan.scan'):
+        networks = wlan.scan()
+    if spinner:
+        spinner.delete()
+    
+    # Update the list in place
     populate_wifi_list(networks)
     print(f"Found {len(networks)} networks")
 
+async def background_scan_task():
+    """Keep the list fresh without the user pressing Refresh"""
+    while True:
+        await asyncio.sleep_ms(RESCAN_MS)
+        # wlan.scan() blocks for a couple of seconds, so only rescan
+        # when nobody has touched the screen for a while
+        if lv.display_get_default().get_inactive_time() > 3000:
+            await scan_wifi(background=True)
+
+async def choose_wifi():
+    """Let the user pick a network (and password), returns (ssid, password, bssid)"""
+    wifi_list.set_style_opa(lv.OPA.COVER, 0)
+    status_label.remove_flag(lv.obj.FLAG.HIDDEN)
+    status_label.set_style_opa(lv.OPA.COVER, 0)
+    status_label.set_style_text_color(lv.color_hex(0xFFFFFF), 0)
+    status_label.align(lv.ALIGN.TOP_MID, 0, 90)
+    refresh_btn.remove_flag(lv.obj.FLAG.HIDDEN)
+    if not wifi_table.nets:
+        await scan_wifi()
+    rescan = asyncio.create_task(background_scan_task())
+    while True:
+        action = await wait_ui()
+        if action[0] == 'refresh':
+            await scan_wifi()
+        elif action[0] == 'connect':
+            rescan.cancel()
+            wifi_list.set_style_opa(lv.OPA.TRANSP, 0)
+            refresh_btn.add_flag(lv.obj.FLAG.HIDDEN)
+            return action[1], action[2], action[3]
+
 if not DEBUG:
-    refresh_btn.add_event_cb(refresh_wifi_list, lv.EVENT.CLICKED, None)
+    refresh_btn.add_event_cb(lambda e: ui_done(('refresh',)), lv.EVENT.CLICKED, None)
+
+async def update_firmware():
+    """Install a newer firmware into the idle slot and restart into it, if there is one"""
+    status_label.remove_flag(lv.obj.FLAG.HIDDEN)
+    status_label.set_text("Checking for updates...")
+    await asyncio.sleep_ms(LV_PERIOD_MS * 2)
     
-    # Initial population of WiFi list
-    populate_wifi_list(networks)
+    def on_progress(done, length):
+        if length > 0:
+            status_label.set_text(f"Updating firmware... {done * 100 // length}%")
+        lv.task_handler()
     
-    # Update display
-    lv.task_handler()
-    lv.refr_now(None)
-
-lv.task_handler()
-lv.refr_now(None)
-
-# debug
-# connect_to_wifi('peter 2.4G', 'peter1234')
+    try:
+        # One try at the check: a busy server means next boot, not a wait before the keypad
+        new_version = ota.update(FIRMWARE_URL, FIRMWARE_VERSION, on_progress, idle=lv.task_handler,
+                                 check_retries=0)
+    except Exception as e:
+        print(f"Firmware update failed: {e}")
+        new_version = None
+    if new_version:
+        status_label.set_text(f"Firmware {new_version} installed, restarting...")
+        await asyncio.sleep(1)
+        machine.reset()
+    status_label.add_flag(lv.obj.FLAG.HIDDEN)
+
+async def firmware_main():
+    """Firmware flow: WiFi -> keypad -> download, with LVGL running throughout"""
+    asyncio.create_task(lvgl_task())
+    
+    # With a saved AP (or in debug mode) the connection is already under way
+    started = wifi_record is not None
+    while True:
+        if started:
+            ssid, password, bssid = wifi_record['ssid'], wifi_record['password'], wifi_record['bssid']
+        elif DEBUG:
+            # Debug mode - skip WiFi selection UI
+            print("DEBUG MODE: Auto-connecting to WiFi...")
+            ssid, password, bssid = DEBUG_SSID, DEBUG_PASSWORD, None
+        else:
+            ssid, password, bssid = await choose_wifi()
+        if await connect_to_wifi(ssid, password, bssid, started):
+            break
+        if started and not DEBUG:
+            # The saved AP is gone or its password changed, let the user pick again
+            wifi_cache.clear()
+        started = False
+    
+    # UI up and online: a firmware on trial has proven itself (and can be updated again)
+    ota.mark_ready()
+    if OTA_UPDATES:
+        await update_firmware()
+    
+    while True:
+        code = await enter_code()
+        if pushed:
+            return pushed.pop()
+        app_digest = await download_project(code)
+        if app_digest:
+            return app_digest
 
 # Keep display active
 print("Setup complete - entering main loop")
-while True:
-    lv.task_handler()
-    sleep(0.05)
+app_digest = asyncio.run(firmware_main())
+
+# Start the new app right here: the display, touch and WiFi stay up,
+# the firmware's screen and globals are freed first
+import launcher
+launcher.run(app_digest, hw, globals())
@@ -0,0 +1,291 @@
+"""Staged, all-or-nothing install of a downloaded project.
+
+Everything a download produces is written into STAGE first. Each file is
+recorded with the digest and size it was checked against; nothing on flash
+outside STAGE changes while the download runs. commit() then writes
+COMMIT (the list of staged files and the app digest) with a single rename,
+which is the point where the install becomes real, and moves the files
+into place. A power loss before that rename leaves the old app untouched;
+one after it is finished by recover() on the next boot, which costs one
+stat() when there is nothing to do and never re-hashes a file.
+
+There is one STAGE, so one install at a time: a Stage owns it from
+Stage() until commit() or close(). Stage() on another thread meanwhile
+(a push arriving during a download) raises OSError; busy() tells without
+trying. A new Stage() on the owner's own thread takes over, as a retry
+after a failed download does.
+
+BlockWriter batches writes into BLOCK-sized, block-aligned pieces instead of
+one small f.write per network chunk, and counts bytes and time so the
+flash throughput can be reported.
+"""
+import json
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+import asset_cache
+
+try:
+    import _thread
+    _lock = _thread.allocate_lock()
+    _ident = _thread.get_ident
+except ImportError:
+    class _NoLock:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    _lock = _NoLock()
+
+    def _ident():
+        return 0
+
+STAGE = 'stage'
+COMMIT = STAGE + '/commit.json'
+
+# Flash erase block / littlefs block size on the ESP32-S3
+BLOCK = 4096
+
+# Filled in by BlockWriter: bytes, f.write() calls and microseconds spent in them
+stats = {'bytes': 0, 'writes': 0, 'us': 0}
+
+_shared = bytearray(BLOCK)
+_shared_busy = False  # set and cleared under _lock: a push and a download can write at once
+
+_owner = None  # the Stage that owns STAGE
+
+
+def reset_stats():
+    stats['bytes'] = stats['writes'] = stats['us'] = 0
+
+
+def throughput():
+    """KB/s of flash writes since reset_stats()"""
+    return stats['bytes'] * 1000000 // max(stats['us'], 1) // 1024
+
+
+def report():
+    print(f"Flash: {stats['bytes']} bytes in {stats['writes']} writes, {throughput()} KB/s")
+
+
+class BlockWriter:
+    """Write a file in whole BLOCKs, aligned to BLOCK from the start of the file.
+
+    offset is where writing starts (for appends), so the first write only
+    fills up to the next block boundary. With a hasher every byte written
+    is also hashed.
+    """
+
+    def __init__(self, path, mode='wb', hasher=None, offset=0):
+        global _shared_busy
+        self.path = path
+        self.hasher = hasher
+        self.size = 0
+        with _lock:
+            shared = not _shared_busy
+            _shared_busy = True
+        self.buf = _shared if shared else bytearray(BLOCK)
+        self.mv = memoryview(self.buf)
+        self.fill = 0
+        self.room = BLOCK - offset % BLOCK
+        self.f = open(path, mode)
+
+    def write(self, data):
+        if self.hasher:
+            self.hasher.update(data)
+        n = len(data)
+        self.size += n
+        src = memoryview(data)
+        pos = 0
+        while pos < n:
+            take = min(self.room - self.fill, n - pos)
+            self.mv[self.fill:self.fill + take] = src[pos:pos + take]
+            self.fill += take
+            pos += take
+            if self.fill == self.room:
+                self._flush()
+        return n
+
+    def _flush(self):
+        if self.fill:
+            start = ticks_us()
+            self.f.write(self.mv[:self.fill])
+            stats['us'] += ticks_diff(ticks_us(), start)
+            stats['bytes'] += self.fill
+            stats['writes'] += 1
+        self.fill = 0
+        self.room = BLOCK
+
+    def close(self):
+        global _shared_busy
+        if self.f is None:
+            return
+        self._flush()
+        self.f.close()
+        self.f = None
+        if self.buf is _shared:
+            with _lock:
+                _shared_busy = False
+        self.buf = self.mv = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _exists(path):
+    return asset_cache.file_size(path) >= 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _replace(src, dst):
+    _remove(dst)
+    os.rename(src, dst)
+
+
+class Stage:
+    """Collects the files of one download under STAGE until commit()"""
+
+    def __init__(self):
+        global _owner
+        self.thread = _ident()
+        with _lock:
+            if _owner is not None and _owner.thread != self.thread:
+                raise OSError('another install is being staged')
+            _owner = self
+        self.files = {}  # final name -> [digest, size]
+        recover()
+        try:
+            os.mkdir(STAGE)
+        except OSError:
+            pass
+        # Leftovers of an install that never committed. Partial downloads
+        # (.part) stay so the downloader can resume them.
+        for name in os.listdir(STAGE):
+            if not name.endswith('.part'):
+                _remove(self.path(name))
+        reset_stats()
+
+    def path(self, name):
+        return '%s/%s' % (STAGE, name)
+
+    def add(self, name, digest, size):
+        """Record a file already written to path(name), checked against digest"""
+        self.files[name] = [digest, size]
+
+    def place(self, tmp, name, digest, size):
+        """Move a finished temporary file into the stage and record it"""
+        _replace(tmp, self.path(name))
+        self.add(name, digest, size)
+
+    def commit(self, code_path, mpy_path=None, digest=None):
+        """Make the install real and move everything into place. Returns the app digest.
+
+        digest is the source's, if known; it is needed when only the .mpy was fetched.
+        """
+        digest = digest or asset_cache.file_digest(code_path)
+        record = {'files': self.files, 'code': code_path, 'mpy': mpy_path, 'app': digest}
+        tmp = COMMIT + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(record, f)
+            os.rename(tmp, COMMIT)
+            report()
+            apply(record)
+        finally:
+            self.close()
+        return digest
+
+    def close(self):
+        """Give STAGE up without installing. The next Stage() clears what is in it."""
+        global _owner
+        with _lock:
+            if _owner is self:
+                _owner = None
+
+
+def busy():
+    """True while a Stage on another thread owns STAGE"""
+    owner = _owner
+    return owner is not None and owner.thread != _ident()
+
+
+def apply(record):
+    """Move committed files into place. Safe to run again after a power loss."""
+    import app_cache
+    manifest = asset_cache.load()
+    for name, (digest, size) in record['files'].items():
+        staged = '%s/%s' % (STAGE, name)
+        if asset_cache.file_size(staged) == size:
+            _replace(staged, name)
+        elif asset_cache.file_size(name) != size:
+            raise OSError('staged %s is gone' % name)
+        if name.endswith('.png'):
+            manifest[name[:-4]] = [digest, size]
+    asset_cache.save(manifest)
+    if _exists(record['code']) or (record['mpy'] and _exists(record['mpy'])):
+        app_cache.install(record['code'], record['mpy'], record['app'])
+    else:
+        # moved into the app cache before the power went
+        app_cache.set_pending(record['app'])
+    _remove(COMMIT)
+    print(f"Installed {len(record['files'])} files and app {record['app']}")
+
+
+def recover():
+    """At boot: finish a committed install, if one was interrupted"""
+    if not _exists(COMMIT):
+        return False
+    with open(COMMIT) as f:
+        record = json.load(f)
+    print("Finishing interrupted install")
+    apply(record)
+    return True
+
+
+def compare_writes(path='_write_bench.tmp', size=65536, small=256):
+    """Time many small f.write calls against BlockWriter on this filesystem.
+
+    Prints and returns (small_kbs, block_kbs).
+    """
+    data = bytes(small)
+    start = ticks_us()
+    with open(path, 'wb') as f:
+        for _ in range(size // small):
+            f.write(data)
+    small_kbs = size * 1000000 // max(ticks_diff(ticks_us(), start), 1) // 1024
+    saved = dict(stats)
+    start = ticks_us()
+    with BlockWriter(path) as f:
+        for _ in range(size // small):
+            f.write(data)
+    block_kbs = size * 1000000 // max(ticks_diff(ticks_us(), start), 1) // 1024
+    stats.update(saved)
+    _remove(path)
+    print(f"Flash writes of {size} bytes: {small} B writes {small_kbs} KB/s, "
+          f"{BLOCK} B blocks {block_kbs} KB/s")
+    return small_kbs, block_kbs
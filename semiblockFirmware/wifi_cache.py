@@ -0,0 +1,80 @@
+"""Last good WiFi access point, kept on flash.
+
+With a record the firmware starts associating before the display is even
+initialized, and goes straight to the known BSSID and channel instead of
+scanning.
+"""
+import json
+
+try:
+    import ubinascii as binascii
+except ImportError:
+    import binascii
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+RECORD = 'wifi.json'
+
+
+def load():
+    """{'ssid', 'password', 'bssid', 'channel'} of the last good AP, or None"""
+    try:
+        with open(RECORD) as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return record if record.get('ssid') else None
+
+
+def save(ssid, password, bssid=None, channel=None):
+    if isinstance(bssid, bytes):
+        bssid = binascii.hexlify(bssid).decode()
+    record = {'ssid': ssid, 'password': password, 'bssid': bssid, 'channel': channel}
+    if record == load():
+        return  # nothing changed, spare the flash write
+    with open(RECORD, 'w') as f:
+        json.dump(record, f)
+    print(f"Saved WiFi record for {ssid} (channel {channel})")
+
+
+def clear():
+    try:
+        os.remove(RECORD)
+    except OSError:
+        pass
+
+
+def start(wlan, ssid, password, bssid=None, channel=None):
+    """Kick off association without waiting for it.
+
+    The ESP32 driver connects in the background, so display init can run
+    while this happens. Known channel and BSSID (bytes or hex) are passed on
+    when the port supports them.
+    """
+    wlan.active(True)
+    if channel:
+        try:
+            wlan.config(channel=channel)
+        except (OSError, ValueError, TypeError):
+            pass
+    if bssid:
+        if isinstance(bssid, str):
+            bssid = binascii.unhexlify(bssid)
+        try:
+            wlan.connect(ssid, password, bssid=bssid)
+            return
+        except (OSError, ValueError, TypeError):
+            pass
+    wlan.connect(ssid, password)
+
+
+def remember(wlan, ssid, password, bssid=None):
+    """Store the AP we just connected to"""
+    try:
+        channel = wlan.config('channel')
+    except (OSError, ValueError):
+        channel = None
+    save(ssid, password, bssid, channel)
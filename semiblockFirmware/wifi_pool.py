@@ -0,0 +1,168 @@
+"""WiFi network list backed by a fixed pool of LVGL rows.
+
+NetworkTable merges scan results by SSID and ages out networks that stop
+showing up. WifiListPool creates its rows once and afterwards only changes
+their text, icon colour and visibility, so a refresh allocates next to
+nothing and never rebuilds widgets or click callbacks.
+"""
+import gc
+
+import lvgl as lv
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+# Rows in the list, i.e. the most networks shown, strongest first. The list
+# before the pool showed the same: it went through the 20 strongest scan
+# results and stopped at 10 different SSIDs. Every row is created up front
+# and kept, so more rows cost LVGL heap for the firmware's whole life.
+ROWS = 10
+
+# A network missing from this many scans in a row is dropped
+MAX_AGE = 3
+
+# Icon colours by signal strength, strongest first: (min rssi, colour)
+SIGNAL_COLORS = ((-50, 0x00C000), (-60, 0x80C000), (-70, 0xE0A000), (-200, 0xE04000))
+
+
+def heap_used():
+    try:
+        return gc.mem_alloc()
+    except AttributeError:
+        return 0
+
+
+class NetworkTable:
+    """Scan results merged by SSID: ssid -> [bssid, channel, rssi, auth, age]"""
+
+    def __init__(self, max_age=MAX_AGE):
+        self.max_age = max_age
+        self.nets = {}
+
+    def merge(self, scan):
+        for entry in self.nets.values():
+            entry[4] += 1
+        for net in scan:
+            ssid = net[0].decode('utf-8') if isinstance(net[0], bytes) else net[0]
+            if not ssid:
+                continue  # hidden network
+            entry = self.nets.get(ssid)
+            if entry is None:
+                self.nets[ssid] = [net[1], net[2], net[3], net[4], 0]
+            elif entry[4] > 0 or net[3] > entry[2]:
+                # first sighting in this scan, or a stronger AP for the same SSID
+                entry[0], entry[1], entry[2], entry[3], entry[4] = net[1], net[2], net[3], net[4], 0
+        for ssid in [s for s, e in self.nets.items() if e[4] > self.max_age]:
+            del self.nets[ssid]
+
+    def top(self, n=ROWS):
+        """Strongest n networks as (ssid, entry)"""
+        return sorted(self.nets.items(), key=lambda item: -item[1][2])[:n]
+
+
+class WifiListPool:
+    """A fixed set of rows in an lv.list, updated in place.
+
+    on_select(ssid, auth, bssid) is called when a row is tapped.
+    """
+
+    def __init__(self, wifi_list, on_select, rows=ROWS):
+        self.list = wifi_list
+        self.on_select = on_select
+        self.rows = []
+        self.shown = [None] * rows  # what each row currently displays
+        self.keys = [None] * rows   # (ssid, auth, bssid) behind each row
+        for i in range(rows):
+            btn = wifi_list.add_button(lv.SYMBOL.WIFI, "")
+            btn.set_style_bg_color(lv.color_hex(0xaaaaaa), 0)
+            info = lv.label(btn)
+            info.set_text("")
+            info.set_style_text_color(lv.color_hex(0x333333), 0)
+            btn.add_event_cb(lambda e, i=i: self._clicked(i), lv.EVENT.CLICKED, None)
+            btn.add_flag(lv.obj.FLAG.HIDDEN)
+            self.rows.append((btn, btn.get_child(0), btn.get_child(1), info))
+
+    def _clicked(self, i):
+        key = self.keys[i]
+        if key:
+            self.on_select(*key)
+
+    def show(self, table):
+        """Update rows from a NetworkTable. Returns (microseconds, heap bytes allocated)."""
+        start = ticks_us()
+        before = heap_used()
+        top = table.top(len(self.rows))
+        for i, (btn, icon, name, info) in enumerate(self.rows):
+            if i >= len(top):
+                if self.shown[i] is not None:
+                    btn.add_flag(lv.obj.FLAG.HIDDEN)
+                    self.shown[i] = None
+                    self.keys[i] = None
+                continue
+            ssid, (bssid, channel, rssi, auth, age) = top[i]
+            self.keys[i] = (ssid, auth, bssid)
+            view = (ssid, rssi // 5, auth > 0)
+            if view == self.shown[i]:
+                continue
+            old = self.shown[i]
+            if old is None:
+                btn.remove_flag(lv.obj.FLAG.HIDDEN)
+            if old is None or old[0] != ssid:
+                name.set_text(ssid)
+            for level, color in SIGNAL_COLORS:
+                if rssi > level:
+                    icon.set_style_text_color(lv.color_hex(color), 0)
+                    break
+            info.set_text(("%d dBm " % rssi) + (lv.SYMBOL.EYE_CLOSE if auth > 0 else ""))
+            self.shown[i] = view
+        return ticks_diff(ticks_us(), start), heap_used() - before
+
+
+def compare_refresh(parent, scan, rounds=10):
+    """Time the old clean-and-rebuild refresh against the pooled one on this device.
+
+    Both run on hidden scratch lists with the same scan results. Prints and
+    returns ((rebuild_us, rebuild_bytes), (pooled_us, pooled_bytes)) per refresh.
+    """
+    scratch = lv.list(parent)
+    scratch.add_flag(lv.obj.FLAG.HIDDEN)
+    gc.collect()
+    gc.disable()  # so the heap delta counts every allocation
+    start, before = ticks_us(), heap_used()
+    for _ in range(rounds):
+        scratch.clean()
+        for net in sorted(scan, key=lambda x: x[3], reverse=True)[:ROWS]:
+            ssid = net[0].decode('utf-8') if isinstance(net[0], bytes) else net[0]
+            btn = scratch.add_button(None, ssid)
+            btn.add_event_cb(lambda e, s=ssid: None, lv.EVENT.CLICKED, None)
+            btn.set_style_bg_color(lv.color_hex(0xaaaaaa), 0)
+    rebuild = (ticks_diff(ticks_us(), start) // rounds, (heap_used() - before) // rounds)
+    gc.enable()
+    scratch.delete()
+
+    scratch = lv.list(parent)
+    scratch.add_flag(lv.obj.FLAG.HIDDEN)
+    pool = WifiListPool(scratch, lambda *a: None)
+    table = NetworkTable()
+    gc.collect()
+    gc.disable()
+    start, before = ticks_us(), heap_used()
+    for i in range(rounds):
+        # alternate between the scan and a copy with shifted RSSI so rows really change
+        table.merge([n[:3] + (n[3] - (i % 2) * 7,) + n[4:] for n in scan])
+        pool.show(table)
+    pooled = (ticks_diff(ticks_us(), start) // rounds, (heap_used() - before) // rounds)
+    gc.enable()
+    scratch.delete()
+
+    print(f"WiFi list refresh: rebuild {rebuild[0]} us / {rebuild[1]} B, "
+          f"pooled {pooled[0]} us / {pooled[1]} B")
+    return rebuild, pooled
@@ -1,12 +1,12 @@
 import lcd_bus
 from micropython import const
 import machine
-from time import sleep
 import st7796
 import lvgl as lv
 import utime as time
-from fs_driver import fs_register
 from machine import Pin, I2C
+import frame_loop
+import images
 
 # display settings for Waveshare ESP32-S3-Touch-LCD-3.5
 # Resolution
@@ -128,16 +128,13 @@ label.set_style_text_color(lv.color_hex(0x00ffff), 0)
 label.set_style_text_font(lv.font_montserrat_16, 0)
 print("Label created")
 
-fs_drv = lv.fs_drv_t()
-fs_register(fs_drv, "S")
+# Pre-scaled RGB565 from assets.json (make assets): nothing to decode here
 img = lv.image(scrn)
-img.set_src("S:blue_1.png")
-img.set_size(480, 85)
+img.set_src(images.load('blue_1'))
 img.set_pos(0, 0)
 
 img = lv.image(scrn)
-img.set_src("S:sps.jpg")
-img.set_size(480, 344)
+img.set_src(images.load('sps'))
 img.set_pos(0, 85)
 
 print("Refreshing display...")
@@ -145,8 +142,9 @@ lv.refr_now(lv.screen_active().get_display())
 lv.task_handler()
 print("Display refreshed - you should see red screen with white text")
 
+# The screen is static: after the first frame nothing is rendered again
+loop = frame_loop.FrameLoop(report_s=10)
+
 print("Entering main loop...")
 while True:
-	lv.refr_now(lv.screen_active().get_display())
-	lv.task_handler()
-	sleep(0.5)
+	loop.step()
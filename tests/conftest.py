@@ -0,0 +1,43 @@
+"""Host tests for the firmware's download path, run with CPython:
+
+    pip install pytest
+    python3 -m pytest tests
+
+The firmware modules use paths relative to the current directory, as on
+the board, so every test runs in its own empty directory.
+"""
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'semiblockFirmware'), os.path.join(ROOT, 'tools')]
+
+
+@pytest.fixture(autouse=True)
+def flash(tmp_path, monkeypatch):
+    """An empty directory standing in for the board's filesystem"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+class Trickle:
+    """A stream whose read(n) returns 1 to n bytes, like a socket does"""
+
+    def __init__(self, data, seed):
+        self.data = data
+        self.pos = 0
+        self.rng = random.Random(seed)
+
+    def read(self, n):
+        n = self.rng.randint(1, max(n, 1))
+        out = self.data[self.pos:self.pos + n]
+        self.pos += len(out)
+        return out
+
+
+@pytest.fixture
+def trickle():
+    return Trickle
@@ -0,0 +1,61 @@
+import builtins
+import os
+import sys
+
+import pytest
+
+import app_cache
+
+SOURCE = b'ran = "source"\n'
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def install(digest, mpy=True):
+    write('user_app.tmp', SOURCE)
+    if mpy:
+        write('user_app.mpy.tmp', b'M\x06\x00\x1f' + bytes(32))
+    return app_cache.install('user_app.tmp', 'user_app.mpy.tmp' if mpy else None, digest)
+
+
+@pytest.fixture
+def mpy_import(monkeypatch):
+    """__import__ for app_cache that loads a .mpy the way a mismatched firmware does"""
+    real = builtins.__import__
+
+    def fake(name, *args):
+        if name.startswith('app_') and os.path.exists('%s/%s.mpy' % (app_cache.APP_DIR, name)):
+            raise ValueError('incompatible .mpy file')
+        return real(name, *args)
+    monkeypatch.setattr(app_cache, '__import__', fake, raising=False)
+    monkeypatch.syspath_prepend(app_cache.APP_DIR)
+
+
+def test_install_keeps_source_next_to_mpy():
+    digest = install('a1')
+    assert sorted(os.listdir(app_cache.APP_DIR)) == ['app_a1.mpy', 'app_a1.src']
+    assert app_cache.cached(digest) == 'apps/app_a1.mpy'
+    assert app_cache.pending() == digest
+    assert not os.path.exists('user_app.tmp')
+
+
+def test_install_without_mpy():
+    install('a2', mpy=False)
+    assert os.listdir(app_cache.APP_DIR) == ['app_a2.py']
+
+
+def test_incompatible_mpy_runs_the_source(mpy_import):
+    install('a3')
+    app_cache._import('a3')
+    assert sys.modules.pop('app_a3').ran == 'source'
+    assert sorted(os.listdir(app_cache.APP_DIR)) == ['app_a3.py']
+
+
+def test_other_value_errors_are_the_app_s(mpy_import):
+    install('a4', mpy=False)
+    write('apps/app_a4.py', b'raise ValueError("bad input")\n')
+    with pytest.raises(ValueError):
+        app_cache._import('a4')
@@ -0,0 +1,105 @@
+import io
+import os
+import random
+
+import pytest
+
+import bundle
+import bundle_pack
+
+
+def project(seed):
+    """(kind, name, data) entries with a compressible code file and random and flat images"""
+    rng = random.Random(seed)
+    code = b''.join(b'print(%d)\n' % i for i in range(rng.randint(0, 400)))
+    entries = [(bundle_pack.KIND_CODE, 'user_app', code)]
+    for i in range(rng.randint(0, 4)):
+        if rng.random() < 0.5:
+            data = bytes(rng.getrandbits(8) for _ in range(rng.randint(0, 5000)))
+        else:
+            data = bytes((i,)) * rng.randint(0, 20000)
+        entries.append((bundle_pack.KIND_ASSET, 'img%d' % i, data))
+    return entries
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_formats_match():
+    for name in ('MAGIC', 'HEADER', 'ENTRY', 'KIND_CODE', 'KIND_ASSET', 'KIND_MPY',
+                 'METHOD_RAW', 'METHOD_DEFLATE', 'METHOD_CACHED', 'WBITS'):
+        assert getattr(bundle, name) == getattr(bundle_pack, name), name
+
+
+@pytest.mark.parametrize('seed', range(12))
+def test_round_trip(seed, trickle):
+    entries = project(seed)
+    data = bundle_pack.pack(entries, compress=seed % 3 != 0)
+    stream = io.BytesIO(data) if seed % 2 else trickle(data, seed)
+    manifest = {}
+    u = bundle.Unpacker(stream, 'user_app.tmp', manifest=manifest).unpack()
+
+    assert u.success and u.error is None
+    assert u.total == len(data)
+    code = entries[0][2]
+    assert read('user_app.tmp') == code
+    assert u.code_size == len(code)
+    assets = entries[1:]
+    assert u.images == [(name, len(body)) for _, name, body in assets]
+    for _, name, body in assets:
+        assert read(name + '.png') == body
+        assert manifest[name] == [bundle_pack.digest(body).hex(), len(body)]
+
+
+def test_mpy_entry():
+    entries = project(1) + [(bundle_pack.KIND_MPY, 'user_app', b'M\x06\x00\x1f' + bytes(300))]
+    u = bundle.Unpacker(io.BytesIO(bundle_pack.pack(entries)), 'user_app.tmp').unpack()
+    assert u.mpy_path == 'user_app.mpy.tmp'
+    assert read(u.mpy_path) == entries[-1][2]
+
+
+def test_cached_assets_are_skipped():
+    entries = project(5)
+    assets = entries[1:]
+    manifest = {}
+    bundle.Unpacker(io.BytesIO(bundle_pack.pack(entries)), manifest=manifest).unpack()
+    have = {name: manifest[name][0] for _, name, _ in assets}
+
+    data = bundle_pack.pack(entries, have=have)
+    u = bundle.Unpacker(io.BytesIO(data), manifest=manifest).unpack()
+    assert u.success and u.images == []
+    assert u.unchanged == [(name, len(body)) for _, name, body in assets]
+
+
+def test_cached_asset_missing_on_flash():
+    entries = project(7)
+    name = entries[1][1]
+    data = bundle_pack.pack(entries, have={name: bundle_pack.digest(entries[1][2]).hex()})
+    u = bundle.Unpacker(io.BytesIO(data), manifest={})
+    with pytest.raises(ValueError):
+        u.unpack()
+    assert u.error == 'server skipped %s but it is not on flash' % name
+
+
+def test_corrupt_entry_is_removed():
+    entries = [(bundle_pack.KIND_CODE, 'user_app', b'print(1)\n' * 50)]
+    data = bytearray(bundle_pack.pack(entries, compress=False))
+    data[-1] ^= 0xFF
+    with pytest.raises(ValueError):
+        bundle.Unpacker(io.BytesIO(bytes(data)), 'user_app.tmp').unpack()
+    assert not os.path.exists('user_app.tmp')
+
+
+@pytest.mark.parametrize('compress', (True, False))
+def test_truncated_bundle(compress, trickle):
+    data = bundle_pack.pack(project(2), compress=compress)
+    for cut in range(1, len(data), max(1, len(data) // 40)):
+        with pytest.raises(ValueError):
+            bundle.Unpacker(trickle(data[:cut], cut), manifest={}).unpack()
+
+
+def test_not_a_bundle():
+    with pytest.raises(ValueError):
+        bundle.Unpacker(io.BytesIO(b'{"success": true}')).index()
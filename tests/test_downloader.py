@@ -0,0 +1,142 @@
+import os
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import asset_cache
+import downloader
+
+BODY = random.Random(9).randbytes(50000)
+
+
+def digest(data):
+    h = asset_cache.new_hasher()
+    h.update(data)
+    return asset_cache.hexdigest(h)
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """Serves BODY with Range, cutting the n-th reply off after cuts[n] body bytes"""
+    protocol_version = 'HTTP/1.1'
+    cuts = []
+    ranges = True
+    seen = []
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        spec = self.headers.get('Range')
+        self.seen.append(spec)
+        start = int(spec[6:].split('-')[0]) if spec and self.ranges else 0
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(BODY) - 1, len(BODY)))
+        self.send_header('Content-Length', str(len(BODY) - start))
+        self.end_headers()
+        cut = self.cuts.pop(0) if self.cuts else None
+        self.wfile.write(BODY[start:] if cut is None else BODY[start:start + cut])
+        if cut is not None:
+            self.wfile.flush()
+            self.close_connection = True
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """server(cuts=(), ranges=True, retries=None) -> (Downloader, the Range header of each request)"""
+    monkeypatch.setattr(downloader, 'BACKOFF_MS', 1)
+    started = []
+
+    def start(cuts=(), ranges=True, retries=None):
+        seen = []
+        handler = type('Handler', (FileHandler,), {'cuts': list(cuts), 'ranges': ranges, 'seen': seen})
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        d = downloader.Downloader('http://127.0.0.1:%d' % httpd.server_port, retries=retries)
+        started.append((httpd, d))
+        return d, seen
+    yield start
+    for httpd, d in started:
+        d.close()
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_fetch(server):
+    d, seen = server()
+    d.fetch_file('/f', 'logo.png', len(BODY), digest(BODY))
+    assert read('logo.png') == BODY and not os.path.exists('logo.png.part')
+    assert seen == [None]
+    assert (d.stats.total, d.stats.retries, d.stats.resent) == (len(BODY), 0, 0)
+
+
+def test_resumes_where_each_cut_left_off(server):
+    d, seen = server(cuts=(10000, 7, 19993))
+    d.fetch_file('/f', 'logo.png', len(BODY), digest(BODY))
+    assert read('logo.png') == BODY
+    assert seen == [None, 'bytes=10000-', 'bytes=10007-', 'bytes=30000-']
+    assert (d.stats.total, d.stats.retries, d.stats.resent) == (len(BODY), 3, 0)
+
+
+def test_resumes_a_part_left_by_a_reset(server):
+    write('logo.png.part', BODY[:12345])
+    d, seen = server()
+    d.fetch_file('/f', 'logo.png', len(BODY), digest(BODY))
+    assert read('logo.png') == BODY
+    assert seen == ['bytes=12345-']
+    assert d.stats.total == len(BODY) - 12345
+
+
+def test_server_ignoring_range_starts_over(server):
+    write('logo.png.part', BODY[:12345])
+    d, seen = server(ranges=False)
+    d.fetch_file('/f', 'logo.png', len(BODY), digest(BODY))
+    assert read('logo.png') == BODY
+    assert seen == ['bytes=12345-']
+    assert (d.stats.total, d.stats.resent) == (len(BODY), 12345)
+
+
+def test_part_longer_than_the_file_is_dropped(server):
+    write('logo.png.part', BODY + b'junk')
+    d, seen = server()
+    d.fetch_file('/f', 'logo.png', len(BODY), digest(BODY))
+    assert read('logo.png') == BODY
+    assert seen == [None]
+
+
+def test_complete_part_is_only_checked(server):
+    write('logo.png.part', BODY)
+    d, seen = server()
+    d.fetch_file('/f', 'logo.png', len(BODY), digest(BODY))
+    assert read('logo.png') == BODY
+    assert seen == []
+
+
+def test_digest_mismatch_drops_the_part(server):
+    write('logo.png', b'old image')
+    d, seen = server(retries=0)
+    with pytest.raises(ValueError):
+        d.fetch_file('/f', 'logo.png', len(BODY), digest(b'another file'))
+    assert not os.path.exists('logo.png.part')
+    assert read('logo.png') == b'old image'
+
+
+def test_gives_up_after_retries_keeping_the_part(server):
+    d, seen = server(cuts=(100, 100, 100), retries=2)
+    with pytest.raises(OSError):
+        d.fetch_file('/f', 'logo.png', len(BODY), digest(BODY))
+    assert seen == [None, 'bytes=100-', 'bytes=200-']
+    assert read('logo.png.part') == BODY[:300] and not os.path.exists('logo.png')
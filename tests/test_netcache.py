@@ -0,0 +1,110 @@
+import struct
+
+import pytest
+
+import netcache
+
+
+def name(host):
+    return b''.join(bytes((len(label),)) + label.encode() for label in host.split('.')) + b'\x00'
+
+
+def answer(rtype, ttl, rdata, owner=b'\xc0\x0c'):
+    """One answer record; owner defaults to a pointer to the question's name"""
+    return owner + struct.pack('>HHIH', rtype, 1, ttl, len(rdata)) + rdata
+
+
+class DnsServer:
+    """socket.socket stand-in that answers a query with reply(qid, question)"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.queries = []
+
+    def socket(self, *args):
+        return self
+
+    def getaddrinfo(self, host, port, *args):
+        return [(2, 1, 0, '', (host, port))]
+
+    def settimeout(self, timeout):
+        pass
+
+    def sendto(self, msg, addr):
+        self.queries.append((msg, addr))
+
+    def recv(self, n):
+        msg = self.queries[-1][0]
+        return self.reply(msg[:2], msg[12:])
+
+    def close(self):
+        pass
+
+
+def reply(answers, rcode=0, qdcount=1):
+    def build(qid, question):
+        head = qid + struct.pack('>HHHHH', 0x8180 | rcode, qdcount, len(answers), 0, 0)
+        return head + question * qdcount + b''.join(answers)
+    return build
+
+
+@pytest.fixture
+def server(monkeypatch):
+    def use(reply):
+        fake = DnsServer(reply)
+        monkeypatch.setattr(netcache, 'socket', fake)
+        for key in ('AF_INET', 'SOCK_DGRAM', 'SOCK_STREAM'):
+            setattr(fake, key, 0)
+        return fake
+    return use
+
+
+def test_a_record(server):
+    fake = server(reply([answer(1, 600, bytes((93, 184, 216, 34)))]))
+    assert netcache.query('example.com', '8.8.8.8') == ('93.184.216.34', 600)
+    msg, addr = fake.queries[0]
+    assert msg[12:] == name('example.com') + struct.pack('>HH', 1, 1)
+    assert addr == ('8.8.8.8', 53)
+
+
+def test_cname_chain_uses_the_lowest_ttl(server):
+    target = name('edge.cdn.net')
+    server(reply([answer(5, 60, target), answer(1, 3600, bytes((10, 0, 0, 1)), owner=target)]))
+    assert netcache.query('www.example.com', '1.1.1.1') == ('10.0.0.1', 60)
+
+
+def test_aaaa_only_is_no_a_record(server):
+    server(reply([answer(28, 300, bytes(16))]))
+    with pytest.raises(OSError):
+        netcache.query('v6.example.com', '1.1.1.1')
+
+
+def test_dns_error(server):
+    server(reply([], rcode=3))  # NXDOMAIN
+    with pytest.raises(OSError):
+        netcache.query('nope.example.com', '1.1.1.1')
+
+
+def test_reply_to_another_query(server):
+    server(lambda qid, question: reply([answer(1, 60, bytes(4))])(bytes((qid[0] ^ 1, qid[1])), question))
+    with pytest.raises(OSError):
+        netcache.query('example.com', '1.1.1.1')
+
+
+def test_resolve_caches_for_the_ttl(server, monkeypatch):
+    fake = server(reply([answer(1, 120, bytes((10, 0, 0, 2)))]))
+    monkeypatch.setattr(netcache, 'DNS_SERVER', '1.1.1.1')
+    monkeypatch.setattr(netcache, '_cache', None)
+    now = [1000.0]
+    monkeypatch.setattr(netcache.time, 'time', lambda: now[0])
+
+    assert netcache.resolve('api.example.com', 443) == ('10.0.0.2', 443)
+    assert netcache.resolve('api.example.com', 443) == ('10.0.0.2', 443)
+    assert len(fake.queries) == 1
+    monkeypatch.setattr(netcache, '_cache', None)  # as after a reset: read back from CACHE
+    now[0] += 119
+    netcache.resolve('api.example.com', 443)
+    assert len(fake.queries) == 1
+    now[0] += 2
+    netcache.resolve('api.example.com', 443)
+    assert len(fake.queries) == 2
@@ -0,0 +1,179 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+import ota
+import project_server
+
+OLD = b'booted = "a"\n'
+NEW = b'booted = "b"\n'
+
+
+@pytest.fixture(autouse=True)
+def slots(flash, monkeypatch):
+    """fw_a/fw_b importable from the test directory, none of them imported yet"""
+    monkeypatch.syspath_prepend(str(flash))
+    monkeypatch.setattr(ota, 'running', None)
+    yield
+    for slot in ota.SLOTS:
+        sys.modules.pop(ota.module_name(slot), None)
+
+
+@pytest.fixture
+def release(flash, monkeypatch):
+    """A local firmware server: release(version, data) publishes, returns the getFirmware url"""
+    monkeypatch.setattr(project_server, 'compiled_mpy', lambda source: None)
+    path = str(flash / 'release.py')
+    servers = []
+
+    def publish(version, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+        if not servers:
+            servers.append(project_server.serve(str(flash), port=0, firmware=(path, version)))
+        servers[0].RequestHandlerClass.firmware = (path, version)
+        return 'http://127.0.0.1:%d/api/getFirmware' % servers[0].server_port
+    yield publish
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    importlib.invalidate_caches()
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def boot():
+    """ota.boot() as after a reset; returns the slot that ran"""
+    for slot in ota.SLOTS:
+        sys.modules.pop(ota.module_name(slot), None)
+    ota.boot()
+    return sys.modules[ota.module_name(ota.running)].booted
+
+
+def on_trial(version='2.0'):
+    """Slot a active, slot b freshly installed by update()"""
+    write('fw_a.py', OLD)
+    write('fw_b.py', NEW)
+    state = ota.load()
+    state.update(trial='b', versions={'b': version}, digests={'b': '0123456789abcdef'})
+    ota.save(state)
+
+
+def test_boots_active_slot():
+    write('fw_a.py', OLD)
+    assert boot() == 'a'
+    assert not ota.trial()
+    ota.mark_ready()
+    assert ota.load()['active'] == 'a'
+
+
+def test_boots_the_slot_that_is_there():
+    write('fw_b.py', NEW)
+    assert boot() == 'b'
+
+
+def test_trial_slot_kept_once_ready():
+    on_trial()
+    assert boot() == 'b'
+    assert ota.trial() and ota.load()['tries'] == 1
+    ota.mark_ready()
+    assert not ota.trial()
+    state = ota.load()
+    assert (state['active'], state['trial'], state['tries']) == ('b', None, 0)
+    assert ota.version() == '2.0'
+    assert boot() == 'b'
+
+
+def test_trial_not_ready_by_next_boot_rolls_back():
+    on_trial()
+    assert boot() == 'b'
+    assert boot() == 'a'  # reset before mark_ready()
+    state = ota.load()
+    assert (state['active'], state['trial'], state['rejected']) == ('a', None, '2.0')
+    assert boot() == 'a'
+
+
+def test_trial_that_raises_rolls_back():
+    on_trial()
+    write('fw_b.py', b'raise RuntimeError("no display")\n')
+    with pytest.raises(RuntimeError):
+        boot()  # machine.reset() on the board
+    state = ota.load()
+    assert (state['active'], state['trial'], state['rejected']) == ('a', None, '2.0')
+    assert boot() == 'a'
+
+
+def test_active_slot_that_raises_stays_active():
+    write('fw_a.py', b'raise RuntimeError("bug")\n')
+    with pytest.raises(RuntimeError):
+        boot()
+    assert ota.load()['active'] == 'a' and not os.path.exists(ota.STATE)
+
+
+def test_update_installs_into_the_other_slot(release):
+    write('fw_a.py', OLD)
+    boot()
+    url = release('2.0', NEW)
+    assert ota.update(url, current_version='1.0') == '2.0'
+    assert read('fw_b.py') == NEW and not os.path.exists('fw_b.py.part')
+    state = ota.load()
+    assert (state['active'], state['trial'], state['tries']) == ('a', 'b', 0)
+    assert state['versions'] == {'b': '2.0'}
+    assert len(state['digests']['b']) == 16
+
+    assert boot() == 'b'
+    ota.mark_ready()
+    assert ota.update(url) is None  # running it already
+    assert ota.load()['trial'] is None
+
+
+def test_update_skips_the_running_version(release):
+    write('fw_a.py', OLD)
+    boot()
+    assert ota.update(release('1.0', NEW), current_version='1.0') is None
+    assert not os.path.exists('fw_b.py')
+
+
+def test_update_skips_the_running_digest(release):
+    """A release that forgot to bump its version is not installed again"""
+    on_trial('2.0')
+    state = ota.load()
+    state['digests']['b'] = project_server.firmware_manifest({'fw.py': NEW}, '2.0')['data']['file']['digest']
+    ota.save(state)
+    boot()
+    ota.mark_ready()
+    assert ota.update(release('2.1', NEW)) is None
+    assert ota.load()['trial'] is None
+
+
+def test_update_skips_a_rejected_version(release):
+    on_trial('2.0')
+    boot()
+    boot()  # rolled back
+    assert ota.update(release('2.0', NEW), current_version='1.0') is None
+    assert ota.update(release('2.1', NEW), current_version='1.0') == '2.1'
+
+
+def test_update_prefers_mpy_and_drops_the_stale_py(release, monkeypatch):
+    write('fw_a.py', OLD)
+    write('fw_b.py', b'old trial\n')
+    boot()
+    monkeypatch.setattr(project_server, 'compiled_mpy', lambda source: b'M\x06\x00\x1f' + source.encode())
+    assert ota.update(release('2.0', NEW), current_version='1.0') == '2.0'
+    assert read('fw_b.mpy') == b'M\x06\x00\x1f' + NEW
+    assert not os.path.exists('fw_b.py')
+
+
+def test_update_needs_boot(release):
+    assert ota.update(release('2.0', NEW)) is None
+    assert not os.path.exists(ota.STATE)
@@ -0,0 +1,24 @@
+import profiler
+
+
+def test_spans_nest():
+    profiler.reset()
+    with profiler.span('boot'):
+        with profiler.span('board'):
+            profiler.mark('ready')
+    assert [(n, d) for n, _, _, d in profiler.spans()] == [('boot', 0), ('board', 1), ('ready', 2)]
+    assert all(dur >= 0 for _, _, dur, _ in profiler.spans())
+
+
+def test_spans_past_max_depth_leave_the_outer_ones_open():
+    profiler.reset()
+    for i in range(profiler.MAX_DEPTH + 3):
+        profiler.begin('s%d' % i)
+    for _ in range(profiler.MAX_DEPTH + 3 - 1):
+        profiler.end()
+    spans = profiler.spans()
+    assert len(spans) == profiler.MAX_DEPTH
+    assert spans[0][2] == -1  # s0 is still open
+    assert all(dur >= 0 for _, _, dur, _ in spans[1:])
+    profiler.end()
+    assert profiler.spans()[0][2] >= 0
@@ -0,0 +1,131 @@
+import base64
+import json
+import os
+import random
+
+import pytest
+
+import asset_cache
+import project_stream
+from project_stream import Base64FileSink, JsonStream, ProjectHandler
+
+CODE = 'import lvgl as lv\nprint("h\\u00e9llo \\"w\\"\\t", "\U0001f600")\n# ünïcode\n'
+
+
+def reply(images, code=CODE, ensure_ascii=True, data_uri=True):
+    prefix = 'data:image/png;base64,' if data_uri else ''
+    return json.dumps({
+        'success': True,
+        'data': {
+            'code': code,
+            'images': [{'name': name, 'image_data': prefix + base64.b64encode(data).decode(),
+                        'digest': asset_cache.hexdigest(_hasher(data))}
+                       for name, data in images],
+        },
+    }, ensure_ascii=ensure_ascii, indent=1).encode()
+
+
+def _hasher(data):
+    h = asset_cache.new_hasher()
+    h.update(data)
+    return h
+
+
+def images(seed, count=3):
+    rng = random.Random(seed)
+    return [('img%d' % i, bytes(rng.getrandbits(8) for _ in range(rng.randint(0, 5000))))
+            for i in range(count)]
+
+
+def read(path, mode='rb'):
+    with open(path, mode) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_project_at_random_chunk_sizes(seed, trickle):
+    rng = random.Random(seed)
+    imgs = images(seed)
+    body = reply(imgs, ensure_ascii=rng.random() < 0.5, data_uri=rng.random() < 0.5)
+    handler = ProjectHandler('user_app.tmp')
+    parser = JsonStream(trickle(body, seed), handler, chunk=rng.choice((1, 2, 3, 7, 64, 1024)))
+    parser.parse()
+
+    assert handler.success
+    assert parser.total == len(body)
+    assert read('user_app.tmp', 'r') == CODE
+    assert handler.code_size == len(CODE.encode())
+    assert handler.images == [(name, len(data)) for name, data in imgs]
+    for name, data in imgs:
+        assert read(name + '.png') == data
+    assert not [n for n in os.listdir() if n.endswith('.tmp') and n != 'user_app.tmp']
+
+
+def test_unchanged_image_is_kept(trickle):
+    imgs = images(1)
+    manifest = {}
+    JsonStream(trickle(reply(imgs), 1), ProjectHandler(manifest=manifest)).parse()
+    before = os.stat('img0.png').st_mtime_ns
+
+    handler = ProjectHandler(manifest=manifest)
+    JsonStream(trickle(reply(imgs), 2), handler).parse()
+    assert handler.images == []
+    assert handler.unchanged == [(name, len(data)) for name, data in imgs]
+    assert os.stat('img0.png').st_mtime_ns == before
+
+
+def test_image_not_matching_its_digest_is_rejected(trickle):
+    body = json.loads(reply(images(3, 1)))
+    body['data']['images'][0]['digest'] = '0' * asset_cache.DIGEST_LEN
+    handler = ProjectHandler(manifest={})
+    with pytest.raises(ValueError):
+        JsonStream(trickle(json.dumps(body).encode(), 3), handler).parse()
+    assert handler.error == 'img0.png does not match its digest'
+    assert not os.path.exists('img0.png')
+
+
+def test_cached_image_on_flash_is_kept(trickle):
+    imgs = images(6, 1)
+    manifest = {}
+    JsonStream(trickle(reply(imgs), 6), ProjectHandler(manifest=manifest)).parse()
+    body = json.dumps({'success': True, 'data': {'code': CODE, 'images': [{'name': 'img0', 'cached': True}]}})
+    handler = ProjectHandler(manifest=manifest)
+    JsonStream(trickle(body.encode(), 7), handler).parse()
+    assert handler.success and handler.error is None
+    assert handler.unchanged == [('img0', len(imgs[0][1]))]
+    assert read('img0.png') == imgs[0][1]
+
+
+def test_cached_image_not_on_flash_is_an_error(trickle):
+    body = json.dumps({'success': True, 'data': {'code': CODE, 'images': [{'name': 'logo', 'cached': True}]}})
+    handler = ProjectHandler(manifest={})
+    with pytest.raises(ValueError):
+        JsonStream(trickle(body.encode(), 5), handler).parse()
+    assert handler.error == 'server skipped logo but it is not on flash'
+
+
+def test_truncated_reply_raises(trickle):
+    body = reply(images(4))
+    with pytest.raises(ValueError):
+        JsonStream(trickle(body[:len(body) // 2], 4), ProjectHandler()).parse()
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_base64_sink_at_random_chunk_sizes(seed):
+    rng = random.Random(seed)
+    data = bytes(rng.getrandbits(8) for _ in range(rng.randint(0, 3 * project_stream.CHUNK)))
+    text = base64.encodebytes(data) if rng.random() < 0.5 else base64.b64encode(data)
+    if rng.random() < 0.5:
+        text = b'data:image/png;base64,' + text
+    hasher = asset_cache.new_hasher()
+    sink = Base64FileSink('out.bin', hasher)
+    pos = 0
+    while pos < len(text):
+        n = rng.randint(1, 9)
+        sink.write(text[pos:pos + n])
+        pos += n
+    sink.close()
+
+    assert read('out.bin') == data
+    assert sink.size == len(data)
+    assert asset_cache.hexdigest(hasher) == asset_cache.hexdigest(_hasher(data))
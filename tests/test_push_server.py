@@ -0,0 +1,105 @@
+import io
+import json
+import random
+import threading
+
+import pytest
+
+import push_server
+import staging
+
+APP = b'print("pushed")\n'
+
+
+@pytest.fixture(autouse=True)
+def idle(monkeypatch):
+    monkeypatch.setattr(staging, '_owner', None)
+
+
+def multipart(files, boundary=b'xYzBoundary'):
+    out = b''
+    for name, data in files:
+        out += (b'--%s\r\nContent-Disposition: form-data; name="f"; filename="%s"\r\n'
+                b'Content-Type: application/octet-stream\r\n\r\n' % (boundary, name.encode()) + data + b'\r\n')
+    return out + b'--%s--\r\n' % boundary, boundary
+
+
+def request(body, boundary):
+    """(conn, stream) of a POST /push"""
+    head = (b'POST /push HTTP/1.1\r\nContent-Type: multipart/form-data; boundary=%s\r\n'
+            b'Content-Length: %d\r\n\r\n' % (boundary, len(body)))
+    return io.BytesIO(), io.BytesIO(head + body)
+
+
+def status(conn):
+    head, _, body = conn.getvalue().partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_push_installs():
+    conn, stream = request(*multipart([('app.py', APP)]))
+    digest = push_server.handle(conn, stream)
+    code, reply = status(conn)
+    assert code == 200 and reply['app'] == digest
+    assert not staging.busy()
+
+
+def test_push_while_a_download_is_staging():
+    download = []
+    t = threading.Thread(target=lambda: download.append(staging.Stage()))
+    t.start()
+    t.join()
+    conn, stream = request(*multipart([('app.py', APP)]))
+    assert push_server.handle(conn, stream) is None
+    assert status(conn)[0] == 409
+    download[0].close()
+
+
+def test_failed_push_gives_the_stage_back():
+    conn, stream = request(*multipart([('logo.png', b'png')]))
+    assert push_server.handle(conn, stream) is None
+    assert status(conn) == (400, {'error': 'upload has no .py'})
+    assert staging._owner is None
+
+
+class Collect:
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_multipart_at_random_read_sizes(seed, trickle, monkeypatch):
+    rng = random.Random(seed)
+    monkeypatch.setattr(push_server, 'CHUNK', rng.choice((1, 2, 5, 13, 64)))
+    # parts that end in bytes the boundary starts with, and contain most of it
+    files = [('a.py', APP + b'\r\n--xYzBound'), ('b.png', bytes(rng.getrandbits(8) for _ in range(3000))),
+             ('empty.png', b''), ('c.png', b'\r\n\r\n--xYzBoundar\r\n')]
+    body, boundary = multipart(files)
+    parts = push_server.Multipart(trickle(body, seed), boundary)
+    got = []
+    while True:
+        headers = parts.next()
+        if headers is None:
+            break
+        out = Collect()
+        parts.copy(out)
+        got.append((push_server._param(headers['content-disposition'], 'filename'), out.data))
+    assert got == files
+
+
+def test_multipart_truncated(trickle):
+    body, boundary = multipart([('a.py', APP)])
+    parts = push_server.Multipart(trickle(body[:-20], 1), boundary)
+    parts.next()
+    with pytest.raises(ValueError):
+        parts.copy(Collect())
+
+
+def test_multipart_bad_boundary():
+    body, _ = multipart([('a.py', APP)])
+    with pytest.raises(ValueError):
+        push_server.Multipart(io.BytesIO(body), b'other').next()
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+
+import pytest
+
+import app_cache
+import asset_cache
+import staging
+
+CODE = b'print("new app")\n'
+OLD = b'old image'
+NEW = b'new image, longer'
+
+
+@pytest.fixture(autouse=True)
+def idle(monkeypatch):
+    monkeypatch.setattr(staging, '_owner', None)
+    monkeypatch.setattr(staging, '_shared_busy', False)
+
+
+def on_thread(fn):
+    """fn() run on another thread: its result, or the exception it raised"""
+    out = []
+
+    def run():
+        try:
+            out.append(fn())
+        except Exception as e:
+            out.append(e)
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+    return out[0]
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def digest(data):
+    h = asset_cache.new_hasher()
+    h.update(data)
+    return asset_cache.hexdigest(h)
+
+
+def staged_install():
+    """An old logo.png on flash, a new one and new code in the stage. Returns (stage, record)."""
+    write('logo.png', OLD)
+    stage = staging.Stage()
+    write(stage.path('logo.tmp'), NEW)
+    stage.place(stage.path('logo.tmp'), 'logo.png', digest(NEW), len(NEW))
+    code_path = stage.path('user_app.tmp')
+    write(code_path, CODE)
+    record = {'files': stage.files, 'code': code_path, 'mpy': None, 'app': digest(CODE)}
+    return stage, record
+
+
+def power_loss_after_commit(record):
+    """What commit() leaves on flash if the power goes right after its rename"""
+    write(staging.COMMIT, json.dumps(record).encode())
+
+
+def test_nothing_to_recover():
+    assert staging.recover() is False
+
+
+def test_power_loss_before_commit_keeps_old_app():
+    staged_install()
+    assert staging.recover() is False
+    assert read('logo.png') == OLD
+    assert app_cache.pending() is None
+    staging.Stage()  # the next download clears the leftovers
+    assert os.listdir(staging.STAGE) == []
+
+
+def test_recover_finishes_committed_install():
+    _, record = staged_install()
+    power_loss_after_commit(record)
+
+    assert staging.recover() is True
+    assert read('logo.png') == NEW
+    assert asset_cache.load()['logo'] == [digest(NEW), len(NEW)]
+    assert read(app_cache.cached(record['app'])) == CODE
+    assert app_cache.pending() == record['app']
+    assert not os.path.exists(staging.COMMIT)
+    assert staging.recover() is False
+
+
+def test_recover_after_partial_apply():
+    _, record = staged_install()
+    power_loss_after_commit(record)
+    # the power went after the image and the code had been moved
+    os.remove('logo.png')
+    os.rename(staging.STAGE + '/logo.png', 'logo.png')
+    app_cache.install(record['code'], None, record['app'])
+    os.remove(app_cache.PENDING)
+
+    assert staging.recover() is True
+    assert read('logo.png') == NEW
+    assert app_cache.pending() == record['app']
+    assert not os.path.exists(staging.COMMIT)
+
+
+def test_commit_installs():
+    stage, record = staged_install()
+    assert stage.commit(record['code']) == record['app']
+    assert read('logo.png') == NEW
+    assert app_cache.pending() == record['app']
+    assert staging.recover() is False
+
+
+def test_one_install_at_a_time():
+    stage, record = staged_install()
+    assert not staging.busy()
+    assert on_thread(staging.busy) is True
+    assert isinstance(on_thread(staging.Stage), OSError)
+    assert read(stage.path('logo.png')) == NEW  # not cleared by the other thread
+
+    stage.commit(record['code'])
+    assert on_thread(staging.busy) is False
+    other = on_thread(staging.Stage)
+    assert isinstance(other, staging.Stage)
+    assert staging.busy()
+    other.close()
+    assert not staging.busy()
+
+
+def test_same_thread_takes_over():
+    staging.Stage()
+    stage = staging.Stage()
+    stage.close()
+    assert on_thread(staging.busy) is False
+
+
+def test_block_writers_on_two_threads():
+    first = staging.BlockWriter('a.bin')
+    second = on_thread(lambda: staging.BlockWriter('b.bin'))
+    assert first.buf is staging._shared and second.buf is not staging._shared
+    first.write(b'a' * 5000)
+    second.write(b'b' * 5000)
+    first.close()
+    second.close()
+    assert read('a.bin') == b'a' * 5000 and read('b.bin') == b'b' * 5000
+    assert not staging._shared_busy
@@ -0,0 +1,62 @@
+import sys
+import types
+
+# NetworkTable never touches LVGL; an empty module only gets wifi_pool imported
+_stand_in = 'lvgl' not in sys.modules
+if _stand_in:
+    sys.modules['lvgl'] = types.ModuleType('lvgl')
+import wifi_pool  # noqa: E402
+from wifi_pool import NetworkTable  # noqa: E402
+if _stand_in:
+    del sys.modules['lvgl']
+
+
+def net(ssid, rssi, bssid=b'\x00' * 6, channel=1, auth=3):
+    """One network.WLAN.scan() tuple"""
+    return (ssid, bssid, channel, rssi, auth, False)
+
+
+def test_merge_keeps_strongest_ap_per_ssid():
+    table = NetworkTable()
+    table.merge([net(b'home', -70, b'A'), net(b'home', -50, b'B'), net(b'home', -60, b'C'), net(b'', -30)])
+    assert list(table.nets) == ['home']
+    assert table.nets['home'][:3] == [b'B', 1, -50]
+
+
+def test_next_scan_replaces_older_reading():
+    table = NetworkTable()
+    table.merge([net(b'home', -50, b'B')])
+    table.merge([net(b'home', -75, b'C')])  # weaker, but this scan's reading
+    assert table.nets['home'][0] == b'C' and table.nets['home'][2] == -75
+
+
+def test_networks_age_out():
+    table = NetworkTable(max_age=2)
+    table.merge([net(b'cafe', -60), net(b'home', -50)])
+    for _ in range(2):
+        table.merge([net(b'home', -50)])
+    assert set(table.nets) == {'cafe', 'home'}
+    table.merge([net(b'home', -50)])
+    assert set(table.nets) == {'home'}
+
+
+def test_seen_again_resets_age():
+    table = NetworkTable(max_age=2)
+    table.merge([net(b'cafe', -60)])
+    table.merge([])
+    table.merge([])
+    table.merge([net(b'cafe', -65)])
+    table.merge([])
+    table.merge([])
+    assert table.nets['cafe'][4] == 2
+
+
+def test_top_is_strongest_first_and_capped():
+    table = NetworkTable()
+    table.merge([net(('n%02d' % i).encode(), -40 - (i * 7) % 50) for i in range(25)])
+    top = table.top()
+    assert len(top) == wifi_pool.ROWS == 10
+    rssis = [entry[2] for _, entry in top]
+    assert rssis == sorted(rssis, reverse=True)
+    assert min(rssis) >= max(e[2] for s, e in table.nets.items() if s not in dict(top))
+    assert len(table.top(30)) == 25
@@ -0,0 +1,182 @@
+"""Compile an app's images into pre-scaled LVGL binary images (RGB565 / RGB565A8)
+
+The apps used to ship PNG, JPG and WebP that LVGL decoded on the board,
+often only to show them at another size with set_size(). This does the
+decoding and scaling here, once. A manifest (assets.json next to the
+app) lists the source images:
+
+    {"images": [
+        {"src": "sps.jpg", "size": [480, 344]},
+        {"src": "semiblock_logo_2.png", "format": "RGB565A8"},
+        {"src": "cat.png", "name": "cat_big", "size": [224, null]}
+    ]}
+
+- src: the source image, relative to the manifest
+- name: output <name>.bin (default: src without its extension)
+- size: [w, h]; null keeps that side in proportion, no size keeps the
+  source's. fit: "stretch" (default), "contain" (fits inside, keeps
+  proportions) or "cover" (fills, keeps proportions, cut to size)
+- format: "RGB565", "RGB565A8" (with an 8-bit alpha plane) or "auto"
+  (default: RGB565A8 only if the image has transparent pixels)
+- background: "#rrggbb" that transparent pixels are blended onto for
+  RGB565 (default black)
+
+Each output is an LVGL v9 binary image: a 12-byte header (magic, colour
+format, flags, width, height, stride) and the pixels in LVGL's own RGB565
+byte order, then the alpha plane for RGB565A8. semiblockFirmware/images.py
+loads them on the board; LVGL can also open one directly as "S:<name>.bin".
+
+The pixels are little-endian RGB565 with red in the top bits, what LVGL
+renders into its draw buffer. They are not byte swapped or in BGR order
+for the panel: board.py's display does both on the way out
+(rgb565_byte_swap=True at flush, BGR in the panel's MADCTL), for images
+as for everything else LVGL draws.
+
+    python3 asset_compile.py ../simple_test/assets.json
+    python3 asset_compile.py ../animate/assets.json --out /tmp/build --preview /tmp/build
+
+--preview reads each .bin back the way LVGL does and saves it as
+<name>.png, to compare with the source.
+
+Needs Pillow (pip install -r requirements.txt).
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+
+MAGIC = 0x19
+RGB565 = 0x12
+RGB565A8 = 0x14
+FORMATS = {'RGB565': RGB565, 'RGB565A8': RGB565A8}
+FITS = ('stretch', 'contain', 'cover')
+
+
+def target_size(src_w, src_h, size, fit):
+    """(w, h) to scale to and, for cover, the (w, h) to cut out after"""
+    if not size:
+        return (src_w, src_h), None
+    w, h = size
+    if w is None and h is None:
+        return (src_w, src_h), None
+    if w is None:
+        return (max(1, round(src_w * h / src_h)), h), None
+    if h is None:
+        return (w, max(1, round(src_h * w / src_w))), None
+    if fit == 'stretch':
+        return (w, h), None
+    scale = (min if fit == 'contain' else max)(w / src_w, h / src_h)
+    scaled = (max(1, round(src_w * scale)), max(1, round(src_h * scale)))
+    return scaled, (w, h) if fit == 'cover' else None
+
+
+def has_alpha(rgba):
+    return min(rgba[3::4], default=255) != 255
+
+
+def encode(rgba, w, h, cf, background=(0, 0, 0)):
+    """LVGL binary image of w x h pixels (rgba: 4 bytes each), RGB565 or RGB565A8"""
+    stride = w * 2
+    color = bytearray(stride * h)
+    alpha = bytearray(w * h) if cf == RGB565A8 else None
+    br, bg, bb = background
+    for i in range(w * h):
+        r, g, b, a = rgba[4 * i:4 * i + 4]
+        if alpha is not None:
+            alpha[i] = a
+        elif a != 255:
+            # blended here, since RGB565 has no alpha
+            r = (r * a + br * (255 - a) + 127) // 255
+            g = (g * a + bg * (255 - a) + 127) // 255
+            b = (b * a + bb * (255 - a) + 127) // 255
+        value = (r * 31 + 127) // 255 << 11 | (g * 63 + 127) // 255 << 5 | (b * 31 + 127) // 255
+        color[2 * i] = value & 0xFF  # little-endian, as LVGL draws it
+        color[2 * i + 1] = value >> 8
+    header = struct.pack('<BBHHHHH', MAGIC, cf, 0, w, h, stride, 0)
+    return header + bytes(color) + (bytes(alpha) if alpha is not None else b'')
+
+
+def decode(data):
+    """(w, h, rgba) of an LVGL binary image, read the way LVGL reads it"""
+    magic, cf, _, w, h, stride, _ = struct.unpack_from('<BBHHHHH', data)
+    if magic != MAGIC or cf not in FORMATS.values():
+        raise ValueError('not an RGB565 LVGL image')
+    color = data[12:12 + stride * h]
+    alpha = data[12 + stride * h:] if cf == RGB565A8 else None
+    rgba = bytearray(w * h * 4)
+    for y in range(h):
+        for x in range(w):
+            i = y * w + x
+            value = color[y * stride + 2 * x] | color[y * stride + 2 * x + 1] << 8
+            r, g, b = value >> 11, value >> 5 & 0x3F, value & 0x1F
+            rgba[4 * i:4 * i + 4] = bytes(((r * 255 + 15) // 31, (g * 255 + 31) // 63, (b * 255 + 15) // 31,
+                                           alpha[i] if alpha is not None else 255))
+    return w, h, bytes(rgba)
+
+
+def _color(value):
+    value = value.lstrip('#')
+    return int(value[0:2], 16), int(value[2:4], 16), int(value[4:6], 16)
+
+
+def compile_image(entry, base, out, preview=None):
+    """Write one manifest entry's .bin (and its preview .png). Returns a line for the report."""
+    from PIL import Image
+    src = os.path.join(base, entry['src'])
+    name = entry.get('name') or os.path.splitext(os.path.basename(entry['src']))[0]
+    fit = entry.get('fit', 'stretch')
+    if fit not in FITS:
+        raise ValueError('%s: fit is one of %s, not %s' % (entry['src'], ', '.join(FITS), fit))
+    fmt = entry.get('format', 'auto')
+    if fmt != 'auto' and fmt not in FORMATS:
+        raise ValueError('%s: format is auto, RGB565 or RGB565A8, not %s' % (entry['src'], fmt))
+
+    with Image.open(src) as im:
+        im = im.convert('RGBA')
+        src_w, src_h = im.size
+        scaled, crop = target_size(src_w, src_h, entry.get('size'), fit)
+        if scaled != im.size:
+            im = im.resize(scaled, Image.LANCZOS)
+        if crop:
+            left, top = (scaled[0] - crop[0]) // 2, (scaled[1] - crop[1]) // 2
+            im = im.crop((left, top, left + crop[0], top + crop[1]))
+        w, h = im.size
+        rgba = im.tobytes()
+
+    if fmt == 'auto':
+        fmt = 'RGB565A8' if has_alpha(rgba) else 'RGB565'
+    data = encode(rgba, w, h, FORMATS[fmt], _color(entry.get('background', '#000000')))
+    path = os.path.join(out, name + '.bin')
+    with open(path, 'wb') as f:
+        f.write(data)
+    if preview:
+        w, h, back = decode(data)
+        Image.frombytes('RGBA', (w, h), back).save(os.path.join(preview, name + '.png'))
+    return '%-28s %4dx%-4d %7d B -> %-18s %4dx%-4d %-8s %7d B' % (
+        entry['src'], src_w, src_h, os.path.getsize(src), name + '.bin', w, h, fmt, len(data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('manifest', help='assets.json listing the images')
+    parser.add_argument('--out', help='directory for the .bin files (default: the manifest\'s)')
+    parser.add_argument('--preview', help='directory for each .bin read back as .png')
+    args = parser.parse_args()
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        sys.exit('asset_compile.py needs Pillow: pip install Pillow')
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(args.manifest))
+    out = args.out or base
+    os.makedirs(out, exist_ok=True)
+    if args.preview:
+        os.makedirs(args.preview, exist_ok=True)
+    for entry in manifest['images']:
+        print(compile_image(entry, base, out, args.preview))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Compare JSON+base64 and bundle getProject replies against the stand-in
+
+Builds a project from PNGs in this repo (or random data), then installs it
+with semiblockFirmware/project_stream.fetch_project in both formats and
+reports bytes on the wire and install time.
+
+    python3 bench_bundle.py --runs 5
+"""
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.join(HERE, '..')
+sys.path.insert(0, os.path.join(REPO, 'semiblockFirmware'))
+
+import project_stream  # noqa: E402
+import project_server  # noqa: E402
+
+
+def make_project(root, code='1234'):
+    folder = os.path.join(root, code)
+    os.makedirs(folder)
+    shutil.copy(os.path.join(REPO, 'flippybird', 'flippybird.py'), os.path.join(folder, 'main.py'))
+    for png in sorted(set(glob.glob(os.path.join(REPO, '*', '*.png')))):
+        name = os.path.basename(png)
+        if not os.path.exists(os.path.join(folder, name)):
+            shutil.copy(png, os.path.join(folder, name))
+    return folder
+
+
+def install(url, accept_bundle):
+    work = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(work)
+    try:
+        start = time.perf_counter()
+        status, result, stats = project_stream.fetch_project(url, accept_bundle=accept_bundle)
+        elapsed = time.perf_counter() - start
+        assert status == 200 and result.success, (status, result.error)
+        return stats.total, elapsed, work
+    finally:
+        os.chdir(cwd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    src = make_project(root)
+    server = project_server.serve(root, port=0)
+    url = f"http://127.0.0.1:{server.server_port}/api/getProject?deviceCode=1234"
+
+    raw = sum(os.path.getsize(os.path.join(src, n)) for n in os.listdir(src))
+    print(f"project: {len(os.listdir(src))} files, {raw} bytes")
+    for label, accept in (('json', False), ('bundle', True)):
+        times = []
+        for _ in range(args.runs):
+            size, elapsed, work = install(url, accept)
+            times.append(elapsed)
+        for name in os.listdir(src):
+            target = 'user_app.tmp' if name == 'main.py' else name
+            with open(os.path.join(src, name), 'rb') as a, open(os.path.join(work, target), 'rb') as b:
+                assert a.read() == b.read(), f'{label}: {name} differs'
+        print(f"{label:7s} {size:9d} bytes on the wire, install {min(times) * 1000:7.1f} ms (best of {args.runs})")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
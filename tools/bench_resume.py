@@ -0,0 +1,84 @@
+"""Download a project over a flaky link, with and without resuming
+
+Serves a project with project_server --drop-rate, then installs it with
+semiblockFirmware/downloader.py (manifest + Range resume) and with a plain
+retry of project_stream.fetch_project that starts over after every drop.
+Reports whether each finished, the bytes the server had to send and how
+many of those were sent twice.
+
+    python3 bench_resume.py --drop-rate 0.3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'semiblockFirmware'))
+
+import downloader  # noqa: E402
+import project_stream  # noqa: E402
+import project_server  # noqa: E402
+from bench_bundle import make_project  # noqa: E402
+
+
+def run(label, server, fn):
+    handler = server.RequestHandlerClass
+    handler.bytes_sent = handler.dropped = 0
+    work = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(work)
+    start = time.perf_counter()
+    try:
+        status, result, stats = fn()
+        ok = status == 200 and result.success
+    except (OSError, ValueError) as e:
+        ok, stats = False, None
+        print(f"{label}: gave up ({e})")
+    finally:
+        os.chdir(cwd)
+    elapsed = time.perf_counter() - start
+    print(f"{label:9s} {'done' if ok else 'FAILED':6s} {handler.bytes_sent:9d} bytes sent, "
+          f"{handler.dropped:3d} drops, {elapsed * 1000:7.1f} ms")
+    return ok, stats, work
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--drop-rate', type=float, default=0.3)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    downloader.BACKOFF_MS = 10
+    downloader.RETRIES = 50
+
+    root = tempfile.mkdtemp()
+    src = make_project(root)
+    size = sum(os.path.getsize(os.path.join(src, n)) for n in os.listdir(src))
+    server = project_server.serve(root, port=0, drop_rate=args.drop_rate)
+    url = f"http://127.0.0.1:{server.server_port}/api/getProject?deviceCode=1234"
+    print(f"project: {len(os.listdir(src))} files, {size} bytes, drop rate {args.drop_rate}")
+
+    for _ in range(args.runs):
+        ok, stats, work = run('resume', server, lambda: downloader.fetch_project(url))
+        if ok:
+            print(f"          {stats.total} bytes received, {stats.resent} re-sent, {stats.retries} retries, "
+                  f"{stats.requests} requests on {stats.connections} connections")
+            for name in os.listdir(src):
+                target = 'user_app.tmp' if name == 'main.py' else name
+                with open(os.path.join(src, name), 'rb') as a, open(os.path.join(work, target), 'rb') as b:
+                    assert a.read() == b.read(), f'{name} differs'
+
+    for _ in range(args.runs):
+        stats = downloader.Stats()
+        run('restart', server, lambda: downloader.retry(
+            stats, project_stream.fetch_project, url, 'user_app.tmp', None, None, None, False))
+        print(f"          {stats.retries} retries, each starting from byte 0")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Time cold, resumed and pre-warmed https fetches against a local TLS stand-in
+
+Makes a self-signed certificate with openssl, serves a project over https
+with project_server and connects through semiblockFirmware/netcache.py:
+
+- cold:    empty DNS cache, full TLS handshake
+- resumed: DNS answer cached, TLS session from the previous connection
+- warm:    netcache.warm() ran while the "user typed the code"
+
+    python3 bench_tls.py --runs 10
+"""
+import argparse
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'semiblockFirmware'))
+
+import downloader  # noqa: E402
+import netcache  # noqa: E402
+import project_server  # noqa: E402
+import project_stream  # noqa: E402
+from bench_bundle import make_project  # noqa: E402
+
+
+def make_cert(folder):
+    cert, key = os.path.join(folder, 'cert.pem'), os.path.join(folder, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1',
+                    '-nodes', '-days', '1', '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost',
+                    '-keyout', key, '-out', cert], check=True, capture_output=True)
+    return cert, key
+
+
+def fetch(url):
+    start = time.perf_counter()
+    status, result, stats = downloader.fetch_project(url)
+    assert status == 200 and result.success, result.error
+    return (time.perf_counter() - start) * 1000
+
+
+def handshake(url):
+    scheme, host, port, path = project_stream.split_url(url)
+    sock, stream = project_stream.open_connection(scheme, host, port)
+    response = project_stream.send_request(sock, stream, host, path)
+    while response.read(4096):
+        pass
+    response.close()
+    return netcache.timing['dns_ms'], netcache.timing['tls_ms']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    cert, key = make_cert(work)
+    root = os.path.join(work, 'projects')
+    make_project(root)
+    server = project_server.serve(root, port=0, tls=(cert, key))
+    url = f"https://localhost:{server.server_port}/api/getProject?deviceCode=1234"
+    netcache._context = ssl.create_default_context(cafile=cert)
+    os.chdir(work)
+
+    rows = []
+    for label in ('cold', 'resumed'):
+        dns = tls = 0
+        for _ in range(args.runs):
+            if label == 'cold':
+                netcache.clear()
+            else:
+                handshake(url)  # leaves a session behind for the next one
+            d, t = handshake(url)
+            dns += d
+            tls += t
+        rows.append((label, dns / args.runs, tls / args.runs))
+    netcache.clear()
+    for label, dns, tls in rows:
+        print(f"{label:8s} dns {dns:6.2f} ms  tls handshake {tls:6.2f} ms")
+    print(f"resumed {netcache.stats['resumed']} of {netcache.stats['handshakes']} handshakes")
+
+    # What the user waits for after pressing OK, before the request can go out
+    scheme, host, port, _ = project_stream.split_url(url)
+    waits = {'cold': [], 'warm': []}
+    for _ in range(args.runs):
+        for label in waits:
+            netcache.clear()
+            if label == 'warm':
+                netcache.warm(url)
+                time.sleep(0.2)  # the user typing the rest of the code
+            start = time.perf_counter()
+            sock, _stream = project_stream.open_connection(scheme, host, port)
+            waits[label].append((time.perf_counter() - start) * 1000)
+            netcache.release(sock)
+    print(f"connection ready after OK: cold {min(waits['cold']):.2f} ms, "
+          f"pre-warmed {min(waits['warm']):.2f} ms (best of {args.runs})")
+    fetch(url)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Install time and UI frame jitter of a download on the UI thread vs download_worker
+
+Installs a project the firmware's way (peer_cache off, downloader.fetch_project
+into a staging.Stage, then commit) while a stand-in UI loop "draws" a frame
+every PERIOD_MS by spinning for RENDER_MS, like lv.task_handler() with a
+dirty screen. Two ways:
+
+- inline: the download runs on the UI thread and frames happen from its
+  idle and on_progress callbacks, as with DOWNLOAD_THREAD = False
+- thread: download_worker.Worker downloads, the UI thread draws and polls
+
+For each it reports the install time and the gaps between frames; a gap
+much longer than PERIOD_MS is a visible stall.
+
+With CPython a project_server stand-in is started here:
+
+    python3 bench_worker.py --runs 3 --latency 40 --bandwidth 300
+
+The MicroPython Unix port has _thread too, but no http.server: start
+project_server.py from CPython and pass its URL (plain http):
+
+    python3 project_server.py /tmp/projects --port 8080 --bandwidth 300 &
+    micropython bench_worker.py http://127.0.0.1:8080/api/getProject?deviceCode=1234
+
+Files are written under WORK in the current directory, which is emptied
+before every install.
+"""
+import os
+import sys
+
+try:
+    from time import ticks_ms, ticks_diff, sleep_ms
+except ImportError:
+    from time import monotonic, sleep
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+    def sleep_ms(ms):
+        sleep(ms / 1000)
+
+HERE = sys.argv[0].rsplit('/', 1)[0] if '/' in sys.argv[0] else '.'
+sys.path.insert(0, HERE + '/../semiblockFirmware')
+
+import asset_cache  # noqa: E402
+import download_worker  # noqa: E402
+import downloader  # noqa: E402
+import staging  # noqa: E402
+
+WORK = 'bench_worker.tmp'
+PERIOD_MS = 16  # LV_PERIOD_MS in the firmware
+RENDER_MS = 4
+
+
+class Frames:
+    """A stand-in for lv.task_handler(): draws at most every PERIOD_MS"""
+
+    def __init__(self):
+        self.last = None
+        self.gaps = []
+
+    def __call__(self, *_):
+        now = ticks_ms()
+        if self.last is not None:
+            gap = ticks_diff(now, self.last)
+            if gap < PERIOD_MS:
+                return
+            self.gaps.append(gap)
+        start = ticks_ms()
+        while ticks_diff(ticks_ms(), start) < RENDER_MS:
+            pass
+        self.last = ticks_ms()
+
+
+def _clear(path):
+    for name in os.listdir(path):
+        full = path + '/' + name
+        if os.stat(full)[0] & 0x4000:
+            _clear(full)
+            os.rmdir(full)
+        else:
+            os.remove(full)
+
+
+def install(url, threaded):
+    """One cold install. Returns (ms, Frames)."""
+    _clear('.')
+    frames = Frames()
+    start = ticks_ms()
+    stage = staging.Stage()
+    code_path = stage.path('user_app.tmp')
+    manifest = asset_cache.load()
+    if threaded:
+        worker = download_worker.Worker(downloader.fetch_project, url, code_path, manifest=manifest, stage=stage)
+        worker.start()
+        result = None
+        while result is None:
+            frames()
+            for event in worker.poll():
+                if event[0] == 'error':
+                    raise event[1]
+                if event[0] == 'done':
+                    result = event[1]
+            sleep_ms(1)
+        status, project, _ = result
+    else:
+        status, project, _ = downloader.fetch_project(url, code_path, None, frames, manifest, frames, stage)
+    if status != 200 or not project.success:
+        raise OSError('install failed: HTTP %d %s' % (status, project.error))
+    stage.commit(code_path, project.mpy_path, project.code_digest)
+    return ticks_diff(ticks_ms(), start), frames
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * p // 100)] if values else 0
+
+
+def bench(url, runs=3):
+    try:
+        os.mkdir(WORK)
+    except OSError:
+        pass
+    os.chdir(WORK)
+    try:
+        for label, threaded in (('inline', False), ('thread', True)):
+            times, gaps = [], []
+            for _ in range(runs):
+                ms, frames = install(url, threaded)
+                times.append(ms)
+                gaps.extend(frames.gaps)
+            stalls = len([g for g in gaps if g > 2 * PERIOD_MS])
+            print(f"{label:6s} install {min(times):6d} ms (best of {runs}), {len(gaps)} frames, gap ms: "
+                  f"p50 {percentile(gaps, 50)}  p99 {percentile(gaps, 99)}  max {max(gaps) if gaps else 0}, "
+                  f"{stalls} over {2 * PERIOD_MS} ms")
+    finally:
+        _clear('.')
+        os.chdir('..')
+        os.rmdir(WORK)
+
+
+def main():
+    try:
+        import argparse
+    except ImportError:
+        # MicroPython: bench_worker.py URL [RUNS]
+        bench(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 3)
+        return
+    import tempfile
+    import project_server
+    from bench_bundle import make_project
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('url', nargs='?', help='getProject URL with deviceCode (default: a local stand-in)')
+    parser.add_argument('--runs', type=int, default=3)
+    project_server.add_link_args(parser)
+    args = parser.parse_args()
+    server = None
+    url = args.url
+    if url is None:
+        root = tempfile.mkdtemp()
+        make_project(root)
+        server = project_server.serve(root, port=0, **project_server.link_options(args))
+        url = f"http://127.0.0.1:{server.server_port}/api/getProject?deviceCode=1234"
+    os.chdir(tempfile.mkdtemp())
+    bench(url, args.runs)
+    if server:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
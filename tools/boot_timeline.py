@@ -0,0 +1,145 @@
+"""Render semiblockFirmware/profiler.py dumps as a timeline
+
+Reads a serial log (or anything containing 'PROFILE {...}' lines), prints
+the phases as a table and writes an SVG flame/timeline chart. Optionally
+writes a Chrome trace (open in chrome://tracing or ui.perfetto.dev) and
+compares against a baseline log to catch boot time regressions.
+
+    mpremote run semiblockFirmwareV2.py | tee boot.log
+    python3 boot_timeline.py boot.log -o boot.svg
+    python3 boot_timeline.py boot.log --baseline old_boot.log
+"""
+import argparse
+import json
+import sys
+from html import escape
+
+ROW = 22
+WIDTH = 1200
+LABEL = 160
+COLORS = ('#4e79a7', '#f28e2b', '#59a14f', '#e15759', '#76b7b2', '#edc948', '#b07aa1', '#9c755f')
+
+
+def read_profiles(path):
+    """All PROFILE dumps in a file ('-' for stdin), oldest first"""
+    f = sys.stdin if path == '-' else open(path, errors='replace')
+    profiles = []
+    with f:
+        for line in f:
+            at = line.find('PROFILE ')
+            if at >= 0:
+                profiles.append(json.loads(line[at + 8:]))
+    if not profiles:
+        sys.exit(f"no PROFILE line in {path}")
+    return profiles
+
+
+def table(profile):
+    for s in profile['spans']:
+        dur = f"{s['dur'] / 1000:9.1f} ms" if s['dur'] >= 0 else '     open'
+        print(f"{s['start'] / 1000:9.1f} ms {dur} {'  ' * s['depth']}{s['name']}")
+    if profile.get('dropped'):
+        print(f"({profile['dropped']} older spans dropped, raise profiler.SIZE)")
+
+
+def end_of(profile):
+    return max((s['start'] + max(s['dur'], 0) for s in profile['spans']), default=1) or 1
+
+
+def svg(profile, path):
+    spans = profile['spans']
+    total = end_of(profile)
+    depth = max((s['depth'] for s in spans), default=0) + 1
+    scale = (WIDTH - LABEL - 20) / total
+    height = depth * ROW + 60
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{height}" '
+           f'font-family="sans-serif" font-size="11">',
+           f'<text x="10" y="16" font-size="13">Boot timeline, {total / 1000:.1f} ms</text>']
+    # millisecond grid
+    step = 10 ** max(0, len(str(int(total / 1000))) - 1) * 1000
+    t = 0
+    while t <= total:
+        x = LABEL + t * scale
+        out.append(f'<line x1="{x:.1f}" y1="28" x2="{x:.1f}" y2="{height - 10}" stroke="#ddd"/>')
+        out.append(f'<text x="{x + 2:.1f}" y="{height - 12}" fill="#888">{t // 1000} ms</text>')
+        t += step
+    for k in range(depth):
+        out.append(f'<text x="10" y="{40 + k * ROW + 14}" fill="#666">depth {k}</text>')
+    for i, s in enumerate(spans):
+        dur = s['dur'] if s['dur'] >= 0 else total - s['start']
+        x = LABEL + s['start'] * scale
+        y = 40 + s['depth'] * ROW
+        w = max(dur * scale, 1)
+        color = COLORS[i % len(COLORS)]
+        tip = escape(f"{s['name']}: {dur / 1000:.1f} ms at {s['start'] / 1000:.1f} ms")
+        out.append(f'<g><title>{tip}</title>'
+                   f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{ROW - 3}" fill="{color}"/>')
+        if w > 40:
+            label = escape(f"{s['name']} {dur / 1000:.0f}ms")
+            out.append(f'<text x="{x + 3:.1f}" y="{y + 14}" fill="#fff">{label}</text>')
+        out.append('</g>')
+    out.append('</svg>')
+    with open(path, 'w') as f:
+        f.write('\n'.join(out))
+
+
+def chrome_trace(profile, path):
+    events = [{'name': s['name'], 'ph': 'X', 'ts': s['start'], 'dur': max(s['dur'], 0),
+               'pid': 1, 'tid': 1} for s in profile['spans']]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events}, f)
+
+
+def durations(profile):
+    out = {}
+    for s in profile['spans']:
+        if s['dur'] >= 0:
+            out[s['name']] = out.get(s['name'], 0) + s['dur']
+    return out
+
+
+def compare(profile, baseline, threshold):
+    """Print per-phase change against a baseline; returns True if anything regressed"""
+    new, old = durations(profile), durations(baseline)
+    regressed = False
+    print(f"{'phase':24s} {'baseline':>10s} {'now':>10s} {'change':>10s}")
+    for name in sorted(set(new) | set(old), key=lambda n: -new.get(n, 0)):
+        a, b = old.get(name), new.get(name)
+        if a is None or b is None:
+            print(f"{name:24s} {'-' if a is None else f'{a / 1000:.1f}':>10s} "
+                  f"{'-' if b is None else f'{b / 1000:.1f}':>10s}")
+            continue
+        change = (b - a) / a * 100 if a else 0
+        flag = ''
+        if change > threshold and b - a > 1000:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f"{name:24s} {a / 1000:10.1f} {b / 1000:10.1f} {change:+9.0f}%{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('log', help="log file with PROFILE lines, '-' for stdin")
+    parser.add_argument('-o', '--svg', default='boot.svg')
+    parser.add_argument('--trace', help='also write a Chrome trace JSON')
+    parser.add_argument('--index', type=int, default=0, help='which PROFILE line, 0 = first')
+    parser.add_argument('--baseline', help='log to compare against')
+    parser.add_argument('--threshold', type=float, default=10, help='regression threshold in %%')
+    args = parser.parse_args()
+
+    profile = read_profiles(args.log)[args.index]
+    table(profile)
+    svg(profile, args.svg)
+    print(f"Wrote {args.svg}")
+    if args.trace:
+        chrome_trace(profile, args.trace)
+        print(f"Wrote {args.trace}")
+    if args.baseline:
+        print()
+        if compare(profile, read_profiles(args.baseline)[args.index], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
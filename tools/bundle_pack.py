@@ -0,0 +1,152 @@
+"""Pack a project folder into a Semiblock bundle (.sbb)
+
+The on-device reader and the format description are in
+semiblockFirmware/bundle.py.
+
+    python3 bundle_pack.py projects/1234 -o 1234.sbb
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import zlib
+
+MAGIC = b'SBB1'
+HEADER = '<4sHH'
+ENTRY = '<BBBBIII8s'
+
+KIND_CODE = 0
+KIND_ASSET = 1
+KIND_MPY = 2
+
+METHOD_RAW = 0
+METHOD_DEFLATE = 1
+METHOD_CACHED = 2
+
+WBITS = 10
+CODE_FILES = ('main.py', 'user_app.py', 'code.py')
+
+# Only keep deflate output when it saves at least this fraction
+MIN_SAVING = 0.05
+
+
+def digest(data):
+    return hashlib.sha256(data).digest()[:8]
+
+
+def deflate(data):
+    c = zlib.compressobj(9, zlib.DEFLATED, -WBITS)
+    return c.compress(data) + c.flush()
+
+
+def compile_mpy(source):
+    """Compile source to .mpy bytecode with mpy-cross, or None if it isn't installed.
+
+    Uses the mpy-cross pip package if present (tools/requirements.txt), else
+    an mpy-cross on PATH. Its version has to match the MicroPython the board runs.
+    """
+    try:
+        import mpy_cross
+        cmd = [mpy_cross.mpy_cross]
+    except (ImportError, AttributeError):
+        exe = shutil.which('mpy-cross')
+        if not exe:
+            return None
+        cmd = [exe]
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, 'user_app.py')
+        out = os.path.join(tmp, 'user_app.mpy')
+        with open(src, 'wb') as f:
+            f.write(source)
+        result = subprocess.run(cmd + ['-o', out, src], capture_output=True)
+        if result.returncode != 0:
+            print(f"mpy-cross failed: {result.stderr.decode().strip()}")
+            return None
+        with open(out, 'rb') as f:
+            return f.read()
+
+
+def code_file(folder):
+    """The app's source in a project folder: a CODE_FILES name, else its only .py"""
+    names = os.listdir(folder)
+    for name in CODE_FILES:
+        if name in names:
+            return name
+    sources = [n for n in names if n.endswith('.py')]
+    return sources[0] if len(sources) == 1 else None
+
+
+def project_entries(folder, mpy=True):
+    """(kind, name, data) for the code, its .mpy and every .png in a project folder"""
+    entries = []
+    code = code_file(folder)
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if name == code:
+            with open(path, 'rb') as f:
+                source = f.read()
+            entries.append((KIND_CODE, 'user_app', source))
+            compiled = compile_mpy(source) if mpy else None
+            if compiled:
+                entries.append((KIND_MPY, 'user_app', compiled))
+        elif name.endswith('.png'):
+            with open(path, 'rb') as f:
+                entries.append((KIND_ASSET, name[:-4], f.read()))
+    return entries
+
+
+def pack(entries, have=None, compress=True):
+    """Build bundle bytes. have maps asset name -> hex digest already on the device."""
+    have = have or {}
+    index = []
+    payloads = []
+    for kind, name, data in entries:
+        d = digest(data)
+        if kind == KIND_ASSET and have.get(name) == d.hex():
+            index.append((kind, METHOD_CACHED, name, 0, len(data), d))
+            payloads.append(b'')
+            continue
+        method, body = METHOD_RAW, data
+        if compress:
+            packed = deflate(data)
+            if len(packed) <= len(data) * (1 - MIN_SAVING):
+                method, body = METHOD_DEFLATE, packed
+        index.append((kind, method, name, len(body), len(data), d))
+        payloads.append(body)
+
+    offset = struct.calcsize(HEADER)
+    for _, _, name, _, _, _ in index:
+        offset += struct.calcsize(ENTRY) + len(name.encode())
+
+    out = [struct.pack(HEADER, MAGIC, len(index), 0)]
+    for kind, method, name, comp_size, size, d in index:
+        raw = name.encode()
+        out.append(struct.pack(ENTRY, kind, method, len(raw), 0, offset, comp_size, size, d) + raw)
+        offset += comp_size
+    out.extend(payloads)
+    return b''.join(out)
+
+
+def pack_folder(folder, have=None, compress=True, mpy=True):
+    return pack(project_entries(folder, mpy), have, compress)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('folder')
+    parser.add_argument('-o', '--output')
+    parser.add_argument('--raw', action='store_true', help='do not deflate entries')
+    parser.add_argument('--no-mpy', action='store_true', help='do not add compiled .mpy')
+    args = parser.parse_args()
+    data = pack_folder(args.folder, compress=not args.raw, mpy=not args.no_mpy)
+    output = args.output or os.path.basename(os.path.normpath(args.folder)) + '.sbb'
+    with open(output, 'wb') as f:
+        f.write(data)
+    print(f"Wrote {output} ({len(data)} bytes)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""Frame buffer and flush path benchmark: canned LVGL scenes per board profile
+
+Scenes:
+
+- fill:    the whole screen changes colour every frame
+- sprite:  a 224x224 sprite moves across the screen (flippybird, animate_cat)
+- objects: 64 small objects move every frame
+- text:    a calculator display and 20 button labels get new text
+
+For each scene and board profile (semiblockFirmware/board.py) it reports
+FPS, flushes and bytes pushed over lcd_bus per frame, and the time per
+frame spent rendering and flushing.
+
+On Linux, with the lvgl_micropython Unix build, the display is an LVGL
+display whose flush callback writes to tools/lcd_bus_sim.py, a recording
+stand-in for lcd_bus.SPIBus. Flush time there comes from its bus model
+(SPI clock, per-transaction overhead, SPIRAM copy), not from this
+machine, so only the render time differs between machines. All profiles
+run in one go:
+
+    micropython fb_bench.py                     # every profile
+    micropython fb_bench.py dma spiram --freq 40000000 --frames 120
+
+On the board the real ST7796 is measured: the display bus is wrapped to
+count tx_color() calls, bytes and the time spent in them. The profile is
+fixed until reset, so one profile per run (PROFILE below):
+
+    mpremote cp ../semiblockFirmware/board.py :
+    mpremote cp ../semiblockFirmware/handoff.py :
+    mpremote run fb_bench.py
+"""
+import sys
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+HERE = sys.argv[0].rsplit('/', 1)[0] if sys.argv and '/' in sys.argv[0] else '.'
+sys.path.insert(0, HERE + '/../semiblockFirmware')
+sys.path.insert(0, HERE)
+
+import lvgl as lv  # noqa: E402
+
+import board  # noqa: E402
+
+# Profile measured on the board
+PROFILE = board.DEFAULT
+FRAMES = 60
+
+COLORS = (0x003366, 0x87CEEB, 0xFFD700, 0x000000)
+
+
+class Fill:
+    name = 'fill'
+
+    def __init__(self, scr):
+        self.scr = scr
+
+    def step(self, i):
+        self.scr.set_style_bg_color(lv.color_hex(COLORS[i % len(COLORS)]), 0)
+
+
+class Sprite:
+    name = 'sprite'
+    SIZE = 224
+
+    def __init__(self, scr):
+        self.w = scr.get_width() - self.SIZE
+        self.h = scr.get_height() - self.SIZE
+        scr.set_style_bg_color(lv.color_hex(0x87CEEB), 0)
+        self.obj = lv.obj(scr)
+        self.obj.set_size(self.SIZE, self.SIZE)
+        self.obj.set_style_radius(24, 0)
+        self.obj.set_style_bg_color(lv.color_hex(0xFFD700), 0)
+        self.obj.set_style_bg_grad_color(lv.color_hex(0xFF8C00), 0)
+        self.obj.set_style_bg_grad_dir(lv.GRAD_DIR.VER, 0)
+        self.obj.set_style_border_width(4, 0)
+
+    def step(self, i):
+        x, y = (i * 8) % (2 * self.w), (i * 4) % (2 * self.h)
+        self.obj.set_pos(x if x < self.w else 2 * self.w - x, y if y < self.h else 2 * self.h - y)
+
+
+class Objects:
+    name = 'objects'
+    COUNT = 64
+    SIZE = 20
+
+    def __init__(self, scr):
+        self.w = scr.get_width() - self.SIZE
+        self.h = scr.get_height() - self.SIZE
+        scr.set_style_bg_color(lv.color_hex(0x000000), 0)
+        self.objs = []
+        for n in range(self.COUNT):
+            o = lv.obj(scr)
+            o.set_size(self.SIZE, self.SIZE)
+            o.set_style_radius(self.SIZE // 2, 0)
+            o.set_style_border_width(0, 0)
+            o.set_style_bg_color(lv.color_hex(COLORS[n % 3] ^ (n * 0x030507)), 0)
+            self.objs.append(o)
+
+    def step(self, i):
+        for n, o in enumerate(self.objs):
+            o.set_pos((n * 37 + i * (1 + n % 5)) % self.w, (n * 53 + i * (1 + n % 3)) % self.h)
+
+
+class Text:
+    name = 'text'
+    KEYS = '789/456*123-0.=+C()%'
+
+    def __init__(self, scr):
+        scr.set_style_bg_color(lv.color_hex(0x000000), 0)
+        self.display = lv.label(scr)
+        self.display.set_style_text_color(lv.color_hex(0xFFFFFF), 0)
+        self.display.set_style_text_font(lv.font_montserrat_16, 0)
+        self.display.set_pos(10, 10)
+        self.labels = []
+        for n in range(len(self.KEYS)):
+            btn = lv.button(scr)
+            btn.set_size(100, 44)
+            btn.set_pos(10 + (n % 4) * 116, 60 + (n // 4) * 52)
+            label = lv.label(btn)
+            label.center()
+            self.labels.append(label)
+
+    def step(self, i):
+        self.display.set_text('%d x %d = %d' % (i * 1234567, i + 7, i * 1234567 * (i + 7)))
+        for n, label in enumerate(self.labels):
+            label.set_text(self.KEYS[(n + i) % len(self.KEYS)])
+
+
+SCENES = (Fill, Sprite, Objects, Text)
+
+
+def run_scene(scene_class, frames, flush_stats):
+    """Build the scene on a new screen and refresh it frames times. Returns total µs."""
+    old = lv.screen_active()
+    scr = lv.obj()
+    lv.screen_load(scr)
+    old.delete()
+    scene = scene_class(scr)
+    lv.refr_now(None)  # the first frame builds everything, not measured
+    flush_stats.reset()
+    start = ticks_us()
+    for i in range(frames):
+        scene.step(i)
+        flush_stats.frame_start()
+        lv.refr_now(None)
+        flush_stats.frame_end()
+    return ticks_diff(ticks_us(), start)
+
+
+def report(profile_name, scene, frames, total_us, flushes, sent, render_us, flush_us):
+    print('%-10s %-8s %6.1f fps %5.1f flushes %7d bytes/frame  render %6.2f ms  flush %6.2f ms' % (
+        profile_name, scene, frames * 1000000 / max(total_us, 1), flushes / frames, sent // frames,
+        render_us / frames / 1000, flush_us / frames / 1000))
+
+
+# --- Linux: lcd_bus_sim --------------------------------------------------------------------
+
+class SimDisplay:
+    """An LVGL display flushing into lcd_bus_sim, timed on the bus model clock"""
+
+    def __init__(self, bus, p):
+        self.bus = bus
+        self.double = p['buffers'] == 2
+        lines = p['lines'] or board.HEIGHT // 10  # what st7796 would allocate
+        size = lines * board.WIDTH * 2
+        caps = bus.MEMORY_SPIRAM if p['memory'] == 'spiram' else bus.MEMORY_INTERNAL | bus.MEMORY_DMA
+        self.bufs = [bus.allocate_framebuffer(size, caps) for _ in range(p['buffers'])]
+        mode = {'partial': lv.DISPLAY_RENDER_MODE.PARTIAL, 'full': lv.DISPLAY_RENDER_MODE.FULL,
+                'direct': lv.DISPLAY_RENDER_MODE.DIRECT}[p['render_mode']]
+        # landscape, as the apps see the panel after set_rotation(_90)
+        self.disp = lv.display_create(board.HEIGHT, board.WIDTH)
+        self.disp.set_color_format(lv.COLOR_FORMAT.RGB565)
+        self.disp.set_buffers(self.bufs[0], self.bufs[1] if self.double else None, size, mode)
+        self.disp.set_flush_cb(self.flush)
+        self.disp.set_default()
+        self.render_us = 0
+        self.mark = ticks_us()
+
+    def reset(self):
+        self.bus.reset()
+        self.render_us = 0
+
+    def _render(self):
+        # real time since the last mark was LVGL rendering
+        us = ticks_diff(ticks_us(), self.mark)
+        self.render_us += us
+        self.bus.advance(us)
+
+    def frame_start(self):
+        self.mark = ticks_us()
+
+    def frame_end(self):
+        self._render()
+
+    def flush(self, disp, area, px_map):
+        self._render()
+        size = (area.x2 - area.x1 + 1) * (area.y2 - area.y1 + 1) * 2
+        if self.double:
+            self.bus.wait()  # LVGL waits for the other buffer's flush before this one
+        self.bus.tx_color(0x2C, px_map.__dereference__(size), area.x1, area.y1, area.x2, area.y2)
+        if not self.double:
+            self.bus.wait()  # nothing to render into until this buffer is sent
+        disp.flush_ready()
+        self.mark = ticks_us()
+
+    def delete(self):
+        self.disp.delete()
+
+
+def bench_sim(names, frames, freq):
+    import lcd_bus_sim
+    sys.modules['lcd_bus'] = lcd_bus_sim
+    if not lv.is_initialized():
+        lv.init()
+    print('lcd_bus_sim: %d Hz SPI, %d us per transaction, SPIRAM copy %d MB/s' % (
+        freq, lcd_bus_sim.OVERHEAD_US, lcd_bus_sim.SPIRAM_BPS // 1000000))
+    for name in names:
+        p = board.profile(name)
+        bus = lcd_bus_sim.SPIBus(freq=freq)
+        display = SimDisplay(bus, p)
+        for scene in SCENES:
+            run_scene(scene, frames, display)
+            bus.wait()  # the last transfer is part of the run
+            report(name, scene.name, frames, bus.now, bus.flushes, bus.bytes, display.render_us,
+                   bus.now - display.render_us)
+        display.delete()
+
+
+# --- The board: the real display bus ---------------------------------------------------------
+
+class RecordingBus:
+    """Wraps the display's lcd_bus: counts tx_color() calls and bytes, and the time in them"""
+
+    def __init__(self, real):
+        self.real = real
+        self.reset()
+
+    def reset(self):
+        self.flushes = 0
+        self.bytes = 0
+        self.flush_us = 0
+
+    def frame_start(self):
+        pass
+
+    def frame_end(self):
+        pass
+
+    def tx_color(self, cmd, data, *args):
+        start = ticks_us()
+        self.real.tx_color(cmd, data, *args)
+        self.flush_us += ticks_diff(ticks_us(), start)
+        self.flushes += 1
+        self.bytes += len(data)
+
+    def __getattr__(self, name):
+        return getattr(self.real, name)
+
+
+def bench_board(name, frames):
+    hw = board.start(name, touch=False, timer=False)
+    bus = RecordingBus(hw.display._data_bus)
+    hw.display._data_bus = bus
+    print('board: profile %s, %s' % (name, board.stats))
+    for scene in SCENES:
+        total = run_scene(scene, frames, bus)
+        report(name, scene.name, frames, total, bus.flushes, bus.bytes, total - bus.flush_us, bus.flush_us)
+
+
+def main():
+    args = sys.argv[1:]
+    frames, freq, names = FRAMES, board.LCD_FREQ, []
+    while args:
+        arg = args.pop(0)
+        if arg == '--frames':
+            frames = int(args.pop(0))
+        elif arg == '--freq':
+            freq = int(args.pop(0))
+        else:
+            names.append(arg)
+    try:
+        import lcd_bus  # noqa: F401
+    except ImportError:
+        bench_sim(names or list(board.PROFILES), frames, freq)
+        return
+    bench_board(names[0] if names else PROFILE, frames)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Recording stand-in for lcd_bus.SPIBus, for running display code off the board
+
+Counts every tx_color() and tx_param() with the bytes it carries, and works
+out how long the ESP32-S3 would have spent on it instead of actually
+waiting, so benchmark numbers do not depend on the machine:
+
+- the SPI clock: freq bits/s on lanes data lines
+- OVERHEAD_US per transaction (CASET/RASET/RAMWR and queueing)
+- a frame buffer in SPIRAM goes through the driver's internal DMA bounce
+  buffer first, at SPIRAM_BPS, on the CPU
+
+Transfers are queued like the real bus: tx_color() returns at once and the
+bus is busy until busy_until; wait() is what a caller blocked on the
+transfer (e.g. the next flush into a single buffer) has to sit through.
+All times are in µs on the model clock, which the caller advances with
+advance() for the time it really spent rendering.
+
+MEMORY_* match lcd_bus, so allocate_framebuffer() can note which memory
+the frame buffers are supposed to live in.
+
+For semiblockFirmware/bus_tune.py there is a little of the panel too:
+pixels written with tx_param(RAMWR) are kept, and rx_param(RAMRD) reads
+them back as the ST7796 sends them (a dummy byte, then 3 bytes per
+pixel with 6 bits of colour each). Above WRITE_LIMIT_HZ the writes,
+above READ_LIMIT_HZ the reads come back with bits flipped, like a board
+whose wiring cannot take that clock.
+
+    import lcd_bus_sim
+    sys.modules['lcd_bus'] = lcd_bus_sim
+"""
+MEMORY_32BIT = 0x02
+MEMORY_8BIT = 0x04
+MEMORY_DMA = 0x08
+MEMORY_SPIRAM = 0x400
+MEMORY_INTERNAL = 0x800
+MEMORY_DEFAULT = 0x1000
+
+OVERHEAD_US = 30
+SPIRAM_BPS = 40 * 1000 * 1000
+
+WRITE_LIMIT_HZ = 40 * 1000 * 1000
+READ_LIMIT_HZ = 10 * 1000 * 1000
+
+RAMWR = 0x2C
+RAMRD = 0x2E
+
+# The panel's memory: RGB565 pixels of the last RAMWR by tx_param(), on any bus
+ram = bytearray()
+
+
+def _garble(data):
+    for i in range(0, len(data), 7):
+        data[i] ^= 0x10
+
+
+class SPIBus:
+    def __init__(self, spi_bus=None, freq=20000000, dc=-1, cs=-1, lanes=1, **kwargs):
+        self.freq = freq
+        self.lanes = 4 if kwargs.get('quad') else lanes
+        self.callback = None
+        self.spiram = False  # the frame buffers are in SPIRAM
+        self.reset()
+
+    def reset(self):
+        self.now = 0          # model clock, µs
+        self.busy_until = 0   # when the last queued transfer is done
+        self.flushes = 0
+        self.bytes = 0
+        self.params = 0
+        self.transfer_us = 0  # time the bus was busy
+        self.copy_us = 0      # CPU time copying SPIRAM buffers
+        self.wait_us = 0      # time callers blocked on the bus
+
+    def init(self, *args):
+        pass
+
+    def deinit(self):
+        pass
+
+    def register_callback(self, callback):
+        self.callback = callback
+
+    def get_lane_count(self):
+        return self.lanes
+
+    def allocate_framebuffer(self, size, caps):
+        self.spiram = bool(caps & MEMORY_SPIRAM or not caps & MEMORY_INTERNAL)
+        return bytearray(size)
+
+    def free_framebuffer(self, buf):
+        pass
+
+    def advance(self, us):
+        self.now += us
+
+    def wait(self):
+        """Block until the bus is idle"""
+        if self.busy_until > self.now:
+            self.wait_us += self.busy_until - self.now
+            self.now = self.busy_until
+
+    def tx_param(self, cmd, params=None):
+        global ram
+        self.params += 1
+        self._queue(len(params) if params else 0)
+        if cmd == RAMWR and params:
+            ram = bytearray(params)
+            if self.freq > WRITE_LIMIT_HZ:
+                _garble(ram)
+
+    def rx_param(self, cmd, data):
+        self.params += 1
+        self._queue(len(data))
+        if cmd != RAMRD:
+            return
+        out = bytearray(1 + len(ram) // 2 * 3)  # dummy byte first
+        for i in range(len(ram) // 2):
+            pixel = ram[2 * i] << 8 | ram[2 * i + 1]
+            out[1 + 3 * i] = pixel >> 11 << 3
+            out[2 + 3 * i] = (pixel >> 5 & 0x3F) << 2
+            out[3 + 3 * i] = (pixel & 0x1F) << 3
+        if self.freq > READ_LIMIT_HZ:
+            _garble(out)
+        n = min(len(data), len(out))
+        data[:n] = out[:n]
+
+    def tx_color(self, cmd, data, x1=0, y1=0, x2=0, y2=0, rotation=0, last_update=True):
+        size = len(data)
+        self.flushes += 1
+        self.bytes += size
+        if self.spiram:
+            copy = size * 1000000 // SPIRAM_BPS
+            self.copy_us += copy
+            self.now += copy
+        self._queue(size)
+        if self.callback is not None:
+            self.callback()
+
+    def _queue(self, size):
+        # one transaction at a time: a new one starts when the last is done
+        start = max(self.now, self.busy_until)
+        duration = OVERHEAD_US + size * 8 * 1000000 // (self.freq * self.lanes)
+        self.busy_until = start + duration
+        self.transfer_us += duration
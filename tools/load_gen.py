@@ -0,0 +1,140 @@
+"""Replay many device fetches at once against getProject
+
+Each simulated device is a process with its own flash directory that runs
+the firmware's download path from semiblockFirmware/ into a staging.Stage
+and commits it, as a board does after the code is typed in:
+
+- manifest: downloader.fetch_project (manifest + getAsset, Range resume)
+- bundle:   project_stream.fetch_project asking for a bundle
+- json:     project_stream.fetch_project with the JSON + base64 reply
+
+Without --url a project_server stand-in is started here, with the link
+options below (latency, bandwidth cap, injected errors). --url points the
+devices at another server instead, e.g. a staging backend.
+
+    python3 load_gen.py --devices 20 --fetches 200 --latency 80 --bandwidth 200
+    python3 load_gen.py --url "http://10.0.0.5:8080/api/getProject?deviceCode=1234"
+
+Every fetch starts from an empty flash directory unless --warm, which keeps
+each device's images so later fetches only get what changed.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'semiblockFirmware'))
+
+MODES = ('manifest', 'bundle', 'json')
+
+
+def _device_init(work):
+    os.chdir(tempfile.mkdtemp(dir=work))
+
+
+def fetch(url, mode, warm):
+    """One device fetch and install. Returns a result dict."""
+    import asset_cache
+    import downloader
+    import project_stream
+    import staging
+    if not warm:
+        for name in os.listdir('.'):
+            if os.path.isdir(name):
+                shutil.rmtree(name)
+            else:
+                os.remove(name)
+    start = time.perf_counter()
+    try:
+        stage = staging.Stage()
+        code_path = stage.path('user_app.tmp')
+        manifest = asset_cache.load()
+        if mode == 'manifest':
+            status, project, stats = downloader.fetch_project(url, code_path, manifest=manifest, stage=stage)
+            received, retries = stats.total, stats.retries
+        else:
+            status, project, stats = project_stream.fetch_project(url, code_path, manifest=manifest,
+                                                                  accept_bundle=mode == 'bundle', stage=stage)
+            received, retries = stats.total, 0
+        ok = status == 200 and project.success
+        if ok:
+            stage.commit(code_path, project.mpy_path, project.code_digest)
+        error = None if ok else f'HTTP {status}: {project.error}'
+    except (OSError, ValueError) as e:
+        ok, received, retries, error = False, 0, 0, str(e)
+    return {'ok': ok, 'ms': (time.perf_counter() - start) * 1000, 'bytes': received,
+            'retries': retries, 'error': error}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def run(url, mode, devices, fetches, warm=False, quiet=False):
+    """Run fetches spread over devices processes. Returns (results, seconds)."""
+    work = tempfile.mkdtemp()
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(devices, initializer=_device_init, initargs=(work,)) as pool:
+        for result in pool.map(fetch, [url] * fetches, [mode] * fetches, [warm] * fetches):
+            results.append(result)
+            if not quiet and not result['ok']:
+                print(f"fetch failed: {result['error']}")
+    elapsed = time.perf_counter() - start
+    shutil.rmtree(work, ignore_errors=True)
+    return results, elapsed
+
+
+def report(results, elapsed):
+    ok = [r for r in results if r['ok']]
+    times = [r['ms'] for r in ok]
+    received = sum(r['bytes'] for r in results)
+    print(f"{len(ok)}/{len(results)} fetches ok in {elapsed:.2f} s: {len(results) / elapsed:.1f} fetches/s, "
+          f"{received / elapsed / 1024:.0f} KB/s received")
+    if times:
+        print(f"fetch time ms: p50 {percentile(times, 50):.0f}  p90 {percentile(times, 90):.0f}  "
+              f"p99 {percentile(times, 99):.0f}  max {max(times):.0f}")
+    print(f"retries: {sum(r['retries'] for r in results)}")
+
+
+def main():
+    import project_server
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='getProject URL with deviceCode (default: a local stand-in)')
+    parser.add_argument('--mode', choices=MODES, default='manifest', help='firmware download path')
+    parser.add_argument('--devices', type=int, default=10, help='devices fetching at the same time')
+    parser.add_argument('--fetches', type=int, default=50, help='fetches in total')
+    parser.add_argument('--warm', action='store_true', help='keep each device\'s flash between fetches')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='fraction of replies cut off mid-body')
+    project_server.add_link_args(parser)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        from bench_bundle import make_project
+        root = tempfile.mkdtemp()
+        src = make_project(root)
+        size = sum(os.path.getsize(os.path.join(src, n)) for n in os.listdir(src))
+        server = project_server.serve(root, port=0, drop_rate=args.drop_rate, **project_server.link_options(args))
+        url = f"http://127.0.0.1:{server.server_port}/api/getProject?deviceCode=1234"
+        print(f"stand-in: project of {size} bytes, latency {args.latency} +- {args.jitter} ms, "
+              f"{args.bandwidth or 'unlimited'} KB/s per connection, {args.error_rate:.0%} errors, "
+              f"{args.drop_rate:.0%} drops")
+    print(f"{args.devices} devices, {args.fetches} fetches, {args.mode} path -> {url}")
+    results, elapsed = run(url, args.mode, args.devices, args.fetches, args.warm)
+    report(results, elapsed)
+    if server:
+        handler = server.RequestHandlerClass
+        print(f"server: {handler.requests} requests, {handler.errors} injected errors, "
+              f"{handler.dropped} drops, {handler.bytes_sent} bytes sent")
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
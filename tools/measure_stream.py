@@ -0,0 +1,116 @@
+"""Measure peak memory of the streaming getProject download against the stand-in
+
+Builds a fake project with N random sprites, serves it with project_server and
+downloads it the old way (whole JSON, then decode), then with
+semiblockFirmware/project_stream.py as JSON and as a bundle. Peak memory comes from tracemalloc.
+
+    python3 measure_stream.py --images 12 --size 60000
+"""
+import argparse
+import base64
+import importlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'semiblockFirmware'))
+
+import project_stream  # noqa: E402
+
+
+def start_server(root, chunked):
+    # Separate process so the server's allocations don't show up in tracemalloc
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    cmd = [sys.executable, os.path.join(HERE, 'project_server.py'), root,
+           '--host', '127.0.0.1', '--port', str(port)]
+    if chunked:
+        cmd.append('--chunked')
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(50):
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return proc, port
+
+
+def make_project(root, code, images, size):
+    folder = os.path.join(root, code)
+    os.makedirs(folder)
+    with open(os.path.join(folder, 'main.py'), 'w') as f:
+        f.write('print("hello from user app")\n' * 200)
+    for i in range(images):
+        with open(os.path.join(folder, f'sprite{i}.png'), 'wb') as f:
+            f.write(os.urandom(size))
+    return folder
+
+
+def old_way(url):
+    """What show_main_app() used to do: parse everything, then decode"""
+    with urllib.request.urlopen(url) as r:
+        reply = json.loads(r.read())
+    for img in reply['data']['images']:
+        data = img['image_data'].split(',', 1)[1]
+        with open(img['name'] + '.png', 'wb') as f:
+            f.write(base64.b64decode(data))
+    with open('user_app.tmp', 'w') as f:
+        f.write(reply['data']['code'])
+
+
+def peak_of(fn, *args):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=12)
+    parser.add_argument('--size', type=int, default=60000, help='bytes per image')
+    parser.add_argument('--chunked', action='store_true')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    src = make_project(root, '1234', args.images, args.size)
+    server, port = start_server(root, args.chunked)
+    url = f"http://127.0.0.1:{port}/api/getProject?deviceCode=1234"
+
+    # fetch_project() imports bundle and zlib with the first bundle; import them
+    # now, or the modules themselves count towards peak_bundle
+    for name in ('zlib', 'bundle'):
+        importlib.import_module(name)
+
+    work = tempfile.mkdtemp()
+    os.chdir(work)
+    peak_old, _ = peak_of(old_way, url)
+    peak_new, (status, project, stream) = peak_of(project_stream.fetch_project, url,
+                                                  'user_app.tmp', None, None, None, False)
+    peak_bundle, (_, _, unpacker) = peak_of(project_stream.fetch_project, url)
+    server.terminate()
+
+    for i in range(args.images):
+        with open(os.path.join(src, f'sprite{i}.png'), 'rb') as a, open(f'sprite{i}.png', 'rb') as b:
+            assert a.read() == b.read(), f'sprite{i}.png differs'
+
+    print(f"payload:          {stream.total} bytes ({args.images} x {args.size} byte images)")
+    print(f"status:           {status}, images saved: {len(project.images)}, code: {project.code_size} bytes")
+    print(f"peak json.loads:  {peak_old} bytes")
+    print(f"peak streaming:   {peak_new} bytes")
+    print(f"peak bundle:      {peak_bundle} bytes ({unpacker.total} bytes on the wire)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Simulate a classroom of boards provisioning the same project on Linux
+
+Starts the project_server stand-in as the origin, then N device processes,
+each with its own flash directory and peer HTTP port. Every device runs
+the firmware's provisioning path: semiblockFirmware/peer_cache.fetch_project
+into a staging.Stage, commit, then peer_cache.serve() for the others.
+The first device starts alone; the rest join after --stagger seconds.
+Reports where each device got the project and how many bytes the origin served.
+The origin always serves the manifests; peers serve the files.
+
+    python3 peer_sim.py --devices 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'semiblockFirmware'))
+
+
+def device(args):
+    """One simulated board: fetch (LAN first), install, then share"""
+    import peer_cache
+    import staging
+    os.chdir(args.flash)
+    peer_cache.HTTP_PORT = args.http_port
+    if args.broadcast:
+        peer_cache.BROADCAST = args.broadcast
+    start = time.perf_counter()
+    stage = staging.Stage()
+    code_path = stage.path('user_app.tmp')
+    status, project, stats = peer_cache.fetch_project(args.origin, args.code, code_path, stage=stage)
+    ok = status == 200 and project.success
+    digest = stage.commit(code_path, project.mpy_path, project.code_digest) if ok else None
+    elapsed = time.perf_counter() - start
+    print('RESULT ' + json.dumps({'ok': ok, 'source': stats.source, 'bytes': stats.total,
+                                  'ms': round(elapsed * 1000, 1), 'app': digest}), flush=True)
+    if ok:
+        peer_cache.serve(peer_cache.Share(args.code, project, digest),
+                         share_ms=args.share * 1000, idle_ms=1000, port=args.http_port)
+        print('SERVED ' + json.dumps(peer_cache.stats), flush=True)
+
+
+def spawn(i, args, origin, flash):
+    cmd = [sys.executable, __file__, '--device', '--origin', origin, '--code', args.code,
+           '--flash', flash, '--http-port', str(args.base_port + i), '--share', str(args.share)]
+    if args.broadcast:
+        cmd += ['--broadcast', args.broadcast]
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+def lines(output, prefix):
+    return [json.loads(line[len(prefix):]) for line in output.splitlines() if line.startswith(prefix)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=6)
+    parser.add_argument('--stagger', type=float, default=1.0, help='seconds before the others start')
+    parser.add_argument('--share', type=float, default=4.0, help='seconds each device shares')
+    parser.add_argument('--code', default='1234')
+    parser.add_argument('--base-port', type=int, default=18266)
+    parser.add_argument('--broadcast', help='broadcast address (default: peer_cache.BROADCAST)')
+    parser.add_argument('--device', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--origin', help=argparse.SUPPRESS)
+    parser.add_argument('--flash', help=argparse.SUPPRESS)
+    parser.add_argument('--http-port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.device:
+        device(args)
+        return
+
+    import project_server
+    from bench_bundle import make_project
+    work = tempfile.mkdtemp()
+    src = make_project(os.path.join(work, 'origin'), args.code)
+    size = sum(os.path.getsize(os.path.join(src, n)) for n in os.listdir(src))
+    server = project_server.serve(os.path.join(work, 'origin'), port=0)
+    origin = f"http://127.0.0.1:{server.server_port}/api/getProject?deviceCode={args.code}"
+
+    procs = []
+    for i in range(args.devices):
+        flash = os.path.join(work, f'board{i}')
+        os.makedirs(flash)
+        procs.append(spawn(i, args, origin, flash))
+        if i == 0:
+            time.sleep(args.stagger)
+    print(f"project: {size} bytes, {args.devices} boards")
+    for i, p in enumerate(procs):
+        out = p.communicate(timeout=120)[0]
+        result = lines(out, 'RESULT ')
+        served = lines(out, 'SERVED ')
+        if not result:
+            print(f"board{i}: no result\n{out}")
+            continue
+        r = result[0]
+        shared = (f", then served {served[0]['bytes']} bytes on {served[0]['connections']} connections"
+                  if served else '')
+        print(f"board{i}: {'ok' if r['ok'] else 'FAILED':6s} from {r['source']:5s} "
+              f"{r['bytes']:8d} bytes in {r['ms']:7.1f} ms{shared}")
+    origin_bytes = server.RequestHandlerClass.bytes_sent
+    print(f"origin served {origin_bytes} bytes, {origin_bytes / max(size, 1):.1f}x the project "
+          f"(without peers: about {args.devices}x)")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
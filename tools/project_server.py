@@ -0,0 +1,395 @@
+"""Local stand-in for https://build.semiblock.ai/api/getProject
+
+Serves projects from a directory, one sub-directory per device code:
+
+    projects/1234/main.py
+    projects/1234/bird.png
+
+    python3 project_server.py projects --port 8080
+    curl "http://localhost:8080/api/getProject?deviceCode=1234"
+
+Every image carries a "digest" (first 16 hex digits of its sha256). Pass
+have=name:digest,... and matching images come back as {"cached": true}
+without image_data, like semiblockFirmware/asset_cache.py expects.
+
+If mpy-cross is installed the code is also sent compiled, as data.mpy
+(base64) or a KIND_MPY bundle entry.
+
+Clients that send "Accept: application/x-semiblock-bundle" (or add
+format=bundle) get the binary bundle from bundle_pack.py instead of JSON.
+
+format=manifest answers with a small JSON listing url, size and digest of
+the code, .mpy and each image (marked by an X-Semiblock-Manifest header);
+the files themselves come from /api/getAsset, which honours Range requests
+so semiblockFirmware/downloader.py can resume. --drop-rate makes the server
+cut that fraction of responses off part way through the body.
+
+To look like a real backend on a real link it can also wait --latency ms
+(+- --jitter) before each reply, cap each connection at --bandwidth KB/s
+and answer --error-rate of the requests with a 503. tools/load_gen.py
+replays many device fetches against it.
+
+--firmware serves a firmware script for semiblockFirmware/ota.py on
+/api/getFirmware (a manifest with version, url, size and digest, plus its
+.mpy if mpy-cross is installed), the file itself on /api/getFirmwareFile.
+
+With --tls-cert/--tls-key it speaks https, issuing session tickets so
+clients can resume (see semiblockFirmware/netcache.py).
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import bundle_pack
+
+CODE_FILES = ('main.py', 'user_app.py', 'code.py')
+DIGEST_LEN = 16
+BUNDLE_TYPE = 'application/x-semiblock-bundle'
+
+
+_bundles = {}
+_compiled = {}
+
+
+def compiled_mpy(source):
+    """.mpy for a source string (None without mpy-cross), compiled once per source"""
+    if source not in _compiled:
+        _compiled[source] = bundle_pack.compile_mpy(source.encode())
+    return _compiled[source]
+
+
+def project_bundle(folder, have):
+    """Packed bundle for a project folder, cached until a file in it changes"""
+    stamp = max(os.stat(os.path.join(folder, n)).st_mtime_ns for n in os.listdir(folder))
+    key = (folder, stamp, tuple(sorted(have.items())))
+    if key not in _bundles:
+        _bundles[key] = bundle_pack.pack_folder(folder, have)
+    return _bundles[key]
+
+
+def parse_have(value):
+    """'name:digest,name:digest' -> {name: digest}"""
+    have = {}
+    for item in value.split(','):
+        name, _, digest = item.rpartition(':')
+        if name:
+            have[name] = digest
+    return have
+
+
+def project_files(root, code):
+    """{file name: bytes} a device can fetch from getAsset, or None.
+
+    The code is listed under its own name, its compiled form as <stem>.mpy.
+    """
+    folder = os.path.join(root, code)
+    if not code.isdigit() or not os.path.isdir(folder):
+        return None
+    files = {}
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), 'rb') as f:
+            raw = f.read()
+        if name in CODE_FILES:
+            files[name] = raw
+            compiled = compiled_mpy(raw.decode())
+            if compiled:
+                files[name.rsplit('.', 1)[0] + '.mpy'] = compiled
+        elif name.endswith('.png'):
+            files[name] = raw
+    return files
+
+
+def load_manifest(root, code):
+    """getProject reply for format=manifest: where to fetch each file, or None"""
+    files = project_files(root, code)
+    if files is None:
+        return None
+
+    def entry(name):
+        raw = files[name]
+        return {'url': f'/api/getAsset?deviceCode={code}&file={name}', 'size': len(raw),
+                'digest': hashlib.sha256(raw).hexdigest()[:DIGEST_LEN]}
+
+    data = {'code': {'url': None, 'size': 0, 'digest': None}, 'images': []}
+    for name in files:
+        if name in CODE_FILES:
+            data['code'] = entry(name)
+        elif name.endswith('.mpy'):
+            data['mpy'] = entry(name)
+        else:
+            data['images'].append(dict(entry(name), name=name[:-4]))
+    return {'success': True, 'data': data}
+
+
+def firmware_files(path):
+    """{'fw.py': bytes, 'fw.mpy': bytes} for a firmware script (no .mpy without mpy-cross)"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    files = {'fw.py': raw}
+    compiled = compiled_mpy(raw.decode())
+    if compiled:
+        files['fw.mpy'] = compiled
+    return files
+
+
+def firmware_manifest(files, version):
+    def entry(name):
+        raw = files[name]
+        return {'url': f'/api/getFirmwareFile?file={name}&version={version}', 'size': len(raw),
+                'digest': hashlib.sha256(raw).hexdigest()[:DIGEST_LEN]}
+
+    data = {'version': version, 'file': entry('fw.py')}
+    if 'fw.mpy' in files:
+        data['mpy'] = entry('fw.mpy')
+    return {'success': True, 'data': data}
+
+
+def load_project(root, code, have=None):
+    """Build the getProject JSON reply for one device code, or None"""
+    have = have or {}
+    folder = os.path.join(root, code)
+    if not code.isdigit() or not os.path.isdir(folder):
+        return None
+    source = ''
+    compiled = None
+    images = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if name in CODE_FILES:
+            with open(path) as f:
+                source = f.read()
+            compiled = compiled_mpy(source)
+        elif name.endswith('.png'):
+            with open(path, 'rb') as f:
+                raw = f.read()
+            digest = hashlib.sha256(raw).hexdigest()[:DIGEST_LEN]
+            if have.get(name[:-4]) == digest:
+                images.append({'name': name[:-4], 'digest': digest, 'cached': True})
+                continue
+            images.append({
+                'name': name[:-4],
+                'digest': digest,
+                'image_data': 'data:image/png;base64,' + base64.b64encode(raw).decode(),
+            })
+    data = {'code': source, 'images': images}
+    if compiled:
+        data['mpy'] = base64.b64encode(compiled).decode()
+    return {'success': True, 'data': data}
+
+
+class ProjectHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+    root = 'projects'
+    firmware = None   # (path, version) for /api/getFirmware
+    chunked = False
+    drop_rate = 0.0
+    latency = 0.0     # seconds before each reply
+    jitter = 0.0      # +- seconds on top of latency
+    bandwidth = 0     # bytes/s per connection, 0 = unlimited
+    error_rate = 0.0
+    bytes_sent = 0
+    dropped = 0
+    requests = 0
+    errors = 0
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def do_GET(self):
+        type(self).requests += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if random.random() < self.error_rate:
+            type(self).errors += 1
+            self.send_json(503, {'success': False, 'error': 'injected error'}, {'Retry-After': '1'})
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        code = query.get('deviceCode', [''])[0]
+        if url.path == '/api/getAsset':
+            self.send_asset(code, query.get('file', [''])[0])
+            return
+        if url.path in ('/api/getFirmware', '/api/getFirmwareFile'):
+            self.send_firmware(url.path, query.get('file', [''])[0])
+            return
+        if url.path != '/api/getProject':
+            self.send_json(404, {'success': False, 'error': 'not found'})
+            return
+        if query.get('format', [''])[0] == 'manifest':
+            manifest = load_manifest(self.root, code)
+            if manifest is None:
+                self.send_json(404, {'success': False, 'error': 'unknown device code'})
+                return
+            self.send_json(200, manifest, {'X-Semiblock-Manifest': '1'})
+            return
+        have = parse_have(query.get('have', [''])[0])
+        wants_bundle = (BUNDLE_TYPE in self.headers.get('Accept', '')
+                        or query.get('format', [''])[0] == 'bundle')
+        if wants_bundle and code.isdigit() and os.path.isdir(os.path.join(self.root, code)):
+            body = project_bundle(os.path.join(self.root, code), have)
+            self.send_body(200, BUNDLE_TYPE, body)
+            return
+        project = load_project(self.root, code, have)
+        if project is None:
+            self.send_json(404, {'success': False, 'error': 'unknown device code'})
+            return
+        self.send_json(200, project)
+
+    def send_asset(self, code, name):
+        files = project_files(self.root, code)
+        if files is None or name not in files:
+            self.send_json(404, {'success': False, 'error': 'unknown file'})
+            return
+        self.send_ranged(files[name])
+
+    def send_firmware(self, route, name):
+        files = firmware_files(self.firmware[0]) if self.firmware else {}
+        if route == '/api/getFirmware' and files:
+            self.send_json(200, firmware_manifest(files, self.firmware[1]), {'X-Semiblock-Manifest': '1'})
+        elif name in files:
+            self.send_ranged(files[name])
+        else:
+            self.send_json(404, {'success': False, 'error': 'no firmware'})
+
+    def send_ranged(self, body):
+        """Send body, or the part a Range header asks for"""
+        start = 0
+        spec = self.headers.get('Range', '')
+        if spec.startswith('bytes=') and spec[6:].split('-')[0].isdigit():
+            start = int(spec[6:].split('-')[0])
+            if start >= len(body):
+                self.send_body(416, 'text/plain', b'',
+                               {'Content-Range': f'bytes */{len(body)}'})
+                return
+            self.send_body(206, 'application/octet-stream', body[start:],
+                           {'Content-Range': f'bytes {start}-{len(body) - 1}/{len(body)}'})
+            return
+        self.send_body(200, 'application/octet-stream', body, {'Accept-Ranges': 'bytes'})
+
+    def send_json(self, status, obj, headers=None):
+        self.send_body(status, 'application/json', json.dumps(obj).encode(), headers)
+
+    def send_body(self, status, content_type, body, headers=None):
+        """Send a reply, keeping the connection open unless the client asked to close"""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        if self.chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        if body and random.random() < self.drop_rate:
+            # Simulate a flaky link: part of the body, then the connection goes away
+            cut = random.randrange(len(body))
+            type(self).bytes_sent += cut
+            type(self).dropped += 1
+            self.write_body(body[:cut])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        type(self).bytes_sent += len(body)
+        if self.chunked:
+            for i in range(0, len(body), 4096):
+                part = body[i:i + 4096]
+                self.write_body(b'%x\r\n%s\r\n' % (len(part), part))
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.write_body(body)
+
+    def write_body(self, data):
+        """wfile.write, paced to self.bandwidth bytes/s"""
+        if not self.bandwidth:
+            self.wfile.write(data)
+            return
+        start = time.perf_counter()
+        step = max(self.bandwidth // 50, 512)  # ~20 ms slices
+        for i in range(0, len(data), step):
+            self.wfile.write(data[i:i + step])
+            self.wfile.flush()
+            ahead = start + (i + step) / self.bandwidth - time.perf_counter()
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+class Server(ThreadingHTTPServer):
+    request_queue_size = 256  # many devices connect at once under tools/load_gen.py
+    daemon_threads = True
+
+
+def serve(root, host='127.0.0.1', port=8080, chunked=False, verbose=False, drop_rate=0.0, tls=None,
+          latency=0.0, jitter=0.0, bandwidth=0, error_rate=0.0, firmware=None):
+    """Start the stand-in on a background thread and return the server.
+
+    tls is (certfile, keyfile) to serve https. latency and jitter are in
+    seconds, bandwidth in bytes/s per connection. firmware is (path, version).
+    """
+    handler = type('Handler', (ProjectHandler,),
+                   {'root': root, 'chunked': chunked, 'drop_rate': drop_rate, 'latency': latency,
+                    'firmware': firmware,
+                    'jitter': jitter, 'bandwidth': bandwidth, 'error_rate': error_rate})
+    server = Server((host, port), handler)
+    if tls:
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(*tls)
+        server.socket = ctx.wrap_socket(server.socket, server_side=True)
+    server.verbose = verbose
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_link_args(parser):
+    parser.add_argument('--latency', type=float, default=0.0, help='ms before each reply')
+    parser.add_argument('--jitter', type=float, default=0.0, help='+- ms on top of --latency')
+    parser.add_argument('--bandwidth', type=float, default=0.0, help='KB/s per connection (0: unlimited)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered 503')
+
+
+def link_options(args):
+    """serve() keyword arguments for the add_link_args() options"""
+    return {'latency': args.latency / 1000, 'jitter': args.jitter / 1000,
+            'bandwidth': int(args.bandwidth * 1024), 'error_rate': args.error_rate}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('root', help='directory with one folder per device code')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--chunked', action='store_true', help='use chunked transfer encoding')
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help='fraction of responses to cut off mid-body')
+    parser.add_argument('--tls-cert', help='certificate (PEM) to serve https')
+    parser.add_argument('--tls-key', help='private key (PEM) for --tls-cert')
+    parser.add_argument('--firmware', help='firmware script to offer on /api/getFirmware')
+    parser.add_argument('--firmware-version', default='dev', help='version reported for --firmware')
+    add_link_args(parser)
+    args = parser.parse_args()
+    tls = (args.tls_cert, args.tls_key) if args.tls_cert else None
+    firmware = (args.firmware, args.firmware_version) if args.firmware else None
+    server = serve(args.root, args.host, args.port, args.chunked, verbose=True,
+                   drop_rate=args.drop_rate, tls=tls, firmware=firmware, **link_options(args))
+    scheme = 'https' if tls else 'http'
+    print(f"Serving {args.root} on {scheme}://{args.host}:{server.server_port}/api/getProject")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Push a project folder to a board on the LAN and restart it into the app
+
+Talks to semiblockFirmware/push_server.py (PUSH_DEPLOY in the firmware).
+Asks the board which images it already has, packs the rest with the code
+(and its .mpy if mpy-cross is installed) into one bundle and POSTs it.
+
+    python3 push.py 192.168.1.42 ../flippybird
+    python3 push.py 192.168.1.42 ../flippybird --watch
+
+--watch pushes again every time a file in the folder changes. --multipart
+sends the files as a plain form upload instead, like curl -F would.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from http.client import HTTPConnection
+
+import bundle_pack
+
+PORT = 8080
+BUNDLE_TYPE = 'application/x-semiblock-bundle'
+
+
+def split_board(board):
+    host, _, port = board.partition(':')
+    return host, int(port or PORT)
+
+
+def request(board, method, path, body=None, headers=None, timeout=10):
+    host, port = split_board(board)
+    conn = HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request(method, path, body, headers or {})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b'{}')
+    finally:
+        conn.close()
+
+
+def board_assets(board, token=None):
+    """{name: digest} of the images on the board, {} if it cannot say"""
+    try:
+        status, reply = request(board, 'GET', '/status', headers=_auth(token))
+    except (OSError, ValueError):
+        return {}
+    if status != 200:
+        return {}
+    return {name: entry[0] for name, entry in reply.get('assets', {}).items()}
+
+
+def multipart_body(folder):
+    boundary = uuid.uuid4().hex
+    code = bundle_pack.code_file(folder)
+    out = []
+    for name in sorted(os.listdir(folder)):
+        if name != code and not name.endswith('.png'):
+            continue
+        with open(os.path.join(folder, name), 'rb') as f:
+            data = f.read()
+        out.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{name}"\r\n'
+                   f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+    out.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(out), f'multipart/form-data; boundary={boundary}'
+
+
+def _auth(token):
+    return {'X-Push-Token': token} if token else {}
+
+
+def push(board, folder, multipart=False, token=None, full=False):
+    """Send folder to the board. Returns the board's reply (with its timings)."""
+    start = time.perf_counter()
+    if multipart:
+        body, ctype = multipart_body(folder)
+    else:
+        have = {} if full else board_assets(board, token)
+        body, ctype = bundle_pack.pack_folder(folder, have), BUNDLE_TYPE
+    packed = time.perf_counter()
+    headers = dict(_auth(token), **{'Content-Type': ctype})
+    status, reply = request(board, 'POST', '/push', body, headers, timeout=60)
+    done = time.perf_counter()
+    if status != 200:
+        raise RuntimeError(f"board said {status}: {reply.get('error')}")
+    reply['pack_ms'] = round((packed - start) * 1000, 1)
+    reply['total_ms'] = round((done - start) * 1000, 1)
+    print(f"Pushed {len(body)} bytes: pack {reply['pack_ms']} ms, on the board receive "
+          f"{reply['receive_ms']} ms + commit {reply['commit_ms']} ms, total {reply['total_ms']} ms; "
+          f"{reply['written']} files written, {reply['unchanged']} unchanged")
+    return reply
+
+
+def stamp(folder):
+    return max(os.stat(os.path.join(folder, n)).st_mtime_ns for n in os.listdir(folder))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('board', help='host[:port] of the board')
+    parser.add_argument('folder')
+    parser.add_argument('--multipart', action='store_true', help='form upload instead of a bundle')
+    parser.add_argument('--full', action='store_true', help='send every image, even ones the board has')
+    parser.add_argument('--token', help='X-Push-Token, if push_server.TOKEN is set')
+    parser.add_argument('--watch', action='store_true', help='push again whenever the folder changes')
+    args = parser.parse_args()
+    if not bundle_pack.code_file(args.folder):
+        sys.exit(f"{args.folder}: no main.py/user_app.py/code.py and not exactly one .py")
+
+    last = None
+    while True:
+        current = stamp(args.folder)
+        if current != last:
+            last = current
+            try:
+                push(args.board, args.folder, args.multipart, args.token, args.full)
+            except (OSError, RuntimeError) as e:
+                print(f"Push failed: {e}")
+                if not args.watch:
+                    sys.exit(1)
+        if not args.watch:
+            break
+        time.sleep(0.3)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Stand-ins for the board's modules, to run the apps and the firmware headless
+
+The apps import lcd_bus, st7796, ft6x36, i2c, machine, task_handler,
+network and fs_driver, none of which a workstation has. install() puts
+a stand-in for each in sys.modules, the way launcher.py serves the
+firmware's live hardware to an app:
+
+- time: a clock that fast-forwards sleeps (sim/time.py)
+- lcd_bus: tools/lcd_bus_sim.py, counting and timing every transfer
+- st7796: an LVGL display that flushes into an in-memory RGB565 frame
+  buffer and records per-frame render and bus time
+- ft6x36 / i2c: a pointer that plays a touch script
+- machine: pins, PWM, SPI.Bus and Timer on the simulator clock
+- task_handler: lv.task_handler() on the simulator clock
+- network / socket / ssl: a WLAN that associates, and real sockets with
+  hosts redirected to a local tools/project_server.py
+- fs_driver: only if the LVGL build has none
+
+It needs the LVGL bindings (the lvgl_micropython Unix build); CPython
+with bindings of the same API works as far as the app does. Run apps
+with tools/simulator.py.
+"""
+import sys
+
+
+def install():
+    """Put the stand-ins in sys.modules. Call before the app imports anything."""
+    import lvgl as lv
+    from sim import time, machine, lcd_bus, st7796, i2c, ft6x36, task_handler, network, socket, ssl
+    stand_ins = {'time': time, 'machine': machine, 'lcd_bus': lcd_bus, 'st7796': st7796, 'i2c': i2c,
+                 'ft6x36': ft6x36, 'task_handler': task_handler, 'network': network, 'socket': socket, 'ssl': ssl}
+    try:
+        import fs_driver  # noqa: F401
+    except ImportError:
+        from sim import fs_driver
+        stand_ins['fs_driver'] = fs_driver
+    for name in stand_ins:
+        sys.modules[name] = stand_ins[name]
+    if not lv.is_initialized():
+        lv.init()
+    try:
+        # LVGL's time is the simulator clock, whoever calls lv.tick_inc()
+        lv.tick_set_cb(time.now)
+    except (AttributeError, TypeError, RuntimeError):
+        pass
@@ -0,0 +1,60 @@
+"""fs_driver for LVGL bindings that come without one: "S:" paths are files here"""
+import struct
+
+import lvgl as lv
+
+
+def _open_cb(drv, path, mode):
+    if mode == lv.FS_MODE.WR:
+        p_mode = 'wb'
+    elif mode == lv.FS_MODE.RD:
+        p_mode = 'rb'
+    else:
+        p_mode = 'rb+'
+    try:
+        f = open(path, p_mode)
+    except OSError as e:
+        raise RuntimeError('fs_open_callback(%s) exception: %s' % (path, e))
+    return {'file': f, 'path': path}
+
+
+def _close_cb(drv, fs_file):
+    fs_file.__cast__()['file'].close()
+    return lv.FS_RES.OK
+
+
+def _read_cb(drv, fs_file, buf, btr, br):
+    data = fs_file.__cast__()['file'].read(btr)
+    buf.__dereference__(btr)[0:len(data)] = data
+    br.__dereference__(4)[0:4] = struct.pack('<L', len(data))
+    return lv.FS_RES.OK
+
+
+def _write_cb(drv, fs_file, buf, btw, bw):
+    n = fs_file.__cast__()['file'].write(buf.__dereference__(btw))
+    bw.__dereference__(4)[0:4] = struct.pack('<L', n)
+    return lv.FS_RES.OK
+
+
+def _seek_cb(drv, fs_file, pos, whence):
+    fs_file.__cast__()['file'].seek(pos, whence)
+    return lv.FS_RES.OK
+
+
+def _tell_cb(drv, fs_file, pos):
+    pos.__dereference__(4)[0:4] = struct.pack('<L', fs_file.__cast__()['file'].tell())
+    return lv.FS_RES.OK
+
+
+def fs_register(fs_drv, letter, cache_size=500):
+    fs_drv.init()
+    fs_drv.letter = ord(letter)
+    fs_drv.open_cb = _open_cb
+    fs_drv.read_cb = _read_cb
+    fs_drv.write_cb = _write_cb
+    fs_drv.seek_cb = _seek_cb
+    fs_drv.tell_cb = _tell_cb
+    fs_drv.close_cb = _close_cb
+    if cache_size >= 0:
+        fs_drv.cache_size = cache_size
+    fs_drv.register()
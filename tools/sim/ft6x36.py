@@ -0,0 +1,89 @@
+"""ft6x36 for the simulator: a pointer driven by a touch script
+
+Points are in screen coordinates, as the app sees them after
+set_rotation(), at times on the simulator clock:
+
+    ft6x36.tap(340, 60, 1500)          # press at 1.5 s for TAP_MS
+    ft6x36.press(2000, 100, 100)       # or press, move and release
+    ft6x36.press(2100, 200, 100)
+    ft6x36.release(2200)
+
+LVGL v9 turns what the touch controller reports on the panel's own axes
+into screen coordinates using the display's rotation; the stand-in does
+the reverse, so it reports what the real controller would.
+"""
+import lvgl as lv
+
+from sim import st7796
+from sim import time as clock
+
+BITS = 8
+TAP_MS = 100
+
+# (ms, x, y) to press there, (ms, None, None) to release, in time order
+script = []
+
+# Filled in as the script plays
+stats = {'presses': 0}
+
+
+def press(ms, x, y):
+    script.append((ms, x, y))
+    script.sort(key=lambda e: e[0])
+
+
+def release(ms):
+    press(ms, None, None)
+
+
+def tap(x, y, ms, hold_ms=TAP_MS):
+    press(ms, x, y)
+    release(ms + hold_ms)
+
+
+def _native(x, y):
+    """Screen (x, y) to panel coordinates, which LVGL rotates back"""
+    display = st7796.display
+    if display is None:
+        return x, y
+    w, h = display.width, display.height
+    rotation = display.get_rotation()
+    if rotation == lv.DISPLAY_ROTATION._90:
+        return y, h - x - 1
+    if rotation == lv.DISPLAY_ROTATION._180:
+        return w - x - 1, h - y - 1
+    if rotation == lv.DISPLAY_ROTATION._270:
+        return w - y - 1, x
+    return x, y
+
+
+class FT6x36:
+    def __init__(self, device, touch_cal=None, startup_rotation=None, debug=False):
+        self._device = device
+        self.is_calibrated = True
+        self._point = None
+        self._last = (0, 0)
+        self._indev_drv = lv.indev_create()
+        self._indev_drv.set_type(lv.INDEV_TYPE.POINTER)
+        self._indev_drv.set_read_cb(self._read)
+
+    def calibrate(self):
+        pass
+
+    def get_indev(self):
+        return self._indev_drv
+
+    def _read(self, indev, data):
+        now = clock.now()
+        while script and script[0][0] <= now:
+            _, x, y = script.pop(0)
+            pressed = self._point is not None
+            self._point = None if x is None else _native(x, y)
+            if pressed != (self._point is not None):
+                # LVGL gets to see every press and release, however long the app slept
+                stats['presses'] += not pressed
+                break
+        if self._point is not None:
+            self._last = self._point
+        data.point.x, data.point.y = self._last
+        data.state = lv.INDEV_STATE.RELEASED if self._point is None else lv.INDEV_STATE.PRESSED
@@ -0,0 +1,35 @@
+"""i2c for the simulator: buses and devices that read back zeros"""
+
+
+class I2C:
+    class Bus:
+        def __init__(self, host, scl, sda, freq=400000, use_locks=False, pullup=False):
+            self.host = host
+            self.freq = freq
+
+        def scan(self):
+            return []
+
+        def deinit(self):
+            pass
+
+    class Device:
+        def __init__(self, bus, dev_id, reg_bits=8):
+            self.bus = bus
+            self.dev_id = dev_id
+            self.reg_bits = reg_bits
+
+        def read_mem(self, memaddr, buf=None, num_bytes=None):
+            if buf is None:
+                return bytearray(num_bytes or 1)
+            for i in range(len(buf)):
+                buf[i] = 0
+
+        def write_mem(self, memaddr, buf):
+            pass
+
+        def read(self, buf=None, num_bytes=None):
+            return self.read_mem(None, buf, num_bytes)
+
+        def write(self, buf):
+            pass
@@ -0,0 +1,2 @@
+"""lcd_bus for the simulator: tools/lcd_bus_sim.py, the recording SPIBus"""
+from lcd_bus_sim import *  # noqa: F401,F403
@@ -0,0 +1,132 @@
+"""machine for the simulator: what the apps and the firmware touch
+
+SPI.Bus only records its pins. Timer callbacks run on the simulator clock
+(sim.time). reset() ends the run by raising Reset.
+"""
+from sim import time as clock
+
+
+class Reset(BaseException):
+    """machine.reset() or soft_reset() was called"""
+
+
+def reset():
+    raise Reset()
+
+
+def soft_reset():
+    raise Reset()
+
+
+def freq(hz=None):
+    return 240000000
+
+
+def unique_id():
+    return b'\x53\x49\x4d\x00\x00\x01'
+
+
+def idle():
+    clock.sleep_ms(1)
+
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
+
+
+def reset_cause():
+    return PWRON_RESET
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 2
+    PULL_DOWN = 1
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None, **kwargs):
+        self.id = id
+        self._value = value or 0
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = 1 if v else 0
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def irq(self, handler=None, trigger=None, **kwargs):
+        pass
+
+
+class PWM:
+    def __init__(self, pin, freq=5000, duty=0, duty_u16=None, **kwargs):
+        self.pin = pin
+        self._freq = freq
+        self._duty_u16 = duty_u16 if duty_u16 is not None else duty * 64
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty(self, value=None):
+        if value is None:
+            return self._duty_u16 // 64
+        self._duty_u16 = value * 64
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self._duty_u16
+        self._duty_u16 = value
+
+    def deinit(self):
+        pass
+
+
+class SPI:
+    class Bus:
+        def __init__(self, host, mosi, miso, sck, **kwargs):
+            self.host = host
+            self.pins = (mosi, miso, sck)
+
+        def deinit(self):
+            pass
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.id = id
+        self._timer = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, callback=None, freq=None):
+        self.deinit()
+        if freq:
+            period = 1000 // freq
+        self._timer = clock.every(period, lambda: callback(self), once=mode == Timer.ONE_SHOT)
+
+    def deinit(self):
+        if self._timer is not None:
+            clock.cancel(self._timer)
+            self._timer = None
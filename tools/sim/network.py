@@ -0,0 +1,127 @@
+"""network for the simulator: a WLAN that associates on the simulator clock
+
+By default any SSID connects CONNECT_MS after connect(). Once networks
+has entries, only those are there: an unknown SSID ends in
+STAT_NO_AP_FOUND and a wrong password in STAT_WRONG_PASSWORD.
+
+    network.networks.append({'ssid': 'Quantr 2.4G', 'password': 'quantrwifi', 'rssi': -50})
+
+The router at ROUTER is also the DNS server ifconfig() hands out;
+sim.socket answers its queries.
+"""
+from sim import time as clock
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_GOT_IP = 1010
+STAT_NO_AP_FOUND = 201
+STAT_WRONG_PASSWORD = 202
+STAT_BEACON_TIMEOUT = 200
+STAT_ASSOC_FAIL = 203
+STAT_HANDSHAKE_TIMEOUT = 204
+
+AUTH_OPEN = 0
+AUTH_WPA2_PSK = 3
+
+CONNECT_MS = 1200
+SCAN_MS = 2000
+ROUTER = '192.168.4.1'
+ADDRESS = '192.168.4.23'
+
+# {'ssid', 'password', 'rssi', 'channel'}; empty lets every SSID connect
+networks = []
+
+# Filled in by WLAN
+stats = {'connects': 0, 'scans': 0}
+
+
+def _find(ssid):
+    for net in networks:
+        if net['ssid'] == ssid:
+            return net
+    return None
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._active = False
+        self._ssid = None
+        self._status = STAT_IDLE
+        self._ready_at = None
+        self._channel = 1
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = bool(value)
+        if not self._active:
+            self.disconnect()
+
+    def connect(self, ssid=None, key=None, bssid=None):
+        if not self._active:
+            raise OSError('Wifi Not Started')
+        stats['connects'] += 1
+        self._ssid = ssid
+        net = _find(ssid)
+        if networks and net is None:
+            self._status = STAT_NO_AP_FOUND
+        elif net is not None and net.get('password') not in (None, key):
+            self._status = STAT_WRONG_PASSWORD
+        else:
+            self._status = STAT_CONNECTING
+            self._ready_at = clock.now() + CONNECT_MS
+            if net is not None:
+                self._channel = net.get('channel', 1)
+
+    def disconnect(self):
+        self._status = STAT_IDLE
+        self._ready_at = None
+
+    def status(self, param=None):
+        if param == 'rssi':
+            net = _find(self._ssid)
+            return net.get('rssi', -50) if net else -50
+        if param is not None:
+            raise ValueError('unknown status param')
+        if self._status == STAT_CONNECTING and clock.now() >= self._ready_at:
+            self._status = STAT_GOT_IP
+        return self._status
+
+    def isconnected(self):
+        return self.status() == STAT_GOT_IP
+
+    def ifconfig(self, config=None):
+        if config is not None:
+            return
+        if not self.isconnected():
+            return ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+        return (ADDRESS, '255.255.255.0', ROUTER, ROUTER)
+
+    def config(self, *args, **kwargs):
+        if 'channel' in kwargs:
+            self._channel = kwargs['channel']
+        if not args:
+            return
+        name = args[0]
+        if name == 'channel':
+            return self._channel
+        if name == 'mac':
+            return b'\x02\x53\x49\x4d\x00\x01'
+        if name in ('ssid', 'essid'):
+            return self._ssid or ''
+        if name == 'hostname':
+            return 'semiblock-sim'
+        raise ValueError('unknown config param')
+
+    def scan(self):
+        """(ssid, bssid, channel, RSSI, security, hidden) per network; takes SCAN_MS"""
+        stats['scans'] += 1
+        clock.sleep_ms(SCAN_MS)
+        found = networks or [{'ssid': 'sim'}]
+        return [(net['ssid'].encode(), bytes((2, 0, 0, 0, 0, i)), net.get('channel', 1), net.get('rssi', -50),
+                 AUTH_OPEN if net.get('password') is None else AUTH_WPA2_PSK, False)
+                for i, net in enumerate(found)]
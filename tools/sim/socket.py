@@ -0,0 +1,106 @@
+"""socket for the simulator: real sockets, with hosts sent somewhere else
+
+hosts maps a host name to the (ip, port) that really answers, e.g. a
+tools/project_server.py on this machine instead of the cloud:
+
+    socket.hosts['build.semiblock.ai'] = ('127.0.0.1', 8080)
+
+Connections to that host on any port go to ip:port, also when they come
+by IP after a DNS lookup. sim.ssl leaves them in plain text.
+
+DNS queries to the simulated router (sim.network.ROUTER) are answered
+here: redirected hosts with their ip, anything else with what this
+machine's resolver says.
+"""
+import struct
+
+import socket as _socket
+
+from sim import network
+
+TTL = 300
+
+# host -> (ip, port)
+hosts = {}
+
+# Filled in as connections are made
+stats = {'redirects': 0, 'dns_queries': 0}
+
+_DNS = (network.ROUTER, 53)
+
+
+def __getattr__(name):
+    # AF_INET, SOCK_STREAM, SOL_SOCKET, ... from the real module
+    return getattr(_socket, name)
+
+
+def _target(host, port):
+    if host in hosts:
+        return hosts[host]
+    for ip, target_port in hosts.values():
+        if host == ip and port in (80, 443):
+            return ip, target_port
+    return None
+
+
+def getaddrinfo(host, port, af=0, type=0, proto=0, flags=0):
+    if host == network.ROUTER and port == 53:
+        return [(_socket.AF_INET, _socket.SOCK_DGRAM, 0, '', _DNS)]
+    target = _target(host, port)
+    if target is not None:
+        stats['redirects'] += 1
+        host, port = target
+    return _socket.getaddrinfo(host, port, af, type, proto, flags)
+
+
+def _answer(query):
+    """A DNS reply with one A record for query's name"""
+    pos, labels = 12, []
+    while query[pos]:
+        labels.append(bytes(query[pos + 1:pos + 1 + query[pos]]).decode())
+        pos += query[pos] + 1
+    host = '.'.join(labels)
+    target = hosts.get(host)
+    ip = target[0] if target else _socket.getaddrinfo(host, 80)[0][-1]
+    if not isinstance(ip, str):
+        ip = ip[0] if isinstance(ip, tuple) else _socket.inet_ntop(_socket.AF_INET, ip[4:8])
+    question = query[12:pos + 5]
+    return (query[:2] + struct.pack('>HHHHH', 0x8180, 1, 1, 0, 0) + question +
+            struct.pack('>HHHIH', 0xC00C, 1, 1, TTL, 4) + bytes(int(n) for n in ip.split('.')))
+
+
+class _Datagram:
+    """A UDP socket that answers DNS queries to the router itself"""
+
+    def __init__(self, real):
+        self._real = real
+        self._reply = None
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+    def sendto(self, data, addr):
+        if addr != _DNS:
+            return self._real.sendto(data, addr)
+        stats['dns_queries'] += 1
+        self._reply = _answer(data)
+        return len(data)
+
+    def recv(self, size):
+        if self._reply is None:
+            return self._real.recv(size)
+        reply, self._reply = self._reply, None
+        return reply[:size]
+
+    def recvfrom(self, size):
+        if self._reply is None:
+            return self._real.recvfrom(size)
+        return self.recv(size), _DNS
+
+    def close(self):
+        self._real.close()
+
+
+def socket(af=_socket.AF_INET, type=_socket.SOCK_STREAM, proto=0):
+    real = _socket.socket(af, type, proto)
+    return _Datagram(real) if type == _socket.SOCK_DGRAM else real
@@ -0,0 +1,53 @@
+"""ssl for the simulator: no TLS to hosts redirected by sim.socket
+
+A local tools/project_server.py speaks plain http unless it was given a
+certificate, so connections to a redirected host are handed back
+unwrapped. Everything else gets the real TLS.
+"""
+from sim import socket as _sim_socket
+
+try:
+    import ssl as _ssl
+except ImportError:
+    _ssl = None
+
+PROTOCOL_TLS_CLIENT = 0
+PROTOCOL_TLS_SERVER = 1
+CERT_NONE = 0
+CERT_OPTIONAL = 1
+CERT_REQUIRED = 2
+
+# Set to False if the redirected server speaks https
+PLAIN = True
+
+
+def _plain(server_hostname):
+    return PLAIN and server_hostname in _sim_socket.hosts
+
+
+class SSLContext:
+    def __init__(self, protocol=PROTOCOL_TLS_CLIENT):
+        self.verify_mode = CERT_NONE
+        self._protocol = protocol
+        self._real = None
+
+    def _context(self):
+        if self._real is None:
+            if hasattr(_ssl, 'create_default_context'):
+                self._real = _ssl.create_default_context()  # CPython
+                self._real.check_hostname = False
+            else:
+                self._real = _ssl.SSLContext(_ssl.PROTOCOL_TLS_CLIENT)
+            self._real.verify_mode = _ssl.CERT_NONE
+        return self._real
+
+    def wrap_socket(self, sock, server_side=False, server_hostname=None, **kwargs):
+        if _plain(server_hostname):
+            return sock
+        return self._context().wrap_socket(sock, server_side=server_side, server_hostname=server_hostname, **kwargs)
+
+
+def wrap_socket(sock, server_side=False, server_hostname=None, **kwargs):
+    if _plain(server_hostname):
+        return sock
+    return SSLContext().wrap_socket(sock, server_side=server_side, server_hostname=server_hostname, **kwargs)
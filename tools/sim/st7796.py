@@ -0,0 +1,172 @@
+"""st7796 for the simulator: an LVGL display that flushes into memory
+
+Every flush is copied into framebuffer, an RGB565 image of the screen as
+the app sees it (480x320 after set_rotation(_90)), in LVGL's own byte
+order, and goes through the display bus (tools/lcd_bus_sim.py) so its
+transfer is counted and timed on the bus model.
+
+Each refresh that flushed something is appended to frames as
+
+    (clock ms, render µs, bus µs, flushes, bytes)
+
+render µs is the time LVGL really spent drawing on this machine, bus µs
+the time the board would have been held up by the bus after that
+(SPIRAM copies, waiting for a buffer, the last transfer).
+"""
+import binascii
+
+import lvgl as lv
+
+import lcd_bus_sim
+from sim import time as clock
+
+STATE_HIGH = 1
+STATE_LOW = 0
+STATE_PWM = -1
+
+BYTE_ORDER_RGB = 0x00
+BYTE_ORDER_BGR = 0x08
+
+# Filled in by every ST7796, see above
+frames = []
+
+# The last ST7796 made
+display = None
+
+
+class ST7796:
+    def __init__(self, data_bus, display_width, display_height, frame_buffer1=None, frame_buffer2=None,
+                 color_space=lv.COLOR_FORMAT.RGB565, **kwargs):
+        global display
+        if not lv.is_initialized():
+            lv.init()
+        self._data_bus = data_bus
+        self.width = display_width
+        self.height = display_height
+        if frame_buffer1 is None:
+            # like the real driver: two buffers of a tenth of the screen, internal DMA memory
+            size = display_width * display_height * 2 // 10
+            caps = lcd_bus_sim.MEMORY_INTERNAL | lcd_bus_sim.MEMORY_DMA
+            frame_buffer1 = data_bus.allocate_framebuffer(size, caps)
+            frame_buffer2 = data_bus.allocate_framebuffer(size, caps)
+        self._double = frame_buffer2 is not None
+        # a full-screen buffer may be in DIRECT mode, where px_map is the whole buffer
+        self._full_size = len(frame_buffer1) >= display_width * display_height * 2
+        self._disp_drv = lv.display_create(display_width, display_height)
+        self._disp_drv.set_color_format(color_space)
+        self._disp_drv.set_buffers(frame_buffer1, frame_buffer2, len(frame_buffer1),
+                                   lv.DISPLAY_RENDER_MODE.PARTIAL)
+        self._disp_drv.set_flush_cb(self._flush_cb)
+        self._disp_drv.add_event_cb(self._refr_start, lv.EVENT.REFR_START, None)
+        self._disp_drv.add_event_cb(self._refr_ready, lv.EVENT.REFR_READY, None)
+        self._rotation = lv.DISPLAY_ROTATION._0
+        self._backlight = 0
+        self._inverted = False
+        self._mark = clock.real_us()
+        self._render_us = 0
+        self._start = None
+        self._resize()
+        display = self
+
+    def _resize(self):
+        self.screen_width = self._disp_drv.get_horizontal_resolution()
+        self.screen_height = self._disp_drv.get_vertical_resolution()
+        self.framebuffer = bytearray(self.screen_width * self.screen_height * 2)
+
+    def init(self, type=None):
+        self._data_bus.init(self.width, self.height, 16, 0, True)
+
+    def set_rotation(self, value):
+        self._rotation = value
+        self._disp_drv.set_rotation(value)
+        self._resize()
+
+    def get_rotation(self):
+        return self._rotation
+
+    def set_backlight(self, value):
+        self._backlight = value
+
+    def get_backlight(self):
+        return self._backlight
+
+    def set_color_inversion(self, value):
+        self._inverted = value
+
+    def set_power(self, value):
+        pass
+
+    def _render(self):
+        # real time since the last mark was LVGL drawing
+        now = clock.real_us()
+        us = clock.real_diff(now, self._mark)
+        self._render_us += us
+        self._data_bus.advance(us)
+        self._mark = now
+
+    def _refr_start(self, event):
+        bus = self._data_bus
+        self._mark = clock.real_us()
+        self._render_us = 0
+        self._start = (bus.now, bus.flushes, bus.bytes)
+
+    def _refr_ready(self, event):
+        if self._start is None:
+            return
+        self._render()
+        bus = self._data_bus
+        bus.wait()  # the frame is on the panel once its last transfer is done
+        now, flushes, sent = self._start
+        self._start = None
+        if bus.flushes > flushes:
+            frames.append((clock.now(), self._render_us, bus.now - now - self._render_us,
+                           bus.flushes - flushes, bus.bytes - sent))
+
+    def _flush_cb(self, disp, area, px_map):
+        if self._start is not None:
+            self._render()
+        x1, y1 = area.x1, area.y1
+        w = area.x2 - x1 + 1
+        h = area.y2 - y1 + 1
+        stride = self.screen_width * 2
+        if self._full_size and w * h != self.screen_width * self.screen_height:
+            # DIRECT: the area sits in a screen-sized buffer at its own place
+            src = px_map.__dereference__(stride * self.screen_height)
+            data = bytearray(w * h * 2)
+            for row in range(h):
+                start = (y1 + row) * stride + x1 * 2
+                data[row * w * 2:(row + 1) * w * 2] = src[start:start + w * 2]
+        else:
+            data = px_map.__dereference__(w * h * 2)
+        if self._double:
+            self._data_bus.wait()  # LVGL waits for the other buffer's flush before this one
+        self._data_bus.tx_color(0x2C, data, x1, y1, area.x2, area.y2, self._rotation, disp.flush_is_last())
+        if not self._double:
+            self._data_bus.wait()  # nothing to render into until this buffer is sent
+        fb = self.framebuffer
+        for row in range(h):
+            start = (y1 + row) * stride + x1 * 2
+            fb[start:start + w * 2] = data[row * w * 2:(row + 1) * w * 2]
+        disp.flush_ready()
+        self._mark = clock.real_us()  # copying into framebuffer is not the board's time
+
+    def crc(self):
+        """CRC32 of framebuffer, to compare a run's last screen with a known good one"""
+        return binascii.crc32(self.framebuffer) & 0xFFFFFFFF
+
+    def screenshot(self, path):
+        """Write framebuffer as a binary PPM"""
+        w, h = self.screen_width, self.screen_height
+        fb = self.framebuffer
+        with open(path, 'wb') as f:
+            f.write(('P6\n%d %d\n255\n' % (w, h)).encode())
+            row = bytearray(w * 3)
+            for y in range(h):
+                pos = y * w * 2
+                for x in range(w):
+                    v = fb[pos] | fb[pos + 1] << 8
+                    pos += 2
+                    row[x * 3] = (v >> 11) * 255 // 31
+                    row[x * 3 + 1] = (v >> 5 & 0x3F) * 255 // 63
+                    row[x * 3 + 2] = (v & 0x1F) * 255 // 31
+                f.write(row)
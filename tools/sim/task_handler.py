@@ -0,0 +1,64 @@
+"""task_handler for the simulator: lv.task_handler() every duration ms of the clock"""
+import lvgl as lv
+
+from sim import time as clock
+
+TASK_HANDLER_STARTED = 0x01
+TASK_HANDLER_FINISHED = 0x02
+
+
+class TaskHandler:
+    _current_instance = None
+
+    def __init__(self, duration=33, timer_id=0, max_scheduled=2, exception_sink=None):
+        if TaskHandler._current_instance is not None:
+            raise RuntimeError('Only one TaskHandler can be running')
+        if not lv.is_initialized():
+            lv.init()
+        TaskHandler._current_instance = self
+        self.duration = duration
+        self.exception_sink = exception_sink
+        self._callbacks = []
+        self._running = True
+        self._last = clock.now()
+        self._timer = clock.every(duration, self._task_handler)
+
+    def add_event_cb(self, callback, event, user_data=None):
+        self._callbacks.append((callback, event, user_data))
+
+    def remove_event_cb(self, callback):
+        self._callbacks = [c for c in self._callbacks if c[0] != callback]
+
+    def _send(self, event):
+        stop = False
+        for callback, mask, user_data in self._callbacks:
+            if mask & event:
+                stop = callback(event, user_data) is False or stop
+        return stop
+
+    def _task_handler(self):
+        now = clock.now()
+        lv.tick_inc(now - self._last)
+        self._last = now
+        if not self._running or self._send(TASK_HANDLER_STARTED):
+            return
+        try:
+            lv.task_handler()
+        except Exception as e:
+            if self.exception_sink is None:
+                raise
+            self.exception_sink(e)
+        self._send(TASK_HANDLER_FINISHED)
+
+    def disable(self):
+        self._running = False
+
+    def enable(self):
+        self._running = True
+
+    def is_running(self):
+        return self._running
+
+    def deinit(self):
+        clock.cancel(self._timer)
+        TaskHandler._current_instance = None
@@ -0,0 +1,151 @@
+"""time for the simulator: sleep() fast-forwards instead of waiting
+
+The clock is the real time since start plus every sleep the main thread
+skipped, so an app's loop runs as fast as the workstation can render
+while ticks_ms() moves as it would on the board. asyncio keeps waiting in
+real time (it polls instead of sleeping), which the clock includes.
+sleep() on any other thread really sleeps.
+
+Periodic callbacks (machine.Timer, task_handler.TaskHandler) fire at their
+due times inside sleep(), as the board's timer interrupts would between
+two lines of the app.
+
+Once the clock passes deadline, sleep() and ticks_ms() raise Stop, which
+ends the run.
+"""
+import time as _time
+
+try:
+    import _thread
+    _main = _thread.get_ident()
+except ImportError:
+    _thread = None
+
+try:
+    real_us = _time.ticks_us
+    real_diff = _time.ticks_diff
+except AttributeError:
+    def real_us():
+        return int(_time.perf_counter() * 1000000)
+
+    def real_diff(a, b):
+        return a - b
+
+MAX = 1 << 30  # ticks wrap like the board's
+
+
+class Stop(BaseException):
+    """The run reached its deadline"""
+
+
+deadline = None   # ms on the clock, None runs for ever
+_last = real_us()
+_real_elapsed = 0  # µs, summed so the board's 2**30 µs wrap does not matter
+_skipped = 0      # ms of sleep fast-forwarded
+_timers = []      # [due_ms, period_ms, fn], period 0 fires once
+_firing = False
+
+# Filled in as the clock runs
+stats = {'sleeps': 0, 'skipped_ms': 0, 'timer_calls': 0}
+
+
+def now():
+    """The clock in ms, unwrapped and never raising"""
+    global _last, _real_elapsed
+    t = real_us()
+    _real_elapsed += real_diff(t, _last)
+    _last = t
+    return _real_elapsed // 1000 + _skipped
+
+
+def _check(ms):
+    if deadline is not None and ms >= deadline:
+        raise Stop()
+
+
+def every(period_ms, fn, once=False):
+    """Call fn() every period_ms (once after it if once). Returns a handle for cancel()."""
+    timer = [now() + period_ms, 0 if once else period_ms, fn]
+    _timers.append(timer)
+    return timer
+
+
+def cancel(timer):
+    if timer in _timers:
+        _timers.remove(timer)
+
+
+def _fire(until):
+    """Run the callbacks due up to until, moving the clock to each one"""
+    global _skipped, _firing
+    _firing = True
+    try:
+        while _timers:
+            timer = min(_timers, key=lambda t: t[0])
+            if timer[0] > until:
+                break
+            if timer[0] > now():
+                _skipped += timer[0] - now()
+            if timer[1]:
+                timer[0] += timer[1]
+            else:
+                _timers.remove(timer)
+            stats['timer_calls'] += 1
+            timer[2]()
+    finally:
+        _firing = False
+
+
+def sleep_ms(ms):
+    global _skipped
+    if _thread is not None and _thread.get_ident() != _main:
+        _time.sleep(ms / 1000)
+        return
+    stats['sleeps'] += 1
+    until = now() + max(int(ms), 0)
+    if not _firing:
+        _fire(until)
+    gap = until - now()
+    if gap > 0:
+        _skipped += gap
+        stats['skipped_ms'] += gap
+    _check(now())
+
+
+def sleep(seconds):
+    sleep_ms(seconds * 1000)
+
+
+def sleep_us(us):
+    sleep_ms(us / 1000)
+
+
+def ticks_ms():
+    ms = now()
+    _check(ms)
+    return ms % MAX
+
+
+def ticks_us():
+    return (now() * 1000) % MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % MAX
+
+
+def ticks_diff(a, b):
+    return ((a - b + MAX // 2) % MAX) - MAX // 2
+
+
+def time():
+    return _time.time() + _skipped // 1000
+
+
+def __getattr__(name):
+    # localtime(), gmtime(), mktime() and the rest from the real module
+    return getattr(_time, name)
@@ -0,0 +1,239 @@
+"""Run an app or the firmware headless, with scripted touch and a fake WLAN
+
+The board's modules are replaced by the stand-ins in tools/sim (see
+sim/__init__.py), then the script runs as __main__ with its own
+directory and semiblockFirmware on sys.path. Needs the lvgl_micropython
+Unix build (or LVGL bindings with the same API):
+
+    micropython simulator.py ../snake/snake.py --ms 10000 --tap 340,60@1500 --screenshot snake.ppm
+    micropython simulator.py ../calculator/calculator.py --tap 60,200@500 --expect CRC
+
+The firmware gets a WLAN that associates and, with --host, the backend
+from tools/project_server.py (started from CPython) in plain http:
+
+    python3 project_server.py /tmp/projects --port 8080 &
+    micropython simulator.py ../semiblockFirmware/semiblockFirmwareV2.py --root /tmp/flash \\
+        --wifi "Quantr 2.4G:quantrwifi" --host build.semiblock.ai=127.0.0.1:8080 --ms 60000
+
+Options:
+
+    --ms N                stop after N ms on the simulator clock (default RUN_MS)
+    --tap X,Y@MS          tap the screen at X,Y at MS ms; repeatable
+    --touch FILE          JSON touch script: [ms, x, y] presses or moves, [ms] releases
+    --wifi SSID[:PASS]    a network in range; repeatable. Without it any SSID connects
+    --host NAME=IP:PORT   connections to NAME go to IP:PORT; repeatable
+    --root DIR            working directory, the board's flash (default: the script's)
+    --seed N              random.seed() (default 0)
+    --spi-limit HZ        the display bus garbles data above this clock (lcd_bus_sim.WRITE_LIMIT_HZ)
+    --screenshot FILE     the last screen as a PPM image
+    --frames FILE         one CSV line per frame: ms, render_us, bus_us, flushes, bytes
+    --expect CRC          exit 1 unless the last screen has this CRC32 (hex)
+    -h, --help            this text
+
+Options are read by hand, since MicroPython has no argparse.
+
+Sleeps are skipped, so a run takes as long as rendering it does. The run
+ends at --ms, on machine.reset() or when the script returns, and prints
+
+    SIM {"result": "stop", "ms": 10000, "frames": ..., "fps": ..., "render_ms": {...}, ...}
+
+render_ms is the time LVGL took on this machine per frame, bus_ms the
+time the board's bus would add (tools/lcd_bus_sim.py), crc the last
+screen's: pass it to --expect once a run's screenshot looks right. A
+script that raises exits 2.
+"""
+import json
+import os
+import random
+import sys
+
+RUN_MS = 5000
+
+
+def _absolute(path):
+    return path if path.startswith('/') else os.getcwd() + '/' + path
+
+
+def _dirname(path):
+    return path.rsplit('/', 1)[0] if '/' in path else '.'
+
+
+HERE = _dirname(_absolute(sys.argv[0] if sys.argv and sys.argv[0] else 'simulator.py'))
+sys.path.insert(0, HERE)
+
+import sim  # noqa: E402
+
+
+USAGE = 'usage: simulator.py SCRIPT [--ms N] [--tap X,Y@MS] [--touch FILE] [--wifi SSID[:PASS]] ' \
+        '[--host NAME=IP:PORT] [--root DIR] [--seed N] [--spi-limit HZ] [--screenshot FILE] ' \
+        '[--frames FILE] [--expect CRC]'
+
+
+def usage(error):
+    """Print the usage line and error, and exit 2 like argparse"""
+    print(USAGE, file=sys.stderr)
+    print('simulator.py: error: ' + error, file=sys.stderr)
+    sys.exit(2)
+
+
+OPTIONS = ('--ms', '--seed', '--spi-limit', '--tap', '--wifi', '--host', '--touch', '--root', '--screenshot',
+           '--frames', '--expect')
+
+
+def parse(args):
+    opts = {'script': None, 'ms': RUN_MS, 'taps': [], 'touch': None, 'wifi': [], 'hosts': [], 'root': None,
+            'seed': 0, 'spi-limit': None, 'screenshot': None, 'frames': None, 'expect': None}
+    while args:
+        arg = args.pop(0)
+        if arg in ('-h', '--help'):
+            print(__doc__)
+            sys.exit(0)
+        if arg.startswith('-') and arg not in OPTIONS:
+            usage('unknown option %s' % arg)
+        if arg.startswith('-') and not args:
+            usage('%s needs a value' % arg)
+        try:
+            if arg in ('--ms', '--seed', '--spi-limit'):
+                opts[arg[2:]] = int(args.pop(0))
+            elif arg == '--tap':
+                point, ms = args.pop(0).split('@')
+                x, y = point.split(',')
+                opts['taps'].append((int(x), int(y), int(ms)))
+            elif arg == '--wifi':
+                opts['wifi'].append(args.pop(0))
+            elif arg == '--host':
+                opts['hosts'].append(args.pop(0))
+            elif arg in ('--touch', '--root', '--screenshot', '--frames', '--expect'):
+                opts[arg[2:]] = args.pop(0)
+            else:
+                opts['script'] = arg
+        except ValueError:
+            usage('bad value for %s' % arg)
+    if opts['script'] is None:
+        usage('no SCRIPT to run')
+    return opts
+
+
+def configure(opts):
+    import lcd_bus_sim
+    from sim import ft6x36, network, socket
+    if opts['spi-limit']:
+        lcd_bus_sim.WRITE_LIMIT_HZ = opts['spi-limit']
+    for x, y, ms in opts['taps']:
+        ft6x36.tap(x, y, ms)
+    if opts['touch']:
+        with open(opts['touch']) as f:
+            for event in json.load(f):
+                if len(event) == 1:
+                    ft6x36.release(event[0])
+                else:
+                    ft6x36.press(event[0], event[1], event[2])
+    for entry in opts['wifi']:
+        ssid, _, password = entry.partition(':')
+        network.networks.append({'ssid': ssid, 'password': password or None})
+    for entry in opts['hosts']:
+        name, _, target = entry.partition('=')
+        ip, _, port = target.partition(':')
+        socket.hosts[name] = (ip, int(port or 80))
+
+
+def _print_exception(e):
+    try:
+        sys.print_exception(e)
+    except AttributeError:
+        import traceback
+        traceback.print_exception(type(e), e, e.__traceback__)
+
+
+def run(path, ms):
+    """Run path as __main__ until it returns or the clock passes ms. Returns how it ended."""
+    from sim import machine
+    from sim import time as clock
+    with open(path) as f:
+        code = compile(f.read(), path, 'exec')
+    clock.deadline = clock.now() + ms
+    try:
+        exec(code, {'__name__': '__main__', '__file__': path})
+        return 'returned'
+    except clock.Stop:
+        return 'stop'
+    except machine.Reset:
+        return 'reset'
+    except SystemExit:
+        return 'exit'
+    except Exception as e:
+        _print_exception(e)
+        return 'error'
+    finally:
+        clock.deadline = None
+
+
+def _spread(values):
+    values = sorted(values)
+    if not values:
+        return {'p50': 0, 'p99': 0, 'max': 0}
+
+    def pick(p):
+        return values[min(len(values) - 1, len(values) * p // 100)] / 1000
+    return {'p50': pick(50), 'p99': pick(99), 'max': values[-1] / 1000}
+
+
+def summary(result, start_ms):
+    from sim import ft6x36, network, socket, st7796
+    from sim import time as clock
+    frames = st7796.frames
+    ms = max(clock.now() - start_ms, 1)
+    n = len(frames)
+    display = st7796.display
+    return {
+        'result': result,
+        'ms': ms,
+        'frames': n,
+        'fps': round(n * 1000 / ms, 1),
+        'render_ms': _spread([f[1] for f in frames]),
+        'bus_ms': _spread([f[2] for f in frames]),
+        'flushes': round(sum(f[3] for f in frames) / max(n, 1), 1),
+        'bytes': sum(f[4] for f in frames) // max(n, 1),
+        'touches': ft6x36.stats['presses'],
+        'clock': clock.stats,
+        'wlan': network.stats,
+        'net': socket.stats,
+        'crc': '%08x' % display.crc() if display else None,
+    }
+
+
+def main():
+    opts = parse(sys.argv[1:])
+    path = _absolute(opts['script'])
+    for key in ('screenshot', 'frames'):
+        if opts[key]:
+            opts[key] = _absolute(opts[key])
+    sim.install()
+    from sim import st7796
+    from sim import time as clock
+    configure(opts)
+    sys.path.insert(0, HERE + '/../semiblockFirmware')
+    sys.path.insert(0, _dirname(path))
+    os.chdir(opts['root'] or _dirname(path))
+    random.seed(opts['seed'])
+    start = clock.now()
+    result = run(path, opts['ms'])
+    out = summary(result, start)
+    print('SIM ' + json.dumps(out))
+    display = st7796.display
+    if opts['screenshot'] and display:
+        display.screenshot(opts['screenshot'])
+    if opts['frames']:
+        with open(opts['frames'], 'w') as f:
+            f.write('ms,render_us,bus_us,flushes,bytes\n')
+            for frame in st7796.frames:
+                f.write('%d,%d,%d,%d,%d\n' % frame)
+    if result == 'error':
+        sys.exit(2)
+    if opts['expect'] and out['crc'] != opts['expect'].lower():
+        print('Last screen CRC %s, expected %s' % (out['crc'], opts['expect']))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()